@@ -0,0 +1,184 @@
+"""Server-side admin sessions.
+
+Logging in stores a session row keyed by the SHA-256 of a random token; the
+browser only holds the token, in the `ADMIN_COOKIE` cookie. Each worker keeps
+an LRU of the sessions it has seen in front of the backend, so checking a
+session is a dict lookup. An entry is re-read after
+`ADMIN_SESSION_CACHE_SECONDS`, which bounds how long a revocation made in
+another worker takes to apply; the worker that revokes drops its entries at
+once.
+
+Sessions slide: each use moves the expiry to `ADMIN_SESSION_IDLE_SECONDS`
+from now, but never past `ADMIN_SESSION_MAX_SECONDS` after login. The new
+expiry is written back at most once per `ADMIN_SESSION_TOUCH_SECONDS`.
+
+The default backend is the `admin_session` table; anything with the same
+methods (e.g. a Redis client wrapper) can be swapped in with `configure`.
+"""
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from flask import g, request
+from sqlalchemy import select
+
+ADMIN_COOKIE = "fabclean_admin"
+ADMIN_COOKIE_SECURE = os.environ.get("ADMIN_COOKIE_SECURE", "0") == "1"
+ADMIN_SESSION_IDLE_SECONDS = int(os.environ.get("ADMIN_SESSION_IDLE_SECONDS", str(8 * 3600)))
+ADMIN_SESSION_MAX_SECONDS = int(os.environ.get("ADMIN_SESSION_MAX_SECONDS", str(7 * 24 * 3600)))
+ADMIN_SESSION_TOUCH_SECONDS = int(os.environ.get("ADMIN_SESSION_TOUCH_SECONDS", "60"))
+ADMIN_SESSION_CACHE_SECONDS = float(os.environ.get("ADMIN_SESSION_CACHE_SECONDS", "5"))
+ADMIN_SESSION_CACHE_ENTRIES = int(os.environ.get("ADMIN_SESSION_CACHE_ENTRIES", "1024"))
+
+Session = namedtuple("Session", "id admin_id username franchise_id created_at expires_at")
+
+
+def session_key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# ---------------- BACKENDS ---------------- #
+class TableBackend:
+    """Sessions in a database table, on their own connections (never the request's transaction)."""
+
+    def __init__(self, engine, table):
+        self._engine = engine  # callable, so the app's engine is looked up per call
+        self.table = table
+
+    def get(self, key):
+        t = self.table
+        with self._engine().connect() as conn:
+            row = conn.execute(
+                select(t.c.id, t.c.admin_id, t.c.username, t.c.franchise_id, t.c.created_at, t.c.expires_at)
+                .where(t.c.id == key)
+            ).first()
+        return Session(*row) if row else None
+
+    def add(self, session):
+        with self._engine().begin() as conn:
+            # expired rows go whenever someone logs in
+            conn.execute(self.table.delete().where(self.table.c.expires_at < datetime.utcnow()))
+            conn.execute(self.table.insert().values(session._asdict()))
+
+    def touch(self, key, expires_at):
+        with self._engine().begin() as conn:
+            conn.execute(self.table.update().where(self.table.c.id == key).values(expires_at=expires_at))
+
+    def revoke(self, key=None, admin_id=None):
+        """Delete one session, every session of an admin, or (with neither) every session."""
+        stmt = self.table.delete()
+        if key is not None:
+            stmt = stmt.where(self.table.c.id == key)
+        if admin_id is not None:
+            stmt = stmt.where(self.table.c.admin_id == admin_id)
+        with self._engine().begin() as conn:
+            return conn.execute(stmt).rowcount
+
+
+# ---------------- STORE ---------------- #
+class Store:
+    """Per-worker LRU of sessions in front of a backend."""
+
+    def __init__(self, backend, max_entries=ADMIN_SESSION_CACHE_ENTRIES, cache_seconds=ADMIN_SESSION_CACHE_SECONDS):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.cache_seconds = cache_seconds
+        self._entries = OrderedDict()  # key -> (re-read after, Session or None)
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def _remember(self, key, session):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.cache_seconds, session)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def create(self, admin):
+        """Start a session for an admin account; returns the cookie token."""
+        token = secrets.token_urlsafe(32)
+        now = datetime.utcnow()
+        session = Session(
+            session_key(token), admin.id, admin.username, admin.franchise_id,
+            now, now + timedelta(seconds=ADMIN_SESSION_IDLE_SECONDS),
+        )
+        self.backend.add(session)
+        self._remember(session.id, session)
+        return token
+
+    def get(self, token):
+        """The live session for a cookie token, with its expiry slid forward; None if absent or expired."""
+        key = session_key(token)
+        found, session = self._cached(key)
+        if not found:
+            session = self.backend.get(key)
+            self._remember(key, session)
+        now = datetime.utcnow()
+        if session is None or session.expires_at <= now:
+            return None
+        expires_at = min(
+            now + timedelta(seconds=ADMIN_SESSION_IDLE_SECONDS),
+            session.created_at + timedelta(seconds=ADMIN_SESSION_MAX_SECONDS),
+        )
+        if expires_at - session.expires_at >= timedelta(seconds=ADMIN_SESSION_TOUCH_SECONDS):
+            self.backend.touch(key, expires_at)
+            session = session._replace(expires_at=expires_at)
+            self._remember(key, session)
+        return session
+
+    def revoke(self, token=None, admin_id=None):
+        """Log out one session (by token), every session of an admin, or everyone; returns the count."""
+        key = session_key(token) if token is not None else None
+        count = self.backend.revoke(key=key, admin_id=admin_id)
+        with self._lock:
+            for cached_key, (_, session) in list(self._entries.items()):
+                if (key is None or cached_key == key) and (
+                    admin_id is None or (session is not None and session.admin_id == admin_id)
+                ):
+                    del self._entries[cached_key]
+        return count
+
+
+store = None
+
+
+def configure(backend, **options):
+    """Install the backend sessions are kept in; called once when the models load."""
+    global store
+    store = Store(backend, **options)
+
+
+# ---------------- REQUESTS ---------------- #
+def current():
+    """The admin session of this request (looked up once per request), or None."""
+    if "admin_session" not in g:
+        token = request.cookies.get(ADMIN_COOKIE)
+        g.admin_session = store.get(token) if token else None
+    return g.admin_session
+
+
+def log_in(response, admin):
+    response.set_cookie(
+        ADMIN_COOKIE, store.create(admin), max_age=ADMIN_SESSION_MAX_SECONDS,
+        httponly=True, secure=ADMIN_COOKIE_SECURE, samesite="Lax",
+    )
+    return response
+
+
+def log_out(response):
+    token = request.cookies.get(ADMIN_COOKIE)
+    if token:
+        store.revoke(token=token)
+    response.delete_cookie(ADMIN_COOKIE)
+    return response
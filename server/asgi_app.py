@@ -0,0 +1,350 @@
+"""ASGI deployment: coroutines for the I/O-bound endpoints, the Flask app for the rest.
+
+`asgi.py` serves the app under an ASGI server (`uvicorn asgi:app`). Scan
+uploads, order lookups by email, barcode images, the deliveries feed and the
+live event stream and long poll run as coroutines on the worker's event loop. Their SQL goes through an async
+engine on the same database (aiosqlite / asyncpg), and waiting on a barcode
+render runs on a thread, so a slow client or a pending render holds a
+coroutine instead of a thread; an idle live-event subscriber is a coroutine
+waiting on `Subscription.wait_async`. These handlers run the same code as the
+Flask views: each pushes a Flask request context and calls the view's helper
+through `AsyncSession.run_sync`, which runs ordinary SQLAlchemy code against
+the async connection.
+
+Every other route is handed to the Flask app on a pool of `ASGI_SYNC_THREADS`
+threads, like a gthread worker; password hashing keeps its own pool (see
+passwords.py). So are requests for a franchise with its own database, since
+only the main database has an async engine.
+
+Needs an async driver (`aiosqlite`, or `asyncpg` for PostgreSQL) and an ASGI
+server; requirements.txt pins both, and the WSGI deployment uses neither.
+"""
+import asyncio
+import contextvars
+import io
+import os
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import jsonify, request
+from flask.signals import request_started
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from werkzeug.exceptions import HTTPException
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from app import create_app
+from extensions import db
+from models import Order, install_session_hooks
+from routes import deliveries, live, orders, worker
+from routes.common import barcode_queue
+import db_engine
+import events
+import metrics
+import response_cache
+import scans
+import tenancy
+
+ASGI_SYNC_THREADS = int(os.environ.get("ASGI_SYNC_THREADS", "64"))
+
+# async driver per database, keyed by the URL scheme without its driver
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_uri(uri):
+    scheme, rest = uri.split("://", 1)
+    driver = ASYNC_DRIVERS.get(scheme.split("+")[0])
+    if driver is None:
+        raise RuntimeError(f"No async driver for {scheme} databases")
+    return f"{driver}://{rest}"
+
+
+class BridgeSession(Session):
+    """The sync session behind each AsyncSession, with the same hooks as `db.session`."""
+
+install_session_hooks(BridgeSession)
+
+
+async def run_retrying(session, fn, attempts=db_engine.DB_RETRY_ATTEMPTS, base_delay=db_engine.DB_RETRY_BASE_DELAY):
+    """`session.run_sync(fn)`, re-run on lock and serialization errors like `db_retry`."""
+    for attempt in range(attempts):
+        try:
+            return await session.run_sync(fn)
+        except DBAPIError as exc:
+            if attempt == attempts - 1 or not db_engine.is_transient(exc):
+                raise
+            await session.rollback()
+            await asyncio.sleep(base_delay * (2 ** attempt) * (1 + random.random()))
+
+
+# ---------------- ASYNC VIEWS ---------------- #
+async def worker_scan(asgi, session):
+    data = request.json
+    body, status = await run_retrying(session, lambda s: worker.record_scan(s, data))
+    return jsonify(body), status
+
+
+async def worker_scan_batch(asgi, session):
+    try:
+        raw_scans = scans.read_payload(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(await run_retrying(session, lambda s: worker.record_scans(s, raw_scans))), 200
+
+
+async def serve_qr_code(asgi, session, filename):
+    target = worker.qr_target(filename)
+    if target is None:
+        return jsonify({"error": "Not found"}), 404
+    order_id, fmt = target
+    cached = await asgi.in_thread(barcode_queue.cache.has, order_id, fmt)
+    if not cached and await session.get(Order, order_id) is None:
+        return jsonify({"error": "Not found"}), 404
+    # waits for the render pool on a miss
+    etag, data = await asgi.in_thread(barcode_queue.fetch, order_id, fmt)
+    return worker.qr_response(etag, data, fmt)
+
+
+async def get_orders_by_email(asgi, session):
+    email = request.args.get("email")
+    if not email:
+        return jsonify({"error": "Email query param is required"}), 400
+    try:
+        return await session.run_sync(lambda s: orders.customer_orders(s, email))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+async def get_deliveries(asgi, session):
+    return await session.run_sync(
+        lambda s: response_cache.respond(s, "deliveries", lambda: deliveries.list_deliveries(s))
+    )
+
+
+async def stream_events(asgi, session):
+    try:
+        filters, since = live.stream_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filters = await asgi.in_thread(live.viewer_filters, filters)
+    if filters is None:
+        return jsonify({"error": "Unauthorized"}), 401
+    subscription, backlog = await session.run_sync(
+        lambda s: live.subscribe_events(s, filters, since, threaded=False)
+    )
+    # streamed by send_stream once the view returns
+    return live.stream_response(events.sse_stream_async(live.event_hub(), subscription, backlog))
+
+
+async def poll_events(asgi, session):
+    try:
+        filters, since, timeout = live.poll_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filters = await asgi.in_thread(live.viewer_filters, filters)
+    if filters is None:
+        return jsonify({"error": "Unauthorized"}), 401
+    subscription, found = await session.run_sync(
+        lambda s: live.subscribe_events(s, filters, since, threaded=False)
+    )
+    try:
+        if not found:
+            await session.close()  # do not hold a connection while waiting
+            found = await subscription.wait_async(timeout)
+    finally:
+        live.event_hub().unsubscribe(subscription)
+    return live.poll_response(subscription, found)
+
+
+# Flask endpoint -> coroutine serving it
+ASYNC_VIEWS = {
+    "worker.worker_scan": worker_scan,
+    "worker.worker_scan_batch": worker_scan_batch,
+    "worker.serve_qr_code": serve_qr_code,
+    "orders.get_orders_by_email": get_orders_by_email,
+    "deliveries.get_deliveries": get_deliveries,
+    "live.stream_events": stream_events,
+    "live.poll_events": poll_events,
+}
+
+
+# ---------------- ASGI APP ---------------- #
+class AsgiApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        uri = flask_app.config["SQLALCHEMY_DATABASE_URI"]
+        self.engine = create_async_engine(async_uri(uri), **db_engine.engine_options(uri))
+        db_engine.install(self.engine.sync_engine)
+        metrics.watch(self.engine.sync_engine)
+        self.sessions = async_sessionmaker(self.engine, sync_session_class=BridgeSession)
+        self.executor = ThreadPoolExecutor(max_workers=ASGI_SYNC_THREADS, thread_name_prefix="asgi-sync")
+
+    async def in_thread(self, fn, *args, context=None):
+        """Run a blocking call on the sync pool inside `context` (default: a copy of the caller's)."""
+        context = context or contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, fn, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise RuntimeError(f"Unsupported ASGI scope {scope['type']}")
+        body = await read_body(receive)
+        environ = build_environ(scope, body)
+        view, args = self.match(scope)
+        if view is not None:
+            with self.flask_app.request_context(environ):
+                response = await self.dispatch(view, args)
+                if response is not None:
+                    return await send_response(send, receive, response, environ)
+            environ = build_environ(scope, body)  # the request context consumed the body
+        await self.call_wsgi(environ, send)
+
+    def match(self, scope):
+        adapter = self.flask_app.url_map.bind("localhost", script_name=scope.get("root_path") or None)
+        try:
+            endpoint, args = adapter.match(scope["path"], scope["method"])
+        except HTTPException:  # 404, 405 and redirects are Flask's to answer
+            return None, None
+        return ASYNC_VIEWS.get(endpoint), args
+
+    async def dispatch(self, view, args):
+        """Flask's full_dispatch_request around a coroutine; None hands the request to Flask."""
+        app = self.flask_app
+        try:
+            request_started.send(app, _async_wrapper=app.ensure_sync)
+            try:
+                # before_request hooks may look up an admin session or the franchise registry
+                rv = await self.in_thread(app.preprocess_request)
+                if rv is None:
+                    if tenancy.current_franchise() in tenancy.sharded(db.engine):
+                        return None
+                    async with self.sessions() as session:
+                        rv = await view(self, session, **args)
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            return app.finalize_request(rv)
+        except Exception as e:
+            return app.handle_exception(e)
+
+    async def call_wsgi(self, environ, send):
+        """Run the Flask app on the thread pool, streaming its response."""
+        started = {}
+        # one context for the whole response, so streamed views keep their request context
+        context = contextvars.copy_context()
+
+        def start_response(status, headers, exc_info=None):
+            started["status"], started["headers"] = int(status.split(" ", 1)[0]), headers
+
+        chunks = await self.in_thread(self.flask_app, environ, start_response, context=context)
+        iterator = iter(chunks)
+        try:
+            chunk = await self.in_thread(next, iterator, None, context=context)
+            await send({
+                "type": "http.response.start",
+                "status": started["status"],
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in started["headers"]],
+            })
+            while chunk is not None:
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                chunk = await self.in_thread(next, iterator, None, context=context)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(chunks, "close"):
+                await self.in_thread(chunks.close, context=context)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def build_environ(scope, body):
+    """The WSGI environ for an ASGI http scope (PEP 3333)."""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = "HTTP_" + name
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def send_response(send, receive, response, environ):
+    headers = response.get_wsgi_headers(environ)
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+    })
+    if hasattr(response.response, "__aiter__"):
+        return await send_stream(send, receive, response.response)
+    await send({"type": "http.response.body", "body": b"".join(response.get_app_iter(environ))})
+
+
+async def send_stream(send, receive, chunks):
+    """Send an async generator's chunks as they come; the client going away closes the generator."""
+    async def pump():
+        try:
+            async for chunk in chunks:
+                body = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await chunks.aclose()
+
+    async def disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    pumping, watching = asyncio.ensure_future(pump()), asyncio.ensure_future(disconnect())
+    await asyncio.wait((pumping, watching), return_when=asyncio.FIRST_COMPLETED)
+    watching.cancel()
+    pumping.cancel()
+    try:
+        await pumping
+    except asyncio.CancelledError:
+        pass
+
+
+def create_asgi_app(flask_app=None):
+    return AsgiApp(flask_app or create_app())
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+BARCODE_MEMORY_BYTES = int(os.environ.get("BARCODE_MEMORY_BYTES", str(8 * 1024 * 1024)))
+BARCODE_DISK_BYTES = int(os.environ.get("BARCODE_DISK_BYTES", str(256 * 1024 * 1024)))
+BARCODE_MAX_AGE = int(os.environ.get("BARCODE_MAX_AGE_DAYS", "30")) * 24 * 3600
+BARCODE_EVICT_EVERY = int(os.environ.get("BARCODE_EVICT_EVERY", "500"))
+
+# bump when the rendering output changes so old entries stop matching
+RENDER_VERSION = "1"
+
+MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def cache_key(payload, fmt):
+    """Content address of a rendered barcode: same symbology, format and payload -> same bytes."""
+    raw = f"code128:{RENDER_VERSION}:{fmt}:{payload}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def write_atomic(path, data):
+    # write to a temp file first so readers never see a half-written image
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
+
+
+# ---------------- MEMORY TIER ---------------- #
+class MemoryLRU:
+    """Hot images kept in process memory, bounded by total byte size."""
+
+    def __init__(self, max_bytes=BARCODE_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __len__(self):
+        return len(self._items)
+
+
+# ---------------- DISK TIER ---------------- #
+class DiskStore:
+    """Sharded on-disk store (`<root>/ab/cd/<key>.<fmt>`) with size and age eviction."""
+
+    def __init__(self, root, max_bytes=BARCODE_DISK_BYTES, max_age=BARCODE_MAX_AGE,
+                 evict_every=BARCODE_EVICT_EVERY):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_every = evict_every
+        self._writes = 0
+        self._evicting = threading.Lock()
+
+    def path_for(self, key, fmt):
+        return os.path.join(self.root, key[:2], key[2:4], f"{key}.{fmt}")
+
+    def get(self, key, fmt):
+        path = self.path_for(key, fmt)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            return None
+        # mtime doubles as last-access time for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, fmt, data):
+        path = self.path_for(key, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, data)
+        self._writes += 1
+        if self.evict_every and self._writes % self.evict_every == 0:
+            threading.Thread(target=self.evict, daemon=True).start()
+
+    def _entries(self):
+        for shard in os.scandir(self.root):
+            # only two-character shard dirs belong to the store
+            if not (shard.is_dir() and len(shard.name) == 2):
+                continue
+            for sub in os.scandir(shard.path):
+                if not sub.is_dir():
+                    continue
+                for entry in os.scandir(sub.path):
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        st = entry.stat()
+                        yield entry.path, st.st_size, st.st_mtime
+
+    def evict(self):
+        """Drop entries older than max_age, then the least recently used until under max_bytes."""
+        if not self._evicting.acquire(blocking=False):
+            return 0
+        try:
+            if not os.path.isdir(self.root):
+                return 0
+            cutoff = time.time() - self.max_age
+            removed = 0
+            kept = []
+            total = 0
+            for path, size, mtime in self._entries():
+                if self.max_age and mtime < cutoff:
+                    removed += self._remove(path)
+                else:
+                    kept.append((mtime, size, path))
+                    total += size
+            if total > self.max_bytes:
+                kept.sort()
+                for _mtime, size, path in kept:
+                    if total <= self.max_bytes:
+                        break
+                    removed += self._remove(path)
+                    total -= size
+            return removed
+        finally:
+            self._evicting.release()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+
+# ---------------- TWO-TIER CACHE ---------------- #
+class BarcodeCache:
+    """Memory LRU in front of the sharded disk store, keyed by `cache_key`."""
+
+    def __init__(self, root, memory=None, disk=None):
+        self.memory = memory or MemoryLRU()
+        self.disk = disk or DiskStore(root)
+
+    def get(self, payload, fmt):
+        """Return `(etag, data)` or `(etag, None)` when nothing is cached yet."""
+        key = cache_key(payload, fmt)
+        data = self.memory.get(key)
+        if data is None:
+            data = self.disk.get(key, fmt)
+            if data is not None:
+                self.memory.put(key, data)
+        return key, data
+
+    def has(self, payload, fmt):
+        key = cache_key(payload, fmt)
+        return self.memory.get(key) is not None or os.path.exists(self.disk.path_for(key, fmt))
+
+    def put(self, payload, fmt, data):
+        key = cache_key(payload, fmt)
+        self.disk.put(key, fmt, data)
+        self.memory.put(key, data)
+        return key
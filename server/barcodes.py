@@ -0,0 +1,145 @@
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import barcode
+from barcode.writer import ImageWriter
+
+import metrics
+
+BARCODE_WORKERS = int(os.environ.get("BARCODE_WORKERS", "2"))
+BARCODE_MAX_PENDING = int(os.environ.get("BARCODE_MAX_PENDING", "256"))
+BARCODE_WAIT_SECONDS = float(os.environ.get("BARCODE_WAIT_SECONDS", "2"))
+
+PENDING = "pending"
+READY = "ready"
+
+# SVG geometry, in millimetres to match ImageWriter's defaults
+SVG_MODULE_WIDTH = 0.2
+SVG_BAR_HEIGHT = 15.0
+SVG_QUIET_ZONE = 2.5
+SVG_FONT_SIZE = 3.5
+
+
+# ---------------- RENDERING ---------------- #
+def render_png(order_id):
+    """Rasterise the code128 barcode for an order ID and return PNG bytes."""
+    code = barcode.get_barcode_class("code128")(order_id, writer=ImageWriter())
+    buf = io.BytesIO()
+    code.write(buf)
+    return buf.getvalue()
+
+
+def render_svg(order_id):
+    """Return a compact SVG: one path for all bars plus the human-readable label."""
+    code = barcode.get_barcode_class("code128")(order_id)
+    modules = "".join(code.build())
+
+    path = []
+    x = 0
+    while x < len(modules):
+        if modules[x] == "1":
+            start = x
+            while x < len(modules) and modules[x] == "1":
+                x += 1
+            path.append(f"M{start} 0h{x - start}v1h-{x - start}z")
+        else:
+            x += 1
+
+    width = len(modules) * SVG_MODULE_WIDTH + 2 * SVG_QUIET_ZONE
+    height = SVG_BAR_HEIGHT + SVG_FONT_SIZE + 3
+    label = code.get_fullcode().replace("&", "&amp;").replace("<", "&lt;")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:g}mm" height="{height:g}mm" '
+        f'viewBox="0 0 {width:g} {height:g}">'
+        f'<rect width="100%" height="100%" fill="#fff"/>'
+        f'<path transform="translate({SVG_QUIET_ZONE:g} 1) scale({SVG_MODULE_WIDTH:g} {SVG_BAR_HEIGHT:g})" '
+        f'd="{"".join(path)}"/>'
+        f'<text x="{width / 2:g}" y="{height - 1:g}" font-family="monospace" '
+        f'font-size="{SVG_FONT_SIZE:g}" text-anchor="middle">{label}</text>'
+        f"</svg>"
+    ).encode("utf-8")
+
+
+RENDERERS = {"png": render_png, "svg": render_svg}
+
+
+def render(order_id, fmt):
+    return RENDERERS[fmt](order_id)
+
+
+# ---------------- JOB QUEUE ---------------- #
+class BarcodeQueue:
+    """Bounded background pool that renders order barcodes off the request path.
+
+    Finished images land in the barcode cache. Jobs are de-duplicated per order
+    ID; when the backlog is full new jobs are dropped and `fetch` renders them
+    on demand instead.
+    """
+
+    def __init__(self, cache, workers=BARCODE_WORKERS, max_pending=BARCODE_MAX_PENDING):
+        self.cache = cache
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        # pools do not survive fork, so gunicorn workers each build their own
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._pid = os.getpid()
+            self._pending = {}
+        return self._executor
+
+    def _reset_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def status(self, order_id):
+        if order_id in self._pending or not self.cache.has(order_id, "png"):
+            return PENDING
+        return READY
+
+    def submit(self, order_id):
+        """Queue a PNG render and return the barcode state to report to the client."""
+        with self._lock:
+            executor = self._get_executor()
+            if order_id in self._pending or len(self._pending) >= self.max_pending:
+                return PENDING
+            try:
+                future = executor.submit(render, order_id, "png")
+            except BrokenProcessPool:
+                self._reset_executor()
+                return PENDING
+            self._pending[order_id] = future
+        future.add_done_callback(lambda f: self._finish(order_id, f))
+        return PENDING
+
+    def _finish(self, order_id, future):
+        with self._lock:
+            self._pending.pop(order_id, None)
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(order_id, "png", future.result())
+
+    def fetch(self, order_id, fmt="png"):
+        """Return `(etag, data)` for an order barcode, rendering inline on a cache miss."""
+        etag, data = self.cache.get(order_id, fmt)
+        if data is not None:
+            return etag, data
+
+        future = self._pending.get(order_id) if fmt == "png" else None
+        with metrics.phase("barcode"):
+            if future is not None:
+                try:
+                    data = future.result(timeout=BARCODE_WAIT_SECONDS)
+                except (FutureTimeout, BrokenProcessPool, OSError):
+                    data = None
+            if data is None:
+                data = render(order_id, fmt)
+        return self.cache.put(order_id, fmt, data), data
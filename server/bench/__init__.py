@@ -0,0 +1,8 @@
+"""Synthetic data and load tests for the Flask API.
+
+    python -m bench generate --orders 1000000 --customers 100000 --scans 10000000
+    python -m bench run --duration 10 --baseline bench/baselines/local.json
+    python -m bench run --url http://127.0.0.1:8000 --concurrency 8
+
+Run from the `server` directory. See README "Benchmarks".
+"""
@@ -0,0 +1,161 @@
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import click
+
+# run as `python -m bench` from the server directory; server modules import flat
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bench import report
+from bench.workloads import WORKLOADS, HttpClient, Recorder, TestClient, load_state, login_admin
+
+DEFAULT_DATABASE = "sqlite:///" + os.path.join(os.path.abspath(os.path.dirname(__file__)), "bench.db")
+
+
+def load_app(database):
+    from app import create_app
+
+    os.environ["DATABASE_URL"] = database
+    return create_app()
+
+
+@click.group()
+def cli():
+    """Synthetic data and load tests for the FabClean API."""
+
+
+@cli.command()
+@click.option("--database", default=DEFAULT_DATABASE, show_default=True, help="Database URL to fill.")
+@click.option("--customers", default=100_000, show_default=True)
+@click.option("--orders", default=1_000_000, show_default=True)
+@click.option("--scans", default=10_000_000, show_default=True)
+@click.option("--days", default=365, show_default=True, help="Spread timestamps over this many past days.")
+@click.option("--seed", default=1, show_default=True)
+def generate(database, customers, orders, scans, days, seed):
+    """Bulk-insert synthetic customers, orders and scans into an empty database."""
+    from bench.generate import populate
+
+    app = load_app(database)
+    import commands
+    import models
+    from extensions import db
+
+    # every bulk batch would trip the slow-query log
+    logging.getLogger("fabclean.slow_query").setLevel(logging.ERROR)
+    tables = {
+        "customer": models.Customer.__table__,
+        "order": models.Order.__table__,
+        "order_items": models.OrderItem.__table__,
+        "track": models.Track.__table__,
+        "service": models.Service.__table__,
+    }
+    with app.app_context():
+        commands.init_db()
+        populate(db.engine, tables, customers, orders, scans, days=days, seed=seed, echo=click.echo)
+
+
+def run_workload(make_client, workload, state, duration, concurrency, seed, admin=True):
+    recorders = [Recorder() for _ in range(concurrency)]
+    deadline = time.perf_counter() + duration
+
+    def loop(i):
+        client = make_client()
+        if admin:
+            login_admin(client)
+        rng = random.Random(seed + i)
+        while time.perf_counter() < deadline:
+            workload(client, recorders[i], rng, state)
+
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(concurrency)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    return report.summarize([s for r in recorders for s in r.samples], elapsed)
+
+
+@cli.command()
+@click.option("--url", help="Benchmark a running server (gunicorn, uvicorn) instead of the in-process test client.")
+@click.option("--database", default=DEFAULT_DATABASE, show_default=True, help="Database for the test client.")
+@click.option("--workload", "names", multiple=True, type=click.Choice(sorted(WORKLOADS)),
+              help="Repeatable; defaults to every workload.")
+@click.option("--duration", default=10.0, show_default=True, help="Seconds per workload.")
+@click.option("--concurrency", default=1, show_default=True, help="Client threads per workload.")
+@click.option("--seed", default=1, show_default=True)
+@click.option("--baseline", type=click.Path(dir_okay=False), help="Baseline JSON to compare against (or --save to).")
+@click.option("--save", is_flag=True, help="Write the results as the new baseline.")
+@click.option("--tolerance", default=0.2, show_default=True, help="Allowed relative slowdown before failing.")
+def run(url, database, names, duration, concurrency, seed, baseline, save, tolerance):
+    """Replay the workloads and report throughput and latency percentiles."""
+    if url:
+        make_client = lambda: HttpClient(url)
+    else:
+        app = load_app(database)
+        make_client = lambda: TestClient(app)
+
+    setup = make_client()
+    login_admin(setup)
+    state = load_state(setup)
+    if not state["orders"]:
+        raise click.ClickException("The database has no orders; run `python -m bench generate` first")
+
+    results = {}
+    for name in names or sorted(WORKLOADS):
+        results[name] = run_workload(make_client, WORKLOADS[name], state, duration, concurrency, seed)
+        click.echo(f"{name}: {results[name]['requests']} requests", err=True)
+    click.echo(report.format_table(results))
+
+    if baseline and save:
+        report.save_baseline(baseline, results, {
+            "target": url or "test-client", "duration": duration, "concurrency": concurrency,
+        })
+        click.echo(f"Saved baseline to {baseline}")
+    elif baseline:
+        regressions = report.compare(baseline, results, tolerance)
+        for line in regressions:
+            click.echo(f"REGRESSION {line}", err=True)
+        if regressions:
+            sys.exit(1)
+        click.echo(f"Within {tolerance:.0%} of {baseline}")
+
+
+@cli.command()
+@click.option("--target", "targets", multiple=True, required=True,
+              help="NAME=URL of a running server; repeat, e.g. sync=http://127.0.0.1:8000 async=http://127.0.0.1:8001.")
+@click.option("--workload", "names", multiple=True, type=click.Choice(sorted(WORKLOADS)),
+              help="Repeatable; defaults to the workloads asgi_app.py serves as coroutines.")
+@click.option("--concurrency", "levels", default="8,32,128,256", show_default=True,
+              help="Comma-separated client thread counts to step through.")
+@click.option("--duration", default=10.0, show_default=True, help="Seconds per workload and level.")
+@click.option("--seed", default=1, show_default=True)
+def compare(targets, names, levels, duration, seed):
+    """Step servers through rising concurrency to see where throughput stops growing."""
+    levels = [int(level) for level in levels.split(",")]
+    rows = []
+    for target in targets:
+        label, _, url = target.partition("=")
+        if not url:
+            raise click.BadParameter(f"expected NAME=URL, got {target}", param_hint="--target")
+        make_client = lambda url=url: HttpClient(url)
+        setup = make_client()
+        login_admin(setup)
+        state = load_state(setup)
+        if not state["orders"]:
+            raise click.ClickException(f"{label} has no orders; run `python -m bench generate` first")
+        for name in names or ("email_lookup", "scan_flood", "qr_fetch", "deliveries_feed"):
+            for level in levels:
+                # public endpoints only: hundreds of admin logins would just measure password hashing
+                summary = run_workload(make_client, WORKLOADS[name], state, duration, level, seed, admin=False)
+                rows.append((label, name, level, summary))
+                click.echo(f"{label} {name} x{level}: {summary['rps']:.1f} rps", err=True)
+    click.echo(report.format_scaling(rows))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,143 @@
+"""Bulk synthetic data: customers, orders with items, and a scan history.
+
+Rows are generated from a seeded RNG and written with executemany in large
+batches, one transaction per batch, straight through the engine. The order
+status projection, the customer order history and the dashboard rollups are
+rebuilt at the end from the inserted rows, exactly as the
+`rebuild-order-status` / `rebuild-order-history` / `recompute-stats` commands
+would.
+"""
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+
+import order_history
+import order_status
+import stats
+from passwords import NO_PASSWORD
+
+BATCH = 20000
+
+STATUSES = ("Picked Up", "Washing", "Drying", "Ironing", "Packed", "Out for Delivery", "Delivered")
+LOCATIONS = ("Front Desk", "W1", "W2", "W3", "Van 1", "Van 2")
+FIRST_NAMES = ("Asha", "Ravi", "Meera", "Arjun", "Priya", "Karthik", "Divya", "Vikram", "Anita", "Suresh")
+LAST_NAMES = ("Iyer", "Kumar", "Nair", "Reddy", "Shah", "Menon", "Rao", "Das", "Pillai", "Gupta")
+
+
+def customer_email(n):
+    return f"customer{n}@bench.example"
+
+
+def _batched(rows, size=BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(engine, table, rows, label, echo):
+    start = time.perf_counter()
+    total = 0
+    for batch in _batched(rows):
+        with engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+        total += len(batch)
+    elapsed = time.perf_counter() - start
+    echo(f"{label:<12} {total:>10} rows in {elapsed:6.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+    return total
+
+
+def populate(engine, tables, customers, orders, scans, days=365, seed=1, echo=print):
+    """Insert the requested volumes; `tables` maps customer/order/order_items/track/service to Tables."""
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    start = now - timedelta(days=days)
+    span = days * 86400
+
+    with engine.connect() as conn:
+        services = [tuple(row) for row in conn.execute(
+            tables["service"].select().with_only_columns(
+                tables["service"].c.id, tables["service"].c.name, tables["service"].c.price
+            )
+        )]
+    if not services:
+        raise RuntimeError("No services to attach orders to; run `flask --app server.app init-db` first")
+    if orders and not customers:
+        raise ValueError("Orders need at least one customer")
+
+    def customer_rows():
+        for n in range(customers):
+            yield {
+                "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "email": customer_email(n),
+                "phone": f"9{n:09d}",
+                "password_hash": NO_PASSWORD,
+                "created_at": start + timedelta(seconds=rng.randrange(span)),
+            }
+
+    # customer index per order, so scans can name the order's email without keeping rows around
+    order_customers = array("L")
+
+    def order_batches():
+        for first in range(0, orders, BATCH):
+            order_rows, item_rows = [], []
+            for n in range(first, min(orders, first + BATCH)):
+                order_id = f"b{n:07x}"
+                customer = rng.randrange(customers)
+                picked = rng.sample(services, rng.randint(1, min(3, len(services))))
+                order_customers.append(customer)
+                order_rows.append({
+                    "id": order_id,
+                    "customer_name": "Bench Customer",
+                    "customer_email": customer_email(customer),
+                    "customer_id": customer + 1,  # customers went into an empty table first
+                    "customer_phone": "9000000000",
+                    "pickup_date": "",
+                    "special_instructions": "",
+                    "total": sum(price for _, _, price in picked),
+                    "created_at": start + timedelta(seconds=rng.randrange(span)),
+                })
+                item_rows.extend(
+                    {"order_id": order_id, "service_id": service_id, "service_name": name,
+                     "price": price, "position": position}
+                    for position, (service_id, name, price) in enumerate(picked)
+                )
+            yield order_rows, item_rows
+
+    def scan_rows():
+        for n in range(scans):
+            order = rng.randrange(orders)
+            yield {
+                "worker_id": rng.randint(1, 20),
+                "order_email": customer_email(order_customers[order]),
+                "order_status": rng.choice(STATUSES),
+                "location": rng.choice(LOCATIONS),
+                "scanned_at": start + timedelta(seconds=rng.randrange(span)),
+                "scan_id": f"bench-{n}",
+                "order_id": f"b{order:07x}",
+            }
+
+    _insert(engine, tables["customer"], customer_rows(), "customers", echo)
+
+    began = time.perf_counter()
+    for order_rows, item_rows in order_batches():
+        with engine.begin() as conn:
+            conn.execute(tables["order"].insert(), order_rows)
+            conn.execute(tables["order_items"].insert(), item_rows)
+    elapsed = time.perf_counter() - began
+    echo(f"{'orders':<12} {orders:>10} rows in {elapsed:6.1f}s ({orders / max(elapsed, 1e-9):,.0f} rows/s, with items)")
+
+    if orders and customers:
+        _insert(engine, tables["track"], scan_rows(), "scans", echo)
+
+    began = time.perf_counter()
+    with engine.begin() as conn:
+        order_status.rebuild(conn)
+        order_history.rebuild(conn)  # reads the status projection just rebuilt
+        stats.recompute(conn)
+    echo(f"projections rebuilt in {time.perf_counter() - began:6.1f}s")
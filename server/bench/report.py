@@ -0,0 +1,80 @@
+"""Latency percentiles, throughput and baseline comparison."""
+import json
+import os
+import platform
+from datetime import datetime
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(seconds * 1000 for seconds, _ in samples)
+    summary = {
+        "requests": len(samples),
+        "errors": sum(1 for _, ok in samples if not ok),
+        "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+    }
+    for pct in PERCENTILES:
+        summary[f"p{pct}_ms"] = round(percentile(latencies, pct), 3)
+    return summary
+
+
+def format_table(results):
+    lines = [f"{'workload':<15}{'reqs':>8}{'errs':>6}{'rps':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+    for name, s in results.items():
+        lines.append(
+            f"{name:<15}{s['requests']:>8}{s['errors']:>6}{s['rps']:>10.1f}"
+            f"{s['p50_ms']:>9.2f}{s['p95_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['max_ms']:>9.2f}"
+        )
+    return "\n".join(lines)
+
+
+def format_scaling(rows):
+    """Table of `(target, workload, concurrency, summary)` rows from `bench compare`."""
+    lines = [f"{'target':<12}{'workload':<17}{'conc':>6}{'rps':>10}{'p50':>9}{'p99':>9}{'errs':>6}"]
+    for target, name, concurrency, s in rows:
+        lines.append(
+            f"{target:<12}{name:<17}{concurrency:>6}{s['rps']:>10.1f}"
+            f"{s['p50_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['errors']:>6}"
+        )
+    return "\n".join(lines)
+
+
+def save_baseline(path, results, meta):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    document = {
+        "recorded": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        **meta,
+        "workloads": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(path, results, tolerance):
+    """Regressions against a saved baseline: p95 above or throughput below it by more than `tolerance`."""
+    with open(path) as f:
+        baseline = json.load(f)["workloads"]
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']:.2f} ms vs baseline {before['p95_ms']:.2f} ms")
+        if current["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {current['rps']:.1f} rps vs baseline {before['rps']:.1f} rps")
+        if current["errors"] > before["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors vs baseline {before['errors']}")
+    return regressions
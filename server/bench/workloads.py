@@ -0,0 +1,219 @@
+"""Scripted request mixes, run against the test client or a live server.
+
+Each workload is a function `(client, recorder, rng, state)` that issues one
+logical operation (which may be several requests) through `client.request`,
+which records every request's latency and status.
+"""
+import http.cookiejar
+import itertools
+import json
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+from bench.generate import LOCATIONS, STATUSES
+from tenancy import DEFAULT_FRANCHISE, FRANCHISE_HEADER
+
+ADMIN_USER = "fabclean"
+ADMIN_PASS = "fabzclean"
+
+
+# ---------------- CLIENTS ---------------- #
+class Recorder:
+    """Collects `(latency_seconds, ok)` samples per workload."""
+
+    def __init__(self):
+        self.samples = []
+
+    def add(self, seconds, ok):
+        self.samples.append((seconds, ok))
+
+
+class TestClient:
+    """In-process client over Flask's test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, recorder, method, path, body=None, content_type="application/json", headers=None):
+        data = json.dumps(body) if content_type == "application/json" and body is not None else body
+        start = time.perf_counter()
+        response = self.client.open(path, method=method, data=data, content_type=content_type, headers=headers)
+        recorder.add(time.perf_counter() - start, response.status_code < 400)
+        return response.status_code, response.get_data(), response.headers
+
+
+class HttpClient:
+    """Client for a running server (gunicorn, uvicorn) at `base_url`."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, recorder, method, path, body=None, content_type="application/json", headers=None):
+        data = json.dumps(body) if content_type == "application/json" and body is not None else body
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers or {})
+        if data is not None:
+            req.add_header("Content-Type", content_type)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                status, payload, headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, payload, headers = e.code, e.read(), e.headers
+        except OSError:
+            status, payload, headers = 599, b"", {}
+        recorder.add(time.perf_counter() - start, status < 400)
+        return status, payload, headers
+
+
+def login_admin(client):
+    client.request(Recorder(), "POST", "/admin/login", {"username": ADMIN_USER, "password": ADMIN_PASS})
+
+
+def load_state(client, sample=2000):
+    """Services and a sample of existing orders (id, email) to aim the workloads at."""
+    recorder = Recorder()
+    _, body, _ = client.request(recorder, "GET", "/api/services")
+    services = [s["id"] for s in json.loads(body)]
+    _, body, _ = client.request(recorder, "GET", f"/admin/api/orders?limit={sample}&fields=id,customerEmail")
+    orders = [(o["id"], o["customerEmail"]) for o in json.loads(body)]
+    return {"services": services, "orders": orders, "run_id": f"{time.time():.0f}", "scan_seq": itertools.count()}
+
+
+# ---------------- WORKLOADS ---------------- #
+def order_burst(client, recorder, rng, state):
+    """A customer places an order with one to three services."""
+    services = rng.sample(state["services"], rng.randint(1, min(3, len(state["services"]))))
+    client.request(recorder, "POST", "/api/orders", {
+        "customerName": "Load Test",
+        "customerEmail": rng.choice(state["orders"])[1],
+        "customerPhone": "9000000000",
+        "serviceIds": services,
+        "total": 1,
+    })
+
+
+def scan_flood(client, recorder, rng, state):
+    """A handheld uploads a batch of 50 scans for known orders."""
+    scans = []
+    for _ in range(50):
+        order_id, email = rng.choice(state["orders"])
+        scans.append({
+            "scanId": f"load-{state['run_id']}-{next(state['scan_seq'])}",
+            "workerId": rng.randint(1, 20),
+            "orderId": order_id,
+            "orderEmail": email,
+            "orderStatus": rng.choice(STATUSES),
+            "location": rng.choice(LOCATIONS),
+        })
+    client.request(recorder, "POST", "/worker/scans", scans)
+
+
+def admin_listing(client, recorder, rng, state):
+    """The admin opens the orders list and pages forward up to five times."""
+    path = "/admin/api/orders?limit=100"
+    if rng.random() < 0.3:
+        path += "&status=" + urllib.request.quote(rng.choice(STATUSES))
+    for _ in range(rng.randint(1, 5)):
+        status, _, headers = client.request(recorder, "GET", path)
+        cursor = headers.get("X-Next-Cursor") if status == 200 else None
+        if not cursor:
+            break
+        path = f"/admin/api/orders?limit=100&cursor={cursor}"
+
+
+def email_lookup(client, recorder, rng, state):
+    """A customer checks their order history."""
+    email = rng.choice(state["orders"])[1]
+    client.request(recorder, "GET", "/api/orders?email=" + urllib.request.quote(email))
+
+
+def qr_fetch(client, recorder, rng, state):
+    """A handheld loads an order's barcode (rendered on the first request)."""
+    client.request(recorder, "GET", f"/qr/{rng.choice(state['orders'])[0]}.png")
+
+
+def deliveries_feed(client, recorder, rng, state):
+    """A dispatcher refreshes the deliveries list."""
+    client.request(recorder, "GET", "/api/deliveries?limit=50")
+
+
+WORKLOADS = {
+    "order_burst": order_burst,
+    "scan_flood": scan_flood,
+    "admin_listing": admin_listing,
+    "email_lookup": email_lookup,
+    "qr_fetch": qr_fetch,
+    "deliveries_feed": deliveries_feed,
+}
+
+
+# ---------------- AUDIT COVERAGE ---------------- #
+# routes the load mixes above leave out; `flask audit-queries` replays them on a scratch
+# copy of the database so their statements are plan-checked too (they delete rows, so
+# `bench run` does not use them). Each runs once unscoped and once scoped to a franchise.
+SCOPES = ({}, {FRANCHISE_HEADER: DEFAULT_FRANCHISE})
+
+
+def _date_range(rng):
+    end = datetime.utcnow() - timedelta(days=rng.randint(0, 180))
+    return f"from={(end - timedelta(days=30)).date().isoformat()}&to={end.date().isoformat()}"
+
+
+def admin_reports(client, recorder, rng, state):
+    """The admin dashboard, customer list and order status board, with their filters."""
+    quote = urllib.request.quote
+    email = quote(rng.choice(state["orders"])[1])
+    status, location = quote(rng.choice(STATUSES)), quote(rng.choice(LOCATIONS))
+    paths = [
+        f"/admin/api/stats?period={period}" + suffix
+        for period in ("day", "week", "month") for suffix in ("", "&" + _date_range(rng))
+    ] + [
+        "/admin/api/customers?limit=50",
+        "/admin/api/customers?sort=name&order=asc&q=A&limit=50",
+        f"/admin/api/customers?email={email}",
+        f"/admin/api/customers?{_date_range(rng)}&limit=50",
+        f"/admin/api/order-status?status={status}&limit=50",
+        f"/admin/api/order-status?location={location}&limit=50",
+        f"/admin/api/order-status?location={location}&status={status}&limit=50",
+        f"/admin/api/orders?email={email}&limit=50",
+        f"/admin/api/orders?service={quote(rng.choice(state['services']))}&limit=50",
+        f"/admin/api/orders?{_date_range(rng)}&limit=50",
+        f"/admin/api/orders?location={location}&limit=50",
+        "/admin/api/orders?sort=total&order=asc&limit=50",
+    ]
+    for headers in SCOPES:
+        for path in paths:
+            client.request(recorder, "GET", path, headers=headers)
+
+
+def admin_edits(client, recorder, rng, state):
+    """The admin edits and deletes an order and a customer; a customer cancels an order."""
+    orders = state["orders"]
+    for headers in SCOPES:
+        if len(orders) < 3:
+            return
+        order_id, email = orders.pop(rng.randrange(len(orders)))
+        client.request(recorder, "PUT", f"/admin/api/orders/{order_id}", {
+            "customerName": "Audit", "serviceId": rng.choice(state["services"]),
+        }, headers=headers)
+        client.request(recorder, "DELETE", f"/admin/api/orders/{order_id}", headers=headers)
+        order_id, email = orders.pop(rng.randrange(len(orders)))
+        client.request(recorder, "DELETE", f"/api/orders/{order_id}?email={urllib.request.quote(email)}",
+                       headers=headers)
+        _, body, _ = client.request(
+            recorder, "GET", f"/admin/api/customers?email={urllib.request.quote(email)}", headers=headers
+        )
+        for customer in json.loads(body)[:1]:
+            client.request(recorder, "PUT", f"/admin/api/customers/{customer['id']}", {"name": "Audit"},
+                           headers=headers)
+            client.request(recorder, "DELETE", f"/admin/api/customers/{customer['id']}", headers=headers)
+
+
+AUDIT_WORKLOADS = {**WORKLOADS, "admin_reports": admin_reports, "admin_edits": admin_edits}
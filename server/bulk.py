@@ -0,0 +1,345 @@
+"""Bulk import and export of orders and customers (CSV or NDJSON).
+
+Imports read records lazily and commit them in chunks: each chunk is one
+transaction that looks up existing customers with a single IN query, creates
+the missing ones (deduplicated by email) and inserts orders and their items
+with executemany. Barcodes are not rendered; `/qr/<id>.png` renders them on
+first request. Exports stream rows off a server-side cursor, fetching order
+items per batch, so the table is never held in memory.
+"""
+import csv
+import io
+import json
+import os
+import uuid
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import bindparam, select
+
+import order_history
+import stats
+from passwords import NO_PASSWORD
+from tenancy import DEFAULT_FRANCHISE
+
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "1000"))
+EXPORT_BATCH = 1000
+# stay well under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ("csv", "ndjson")
+MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+ORDER_FIELDS = [
+    "id", "customerName", "customerEmail", "customerPhone", "serviceIds", "services",
+    "pickupDate", "specialInstructions", "total", "createdAt",
+]
+CUSTOMER_FIELDS = ["id", "name", "email", "phone", "createdAt"]
+
+
+# ---------------- READING ---------------- #
+def read_records(stream, fmt):
+    """Yield `(line_number, record)` from a text stream; bad NDJSON lines yield `(n, None)`."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield lineno, record if isinstance(record, dict) else None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _service_ids(value):
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    # CSV cells hold "s1;s2" (or the legacy "s1,s2")
+    return [v.strip() for v in str(value or "").replace(";", ",").split(",") if v.strip()]
+
+
+def _email(value):
+    """Emails are stored as given minus surrounding whitespace; logins match them exactly."""
+    return str(value or "").strip()
+
+
+def _created_at(value):
+    if not value:
+        return datetime.utcnow()
+    created_at = datetime.fromisoformat(value)
+    if created_at.utcoffset() is not None:
+        created_at = (created_at - created_at.utcoffset()).replace(tzinfo=None)
+    return created_at
+
+
+# ---------------- IMPORT ---------------- #
+class Importer:
+    """Chunked importer bound to the order, order item, customer and service tables.
+
+    Rows are imported into `franchise` and may only use that franchise's services.
+    """
+
+    def __init__(self, session, orders, items, customers, services, chunk_size=BULK_CHUNK_SIZE, on_chunk=None,
+                 franchise=DEFAULT_FRANCHISE):
+        self.session = session
+        self.franchise = franchise
+        self.orders = orders
+        self.items = items
+        self.customers = customers
+        self.services = services
+        self.chunk_size = chunk_size
+        # called inside each order chunk's transaction, before it commits
+        self.on_chunk = on_chunk
+        self.summary = {"chunks": 0, "ordersCreated": 0, "customersCreated": 0, "rejected": 0, "errors": []}
+
+    def _reject(self, lineno, error):
+        self.summary["rejected"] += 1
+        if len(self.summary["errors"]) < MAX_REPORTED_ERRORS:
+            self.summary["errors"].append({"line": lineno, "error": error})
+
+    def _customer_ids(self, emails):
+        ids = {}
+        for start in range(0, len(emails), LOOKUP_CHUNK):
+            chunk = emails[start:start + LOOKUP_CHUNK]
+            ids.update(self.session.execute(
+                select(self.customers.c.email, self.customers.c.id)
+                .where(self.customers.c.franchise_id == self.franchise, self.customers.c.email.in_(chunk))
+            ).all())
+        return ids
+
+    def _ensure_customers(self, wanted):
+        """Create customers for emails not yet stored; `wanted` maps email -> (name, phone).
+
+        Returns email -> customer id for every wanted email.
+        """
+        existing = self._customer_ids(list(wanted))
+        now = datetime.utcnow()
+        new = [
+            # imported customers are invited: no password until they sign up
+            {"name": name, "email": email, "phone": phone, "password_hash": NO_PASSWORD, "created_at": now,
+             "franchise_id": self.franchise}
+            for email, (name, phone) in wanted.items() if email not in existing
+        ]
+        if new:
+            self.session.execute(self.customers.insert(), new)
+            existing.update(self._customer_ids([row["email"] for row in new]))
+        self.summary["customersCreated"] += len(new)
+        return existing
+
+    def import_customers(self, records):
+        for chunk in chunked(records, self.chunk_size):
+            wanted = {}
+            for lineno, record in chunk:
+                if record is None:
+                    self._reject(lineno, "Invalid record")
+                    continue
+                name, email, phone = record.get("name"), _email(record.get("email")), record.get("phone")
+                if not name or not email:
+                    self._reject(lineno, "name and email are required")
+                    continue
+                wanted.setdefault(email, (name, phone))
+            self._ensure_customers(wanted)
+            self.session.commit()
+            self.summary["chunks"] += 1
+        return self.summary
+
+    def _existing_orders(self, ids):
+        existing = set()
+        for start in range(0, len(ids), LOOKUP_CHUNK):
+            chunk = ids[start:start + LOOKUP_CHUNK]
+            existing.update(self.session.scalars(select(self.orders.c.id).where(self.orders.c.id.in_(chunk))))
+        return existing
+
+    def import_orders(self, records):
+        """Import order records; rows whose `id` is already stored are rejected, so re-runs are safe.
+
+        A given `total` must equal the sum of the services' current prices; a missing one is computed.
+        """
+        services = {
+            row.id: row for row in self.session.execute(
+                select(self.services.c.id, self.services.c.name, self.services.c.price)
+                .where(self.services.c.franchise_id == self.franchise)
+            )
+        }
+        for chunk in chunked(records, self.chunk_size):
+            orders, items, snapshots, summaries, customers = [], [], [], [], {}
+            usage = Counter()
+            taken = self._existing_orders([str(r["id"]) for _, r in chunk if r and r.get("id")])
+            for lineno, record in chunk:
+                if record is None:
+                    self._reject(lineno, "Invalid record")
+                    continue
+                name = record.get("customerName")
+                email = _email(record.get("customerEmail"))
+                phone = record.get("customerPhone")
+                if not (name and email and phone):
+                    self._reject(lineno, "customerName, customerEmail and customerPhone are required")
+                    continue
+                ids = _service_ids(record.get("serviceIds"))
+                if not ids or len(set(ids)) != len(ids) or any(i not in services for i in ids):
+                    self._reject(lineno, "serviceIds must be distinct, existing service IDs")
+                    continue
+                try:
+                    created_at = _created_at(record.get("createdAt"))
+                    total = float(record["total"]) if record.get("total") not in (None, "") else None
+                except (TypeError, ValueError):
+                    self._reject(lineno, "createdAt must be ISO and total a number")
+                    continue
+
+                # the rollups price the items from the catalogue, so the order total has to agree with them
+                priced = sum(services[sid].price for sid in ids)
+                if total is None:
+                    total = priced
+                elif round(total, 2) != round(priced, 2):
+                    self._reject(lineno, f"total {total} does not match the services' prices ({priced})")
+                    continue
+
+                order_id = str(record.get("id") or "") or str(uuid.uuid4())[:8]
+                if order_id in taken or len(order_id) > 20:
+                    self._reject(lineno, f"Order {order_id} already exists or is not a valid ID")
+                    continue
+                taken.add(order_id)
+                line_items = [
+                    {"order_id": order_id, "service_id": sid, "service_name": services[sid].name,
+                     "price": services[sid].price, "position": pos}
+                    for pos, sid in enumerate(ids)
+                ]
+                orders.append({
+                    "id": order_id,
+                    "customer_name": name,
+                    "customer_email": email,
+                    "customer_phone": phone,
+                    "pickup_date": record.get("pickupDate") or "",
+                    "special_instructions": record.get("specialInstructions") or "",
+                    "total": total,
+                    "created_at": created_at,
+                    "franchise_id": self.franchise,
+                })
+                items.extend(line_items)
+                usage.update(ids)
+                customers.setdefault(email, (name, phone))
+                snapshots.append(stats.OrderSnapshot(
+                    created_at, email, total, tuple((i["service_id"], i["price"]) for i in line_items), self.franchise
+                ))
+                summaries.append({
+                    "order_id": order_id,
+                    "customer_email": email,
+                    "franchise_id": self.franchise,
+                    "services": json.dumps([i["service_name"] for i in line_items]),
+                    "total": total,
+                    "pickup_date": record.get("pickupDate") or "",
+                    "address": None,
+                    "created_at": created_at,
+                    "status": None,
+                    "location": None,
+                    "status_at": None,
+                })
+
+            if orders:
+                customer_ids = self._ensure_customers(customers)
+                for order in orders:
+                    order["customer_id"] = customer_ids.get(order["customer_email"])
+                self.session.execute(self.orders.insert(), orders)
+                self.session.execute(self.items.insert(), items)
+                self.session.execute(
+                    self.services.update()
+                    .where(self.services.c.id == bindparam("sid"))
+                    .values(usage_count=self.services.c.usage_count + bindparam("n")),
+                    [{"sid": sid, "n": n} for sid, n in usage.items()],
+                )
+                stats.record(self.session, added=snapshots)
+                order_history.record(self.session, added=summaries)
+                if self.on_chunk is not None:
+                    self.on_chunk()
+            self.session.commit()
+            self.summary["chunks"] += 1
+            self.summary["ordersCreated"] += len(orders)
+        return self.summary
+
+
+# ---------------- EXPORT ---------------- #
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def iter_orders(session, orders, items, franchise=None):
+    """Yield order dicts from a server-side cursor, fetching items once per batch.
+
+    `franchise` limits the export to one franchise's orders.
+    """
+    query = select(orders).order_by(orders.c.created_at, orders.c.id)
+    if franchise is not None:
+        query = query.where(orders.c.franchise_id == franchise)
+    result = session.execute(query, execution_options={"yield_per": EXPORT_BATCH})
+    for batch in result.partitions():
+        ids = [row.id for row in batch]
+        by_order = {}
+        for item in session.execute(
+            select(items.c.order_id, items.c.service_id, items.c.service_name)
+            .where(items.c.order_id.in_(ids))
+            .order_by(items.c.order_id, items.c.position)
+        ):
+            by_order.setdefault(item.order_id, []).append(item)
+        for row in batch:
+            line_items = by_order.get(row.id, [])
+            yield {
+                "id": row.id,
+                "customerName": row.customer_name,
+                "customerEmail": row.customer_email,
+                "customerPhone": row.customer_phone,
+                "serviceIds": [i.service_id for i in line_items],
+                "services": [i.service_name for i in line_items],
+                "pickupDate": row.pickup_date,
+                "specialInstructions": row.special_instructions,
+                "total": row.total,
+                "createdAt": _iso(row.created_at),
+            }
+
+
+def iter_customers(session, customers, franchise=None):
+    query = select(
+        customers.c.id, customers.c.name, customers.c.email, customers.c.phone, customers.c.created_at
+    ).order_by(customers.c.id)
+    if franchise is not None:
+        query = query.where(customers.c.franchise_id == franchise)
+    result = session.execute(query, execution_options={"yield_per": EXPORT_BATCH})
+    for row in result:
+        yield {"id": row.id, "name": row.name, "email": row.email, "phone": row.phone,
+               "createdAt": _iso(row.created_at)}
+
+
+def encode(records, fmt, fields):
+    """Yield text chunks of `records` as CSV (list cells joined with ';') or NDJSON."""
+    if fmt == "ndjson":
+        for record in records:
+            yield json.dumps(record) + "\n"
+        return
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fields)
+    writer.writeheader()
+    for n, record in enumerate(records, 1):
+        writer.writerow({
+            key: ";".join(value) if isinstance(value, list) else value
+            for key, value in record.items()
+        })
+        if n % EXPORT_BATCH == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
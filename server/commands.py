@@ -0,0 +1,335 @@
+"""`flask` subcommands: schema setup, maintenance jobs and benchmarks.
+
+Run them with `flask --app server.app <command>`. `init-db` is the one-shot
+setup step (tables, migrations, default rows) to run before the web workers
+start; the app itself never touches the schema on import.
+"""
+import os
+import random
+import sqlite3
+import tempfile
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from extensions import db
+from models import (
+    AdminAccount,
+    Event,
+    Franchise,
+    Order,
+)
+from schemas import ORDER_SCHEMA
+import admin_sessions
+import bulk
+import migrations
+import order_history
+import order_status
+import query_audit
+import routing
+import seed
+import serialization
+import static_assets
+import stats
+import tenancy
+
+COMMANDS = []
+
+
+def command(name):
+    """Declare a subcommand that runs in the app context; `register` adds it to an app."""
+    def decorator(fn):
+        cmd = click.command(name)(with_appcontext(fn))
+        COMMANDS.append(cmd)
+        return cmd
+    return decorator
+
+
+def register(app):
+    for cmd in COMMANDS:
+        app.cli.add_command(cmd)
+
+
+# ---------------- SETUP ---------------- #
+def init_db(demo=False):
+    """Create missing tables, apply pending migrations and add the default rows."""
+    db.create_all()
+    applied = migrations.upgrade(db.engine)
+    seed.seed_defaults(db.session)
+    if demo:
+        seed.seed_demo(db.session)
+    db.session.commit()
+    for engine in franchise_engines():
+        init_franchise_db(engine)
+    return applied
+
+
+def init_franchise_db(engine):
+    """Schema for a sharded franchise's database; only its franchise tables are ever used."""
+    db.metadata.create_all(engine)
+    return migrations.upgrade(engine)
+
+
+def franchise_engines():
+    """Engines of the franchises sharded onto their own databases."""
+    databases = tenancy.registry(db.engine, refresh=True)
+    return [tenancy.engine_for(databases[franchise]) for franchise in tenancy.sharded(db.engine)]
+
+
+@command("init-db")
+@click.option("--demo", is_flag=True, help="Also add demo customers, workers, an order and a scan.")
+def init_db_command(demo):
+    """Create tables, migrate and seed; run once per deploy before starting the workers."""
+    applied = init_db(demo)
+    click.echo(f"Applied migrations: {', '.join(map(str, applied))}" if applied else "Schema up to date")
+
+@command("add-franchise")
+@click.argument("franchise_id")
+@click.argument("name")
+@click.option("--database", help="SQLite file (or database URL) to shard this franchise onto.")
+def add_franchise_command(franchise_id, name, database):
+    """Register a franchise, optionally with its own database."""
+    if db.session.get(Franchise, franchise_id):
+        raise click.ClickException(f"Franchise {franchise_id} exists")
+    if database and franchise_id == tenancy.DEFAULT_FRANCHISE:
+        raise click.ClickException("The default franchise lives in the main database")
+    if database and "://" not in database:
+        database = "sqlite:///" + os.path.abspath(database)
+    if database:
+        init_franchise_db(tenancy.engine_for(database))
+    db.session.add(Franchise(id=franchise_id, name=name, database=database))
+    db.session.commit()
+    tenancy.forget()
+    click.echo(f"Added franchise {franchise_id}" + (f" on {database}" if database else ""))
+
+@command("add-admin")
+@click.argument("username")
+@click.option("--franchise", help="Make the account this franchise's owner instead of a super admin.")
+@click.password_option()
+def add_admin_command(username, franchise, password):
+    """Add an admin login."""
+    if AdminAccount.query.filter_by(username=username).first():
+        raise click.ClickException(f"Admin {username} exists")
+    if franchise and not db.session.get(Franchise, franchise):
+        raise click.ClickException(f"Unknown franchise {franchise}")
+    admin = AdminAccount(username=username, franchise_id=franchise)
+    admin.set_password(password)
+    db.session.add(admin)
+    db.session.commit()
+    click.echo(f"Added admin {username}" + (f" for {franchise}" if franchise else ""))
+
+@command("revoke-admin-sessions")
+@click.option("--username", help="Only log out this admin.")
+def revoke_admin_sessions_command(username):
+    """Log admins out now, e.g. after a leaked cookie; other workers notice within ADMIN_SESSION_CACHE_SECONDS."""
+    admin_id = None
+    if username:
+        admin = AdminAccount.query.filter_by(username=username).first()
+        if admin is None:
+            raise click.ClickException(f"Unknown admin {username}")
+        admin_id = admin.id
+    click.echo(f"Revoked {admin_sessions.store.revoke(admin_id=admin_id)} sessions")
+
+
+# ---------------- QUERY PLAN AUDIT ---------------- #
+def replay_workloads(names, requests, seed):
+    """Run bench workloads on a scratch copy of the database; returns the statements they issued."""
+    from app import create_app
+    from bench.workloads import AUDIT_WORKLOADS, Recorder, TestClient, load_state, login_admin
+
+    if db.engine.dialect.name != "sqlite":
+        raise click.ClickException("The query plan audit only understands SQLite plans")
+    with tempfile.TemporaryDirectory() as scratch:
+        # the workloads place orders and upload scans; keep them out of the real database
+        copy = os.path.join(scratch, "audit.db")
+        with db.engine.connect() as conn, closing(sqlite3.connect(copy)) as target:
+            conn.connection.driver_connection.backup(target)
+        app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + copy})
+        with app.app_context():
+            engine = db.engine
+        # requests made inside that app context would share its `g`, and with it the admin session lookup
+        with query_audit.Capture(engine) as capture:
+            client = TestClient(app)
+            capture.label = "load_state"
+            login_admin(client)
+            state = load_state(client)
+            if not state["orders"]:
+                raise click.ClickException("The database has no orders; run `python -m bench generate` first")
+            for name in names:
+                capture.label = name
+                rng, recorder = random.Random(seed), Recorder()
+                for _ in range(requests):
+                    AUDIT_WORKLOADS[name](client, recorder, rng, state)
+        engine.dispose()
+    return capture.statements()
+
+@command("audit-queries")
+@click.option("--max-rows", default=1000, show_default=True,
+              help="Fail on full scans of tables holding more rows than this.")
+@click.option("--verbose", is_flag=True, help="Print every statement and query plan.")
+@click.option("--workload", "names", multiple=True,
+              help="Workload to replay (repeatable): a bench workload, admin_reports or admin_edits; "
+                   "defaults to all of them.")
+@click.option("--requests", default=20, show_default=True, help="Operations per workload.")
+@click.option("--seed", default=1, show_default=True)
+def audit_queries_command(max_rows, verbose, names, requests, seed):
+    """Replay the bench workloads, then run EXPLAIN QUERY PLAN over every statement they issued."""
+    from bench.workloads import AUDIT_WORKLOADS
+
+    unknown = sorted(set(names) - set(AUDIT_WORKLOADS))
+    if unknown:
+        raise click.BadParameter(f"unknown workload(s) {', '.join(unknown)}", param_hint="--workload")
+    statements = replay_workloads(names or sorted(AUDIT_WORKLOADS), requests, seed)
+    results = query_audit.audit(db.engine, statements, max_rows)
+    failed = [r for r in results if r.full_scans]
+    for result in results:
+        status = "FULL SCAN " + ", ".join(result.full_scans) if result.full_scans else "ok"
+        click.echo(f"{result.name:<30} {status}")
+        if verbose or result.full_scans:
+            click.echo("    " + result.statement.replace("\n", "\n    "))
+            for step in result.plan:
+                click.echo(f"    {step}")
+    click.echo(f"{len(results)} distinct statements")
+    if failed:
+        raise click.ClickException(f"{len(failed)} statement(s) scan tables above {max_rows} rows")
+
+@command("rebuild-order-status")
+def rebuild_order_status_command():
+    """Regenerate the current_order_status projection from the full Track log."""
+    count = 0
+    for engine in [db.engine, *franchise_engines()]:
+        with engine.begin() as conn:
+            count += order_status.rebuild(conn)
+    click.echo(f"Rebuilt current status for {count} orders")
+
+@command("rebuild-order-history")
+def rebuild_order_history_command():
+    """Regenerate the customer order history read model from the order tables."""
+    count = 0
+    for engine in [db.engine, *franchise_engines()]:
+        with engine.begin() as conn:
+            count += order_history.rebuild(conn)
+    click.echo(f"Rebuilt order history for {count} orders")
+
+@command("recompute-stats")
+def recompute_stats_command():
+    """Rebuild the dashboard rollup tables from all orders."""
+    customers = 0
+    for engine in [db.engine, *franchise_engines()]:
+        with engine.begin() as conn:
+            customers += stats.recompute(conn)
+    click.echo(f"Recomputed rollups for {customers} customers")
+
+@command("prune-events")
+@click.option("--hours", default=72, show_default=True, help="Keep events newer than this.")
+def prune_events_command(hours):
+    """Delete live events older than the retention window; clients further behind just resync."""
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    deleted = Event.query.filter(Event.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Deleted {deleted} events older than {hours}h")
+
+@command("compress-assets")
+@click.option("--min-bytes", default=static_assets.COMPRESS_MIN_BYTES, show_default=True,
+              help="Leave smaller files uncompressed.")
+def compress_assets_command(min_bytes):
+    """Write .br/.gz copies of the admin build; run after each frontend build, before the workers start."""
+    folder = static_assets.manifest.folder
+    for path, encoding, size in static_assets.compress(folder, min_bytes):
+        click.echo(f"{os.path.relpath(path, folder):<40} {encoding:<5} {size} bytes")
+    if static_assets.brotli is None:
+        click.echo("brotli is not installed; wrote gzip copies only")
+    static_assets.manifest.reload()
+
+@command("bench-serialization")
+@click.option("--rows", default=1000, show_default=True, help="Orders per page to encode.")
+@click.option("--repeat", default=20, show_default=True)
+def bench_serialization_command(rows, repeat):
+    """Compare to_dict() + stdlib JSON with column tuples + compiled encoders on the orders list."""
+    order_by = (Order.created_at.desc(), Order.id.desc())
+
+    def orm_to_dict():
+        db.session.expunge_all()  # measure hydration, not identity-map hits
+        orders = Order.query.order_by(*order_by).limit(rows).all()
+        return serialization.stdlib_dumps([o.to_dict() for o in orders])
+
+    def column_tuples():
+        view = ORDER_SCHEMA.view(ORDER_SCHEMA.project(None), (Order.created_at,))
+        result = db.session.execute(db.select(*view.columns).order_by(*order_by).limit(rows)).all()
+        return current_app.json.dumps(view.serialize(db.session, result))
+
+    for name, best, median in serialization.benchmark(
+        [("to_dict + json", orm_to_dict), ("columns + encoder", column_tuples)], repeat
+    ):
+        click.echo(f"{name:<20} best {best:8.2f} ms   median {median:8.2f} ms")
+
+@command("import-data")
+@click.argument("kind", type=click.Choice(["orders", "customers"]))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(bulk.FORMATS), help="Defaults to the file extension.")
+@click.option("--chunk-size", default=bulk.BULK_CHUNK_SIZE, show_default=True, help="Rows per transaction.")
+@click.option("--franchise", default=tenancy.DEFAULT_FRANCHISE, show_default=True, help="Franchise to import into.")
+def import_data_command(kind, path, fmt, chunk_size, franchise):
+    """Bulk-import orders or customers from a CSV or NDJSON file."""
+    from routes.admin import bulk_importer  # blueprints load only when used
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    if franchise not in tenancy.registry(db.engine, refresh=True):
+        raise click.ClickException(f"Unknown franchise {franchise}")
+    with tenancy.acting_as(franchise), open(path, encoding="utf-8-sig", newline="") as f:
+        importer = bulk_importer(chunk_size)
+        records = bulk.read_records(f, fmt)
+        summary = importer.import_orders(records) if kind == "orders" else importer.import_customers(records)
+    for error in summary["errors"]:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(
+        f"Imported {summary['ordersCreated']} orders and {summary['customersCreated']} customers "
+        f"in {summary['chunks']} chunks; {summary['rejected']} rows rejected"
+    )
+
+@command("export-data")
+@click.argument("kind", type=click.Choice(["orders", "customers"]))
+@click.option("--format", "fmt", type=click.Choice(bulk.FORMATS), default="csv", show_default=True)
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"), default="-", help="Defaults to stdout.")
+@click.option("--franchise", help="Only this franchise's rows (required for a sharded franchise).")
+def export_data_command(kind, fmt, output, franchise):
+    """Stream every order or customer out as CSV or NDJSON."""
+    from routes.admin import bulk_export
+    if franchise and franchise not in tenancy.registry(db.engine, refresh=True):
+        raise click.ClickException(f"Unknown franchise {franchise}")
+    with tenancy.acting_as(franchise):
+        for chunk in bulk_export(kind, fmt):
+            output.write(chunk)
+
+
+# ---------------- FLEET ---------------- #
+@command("plan-routes")
+@click.option("--date", "pickup_date", help="Only orders whose pickup date starts with this (e.g. 2025-06-01).")
+@click.option("--depot", help="lat,lng the vans leave from (defaults to ROUTE_DEPOT).")
+@click.option("--max-stops", default=routing.ROUTE_MAX_STOPS, show_default=True)
+@click.option("--budget", default=routing.ROUTE_BUDGET, show_default=True, help="Seconds to spend improving routes.")
+def plan_routes_command(pickup_date, depot, max_stops, budget):
+    """Plan delivery routes for the pending orders and print them."""
+    from routes.deliveries import plan_routes
+    if depot:
+        depot = tuple(float(part) for part in depot.split(","))
+    try:
+        result = plan_routes(depot or routing.default_depot(), pickup_date, max_stops, budget)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for route in result["routes"]:
+        click.echo(f"{route['vehicleId']:<10} trip {route['trip']:<3} {len(route['orderIds']):>4} stops "
+                   f"{route['distanceKm']:>9.1f} km {route['durationMinutes']:>7.0f} min")
+    click.echo(f"{result['stops']} stops in {len(result['routes'])} routes, {result['distanceKm']:.1f} km "
+               f"({result['elapsedMs']} ms{'' if result['complete'] else ', budget exhausted'}); "
+               f"{result['ungeocoded']} orders without coordinates")
+
+@command("recompute-etas")
+def recompute_etas_command():
+    """Reassign unassigned deliveries to the nearest vehicle and refresh every active ETA."""
+    from routes.deliveries import recompute_etas
+    summary = recompute_etas()
+    click.echo(f"Updated {summary['deliveries']} deliveries ({summary['assigned']} newly assigned) "
+               f"across {summary['vehicles']} vehicles")
@@ -0,0 +1,111 @@
+"""Database engine configuration.
+
+The database comes from `DATABASE_URL` (SQLite by default, PostgreSQL when it
+points at a postgres:// URL). SQLite connections are tuned for several
+gunicorn workers sharing one file: WAL journal so readers never block the
+writer, `synchronous=NORMAL`, a memory map and a busy timeout. Writes that
+still hit a lock are retried with backoff by `transient_retry`.
+"""
+import os
+import random
+import time
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))  # per worker process
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_RETRY_ATTEMPTS = int(os.environ.get("DB_RETRY_ATTEMPTS", "5"))
+DB_RETRY_BASE_DELAY = float(os.environ.get("DB_RETRY_BASE_DELAY", "0.05"))
+
+LOCK_MESSAGES = ("database is locked", "database table is locked", "database is busy")
+# serialization_failure, deadlock_detected
+PG_RETRY_CODES = {"40001", "40P01"}
+
+
+def database_uri(default):
+    uri = os.environ.get("DATABASE_URL", default)
+    # Render/Heroku hand out postgres://, which SQLAlchemy no longer accepts
+    if uri.startswith("postgres://"):
+        uri = "postgresql://" + uri[len("postgres://"):]
+    return uri
+
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for the given database URI."""
+    if uri.startswith("sqlite"):
+        if uri in ("sqlite://", "sqlite:///:memory:"):
+            return {}
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "connect_args": {
+                "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+                "check_same_thread": False,
+            },
+        }
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def install(engine):
+    """Attach connect-time pragmas and make the pool safe to use across fork."""
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas)
+    # a forked gunicorn worker must not reuse the parent's pooled connections
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+
+def dialect_insert(session, table):
+    """INSERT construct with `on_conflict_*` support on SQLite and PostgreSQL, else None."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    return None
+
+
+# ---------------- RETRIES ---------------- #
+def is_transient(exc):
+    orig = getattr(exc, "orig", None)
+    if getattr(orig, "pgcode", None) in PG_RETRY_CODES:
+        return True
+    message = str(orig if orig is not None else exc).lower()
+    return any(m in message for m in LOCK_MESSAGES)
+
+
+def transient_retry(session, attempts=DB_RETRY_ATTEMPTS, base_delay=DB_RETRY_BASE_DELAY):
+    """Decorator that re-runs a handler when its transaction hits a lock or serialization error."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return fn(*args, **kwargs)
+                except DBAPIError as exc:
+                    if attempt == attempts - 1 or not is_transient(exc):
+                        raise
+                    session.rollback()
+                    time.sleep(base_delay * (2 ** attempt) * (1 + random.random()))
+        return wrapper
+    return decorator
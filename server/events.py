@@ -0,0 +1,314 @@
+"""Live order and scan events for SSE and long-poll clients.
+
+Write handlers add rows to the `event` table in the same transaction as the
+change itself (an outbox), so an event exists exactly when its write
+committed, whichever gunicorn worker made it. Each worker runs one poller
+thread, only while it has subscribers, that reads new events by id every
+`EVENT_POLL_INTERVAL` seconds and fans them out to its subscribers' queues.
+An idle subscriber costs a queue and a sleeping thread, not a database
+connection.
+
+Clients filter by `order`, `email`, `worker`, `location` and `type`, on top of
+what they may see: every event carries its order's franchise, admins see their
+franchise's events and customers those of their own orders (routes/live.py).
+Event ids are the resume cursor: SSE clients reconnect with `Last-Event-ID`,
+long-poll clients pass `since`.
+
+Under gthread every open stream or long poll holds one of the worker's
+threads, so at most `EVENT_MAX_THREAD_SUBSCRIBERS` of them are admitted per
+worker. The ASGI app (asgi_app.py) waits with `Subscription.wait_async`
+instead, which costs no thread; only `EVENT_MAX_SUBSCRIBERS` applies there.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+EVENT_POLL_INTERVAL = float(os.environ.get("EVENT_POLL_INTERVAL", "0.5"))
+EVENT_HEARTBEAT = float(os.environ.get("EVENT_HEARTBEAT", "15"))
+EVENT_STREAM_SECONDS = float(os.environ.get("EVENT_STREAM_SECONDS", "300"))
+EVENT_LONG_POLL_SECONDS = float(os.environ.get("EVENT_LONG_POLL_SECONDS", "25"))
+EVENT_MAX_SUBSCRIBERS = int(os.environ.get("EVENT_MAX_SUBSCRIBERS", "2000"))
+# subscribers waiting on a request thread; keep well below gunicorn's --threads
+EVENT_MAX_THREAD_SUBSCRIBERS = int(os.environ.get("EVENT_MAX_THREAD_SUBSCRIBERS", "16"))
+EVENT_QUEUE = 1000
+EVENT_BATCH = 500
+# ids from concurrent PostgreSQL transactions can commit out of order, so the
+# poller re-reads this many ids behind its position and skips the ones it has seen
+EVENT_REWIND = 200
+
+SCAN = "scan"
+ORDER_CREATED = "order.created"
+ORDER_UPDATED = "order.updated"
+ORDER_DELETED = "order.deleted"
+
+# query parameter -> event table column
+FILTERS = {"order": "order_id", "email": "order_email", "worker": "worker_id", "location": "location", "type": "kind"}
+
+log = logging.getLogger("fabclean.events")
+
+Event = namedtuple("Event", "id kind franchise_id order_id order_email worker_id location message frame")
+
+
+class Full(Exception):
+    """Raised when a worker already has EVENT_MAX_SUBSCRIBERS subscribers, or
+    EVENT_MAX_THREAD_SUBSCRIBERS of them waiting on request threads."""
+
+
+# ---------------- RECORDING ---------------- #
+def scan_row(row, created_at):
+    """Event row for an inserted scan (a row as built by scans.validate, after order_status.resolve_orders)."""
+    return {
+        "kind": SCAN,
+        "franchise_id": row["franchise_id"],
+        "order_id": row.get("order_id"),
+        "order_email": row["order_email"],
+        "worker_id": row["worker_id"],
+        "location": row.get("location"),
+        "data": json.dumps({
+            "scanId": row.get("scan_id"),
+            "orderStatus": row["order_status"],
+            "scannedAt": row["scanned_at"].isoformat(),
+        }),
+        "created_at": created_at,
+    }
+
+
+def order_row(kind, order, created_at, franchise_id):
+    """Event row for an order change; `order` is the order's to_dict()."""
+    return {
+        "kind": kind,
+        "franchise_id": franchise_id,
+        "order_id": order["id"],
+        "order_email": order.get("customerEmail"),
+        "worker_id": None,
+        "location": order.get("location"),
+        "data": json.dumps(order),
+        "created_at": created_at,
+    }
+
+
+def record(session, table, rows):
+    """Insert event rows in the caller's transaction."""
+    if rows:
+        session.execute(table.insert(), rows)
+
+
+# ---------------- READING ---------------- #
+def parse_filters(args):
+    filters = {}
+    for param, column in FILTERS.items():
+        value = args.get(param)
+        if value:
+            if param == "worker":
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise ValueError("worker must be an integer")
+            filters[column] = value
+    return filters
+
+
+def parse_cursor(raw, name="since"):
+    if raw in (None, ""):
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an event id")
+
+
+def to_event(row):
+    message = {
+        "id": row.id,
+        "type": row.kind,
+        "orderId": row.order_id,
+        "orderEmail": row.order_email,
+        "workerId": row.worker_id,
+        "location": row.location,
+        "createdAt": row.created_at.isoformat(),
+        "data": json.loads(row.data) if row.data else None,
+    }
+    frame = f"id: {row.id}\nevent: {row.kind}\ndata: {json.dumps(message)}\n\n"
+    return Event(row.id, row.kind, row.franchise_id, row.order_id, row.order_email, row.worker_id, row.location, message, frame)
+
+
+def load(session, table, after_id, filters=None, limit=EVENT_BATCH):
+    """Events with id above `after_id` matching `filters`, oldest first."""
+    query = table.select().where(table.c.id > after_id)
+    for column, value in (filters or {}).items():
+        query = query.where(table.c[column] == value)
+    return [to_event(row) for row in session.execute(query.order_by(table.c.id).limit(limit))]
+
+
+def matches(event, filters):
+    return all(getattr(event, column) == value for column, value in filters.items())
+
+
+# ---------------- FAN-OUT ---------------- #
+class Subscription:
+    def __init__(self, filters, after_id, threaded=True):
+        self.filters = filters
+        # only events after the client's cursor are delivered
+        self.after_id = after_id
+        self.threaded = threaded
+        self.overflowed = False
+        self._queue = deque()
+        self._ready = threading.Condition()
+        self._wake = None  # set while a coroutine waits in wait_async
+
+    def push(self, event):
+        with self._ready:
+            if len(self._queue) >= EVENT_QUEUE:
+                # a client this far behind reconnects and replays from its cursor
+                self.overflowed = True
+            else:
+                self._queue.append(event)
+            self._ready.notify()
+            if self._wake is not None:
+                self._wake()
+
+    def wait(self, timeout):
+        """Drain queued events, waiting up to `timeout` seconds for the first one."""
+        with self._ready:
+            if not self._queue and not self.overflowed:
+                self._ready.wait(timeout)
+            return self._drain()
+
+    async def wait_async(self, timeout):
+        """`wait` for coroutines: the event loop is woken by `push`, no thread sleeps."""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        with self._ready:
+            if self._queue or self.overflowed:
+                return self._drain()
+            self._wake = lambda: loop.call_soon_threadsafe(ready.set)
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._ready:
+                self._wake = None
+        with self._ready:
+            return self._drain()
+
+    def _drain(self):
+        events = list(self._queue)
+        self._queue.clear()
+        return events
+
+
+class Hub:
+    """Per-process fan-out of new events to subscribers.
+
+    `load_after(after_id, limit)` and `latest_id()` read the event table in
+    their own app context; they run on the poller thread.
+    """
+
+    def __init__(self, load_after, latest_id, poll_interval=EVENT_POLL_INTERVAL):
+        self.load_after = load_after
+        self.latest_id = latest_id
+        self.poll_interval = poll_interval
+        self.last_id = None
+        self._subscribers = set()
+        self._seen = deque(maxlen=EVENT_REWIND * 4)
+        self._lock = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def subscribe(self, filters, after_id, threaded=True):
+        """Register a subscriber; `threaded` ones hold a request thread while they wait."""
+        with self._lock:
+            if len(self._subscribers) >= EVENT_MAX_SUBSCRIBERS:
+                raise Full()
+            if threaded and sum(s.threaded for s in self._subscribers) >= EVENT_MAX_THREAD_SUBSCRIBERS:
+                raise Full()
+            # threads do not survive fork, so gunicorn workers each start their own poller
+            if self._thread is None or self._pid != os.getpid():
+                self._subscribers = set()
+                self.last_id = None
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="event-hub", daemon=True)
+                self._thread.start()
+            subscription = Subscription(filters, after_id, threaded)
+            self._subscribers.add(subscription)
+            self._lock.notify()
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _poll(self):
+        if self.last_id is None:
+            self.last_id = self.latest_id()
+        seen = set(self._seen)
+        events = [e for e in self.load_after(max(0, self.last_id - EVENT_REWIND), EVENT_BATCH) if e.id not in seen]
+        if not events:
+            return 0
+        self.last_id = max(self.last_id, events[-1].id)
+        self._seen.extend(e.id for e in events)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event in events:
+            for subscription in subscribers:
+                if event.id > subscription.after_id and matches(event, subscription.filters):
+                    subscription.push(event)
+        return len(events)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._subscribers:
+                    # nothing to deliver; pick up from the latest event when someone subscribes
+                    self.last_id = None
+                    self._lock.wait()
+            try:
+                if self._poll() >= EVENT_BATCH - EVENT_REWIND:
+                    continue  # more are waiting
+            except Exception:
+                log.exception("event poll failed")
+            time.sleep(self.poll_interval)
+
+
+# ---------------- STREAMS ---------------- #
+def sse_stream(hub, subscription, replay):
+    """Yield SSE frames: the replayed backlog, then live events, with heartbeats."""
+    replayed = {event.id for event in replay}
+    deadline = time.monotonic() + EVENT_STREAM_SECONDS
+    try:
+        yield f"retry: {int(EVENT_POLL_INTERVAL * 2000)}\n\n"
+        for event in replay:
+            yield event.frame
+        while time.monotonic() < deadline and not subscription.overflowed:
+            events = subscription.wait(EVENT_HEARTBEAT)
+            if not events:
+                yield ": keepalive\n\n"
+            for event in events:
+                if event.id not in replayed:
+                    yield event.frame
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def sse_stream_async(hub, subscription, replay):
+    """`sse_stream` for the ASGI app, waiting on the event loop instead of a thread."""
+    replayed = {event.id for event in replay}
+    deadline = time.monotonic() + EVENT_STREAM_SECONDS
+    try:
+        yield f"retry: {int(EVENT_POLL_INTERVAL * 2000)}\n\n"
+        for event in replay:
+            yield event.frame
+        while time.monotonic() < deadline and not subscription.overflowed:
+            events = await subscription.wait_async(EVENT_HEARTBEAT)
+            if not events:
+                yield ": keepalive\n\n"
+            for event in events:
+                if event.id not in replayed:
+                    yield event.frame
+    finally:
+        hub.unsubscribe(subscription)
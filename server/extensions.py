@@ -1,4 +1,16 @@
+"""Extension instances shared by the models, blueprints and commands.
+
+They are created unbound and attached to the app in `create_app`, so there is
+exactly one SQLAlchemy instance (and one metadata registry) whichever module
+imports them first. Sessions pick a sharded franchise's database per request
+(see tenancy.py).
+"""
+from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+import db_engine
+import tenancy
 
+db = SQLAlchemy(session_options={"class_": tenancy.TenantSession})
+jwt = JWTManager()
+db_retry = db_engine.transient_retry(db.session)
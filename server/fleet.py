@@ -0,0 +1,125 @@
+"""Vehicles, shipments and delivery ETAs.
+
+A shipment groups orders that leave together under one Unified Tracking ID
+(UTI) and is carried out by a delivery, which a vehicle is assigned to.
+
+`recompute_etas` refreshes every active delivery in one pass: it reads the
+active deliveries and vehicles as column tuples, computes the great-circle
+distance from each delivery to every vehicle with numpy (in blocks of
+`ETA_BLOCK` deliveries so the matrix stays small), assigns unassigned
+deliveries to their nearest vehicle and writes all ETAs back with a single
+executemany UPDATE.
+"""
+import os
+import uuid
+from datetime import timedelta
+
+import numpy as np
+from sqlalchemy import bindparam, select
+
+PENDING = "pending"
+IN_TRANSIT = "in_transit"
+DELIVERED = "delivered"
+CANCELLED = "cancelled"
+STATUSES = (PENDING, IN_TRANSIT, DELIVERED, CANCELLED)
+ACTIVE = (PENDING, IN_TRANSIT)
+
+FLEET_SPEED_KMH = float(os.environ.get("FLEET_SPEED_KMH", "25"))
+# straight-line distance understates the road distance in a city
+FLEET_ROAD_FACTOR = float(os.environ.get("FLEET_ROAD_FACTOR", "1.3"))
+FLEET_STOP_MINUTES = float(os.environ.get("FLEET_STOP_MINUTES", "5"))
+ETA_BLOCK = 4096
+EARTH_RADIUS_KM = 6371.0
+
+
+def new_uti():
+    return "UTI-" + uuid.uuid4().hex[:10].upper()
+
+
+def parse_position(data):
+    """(lat, lng) from a JSON body, (None, None) when absent; ValueError when malformed."""
+    lat, lng = data.get("lat"), data.get("lng")
+    if lat is None and lng is None:
+        return None, None
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValueError("lat and lng must both be numbers")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat/lng out of range")
+    return lat, lng
+
+
+# ---------------- DISTANCES ---------------- #
+def distance_km(lat1, lng1, lat2, lng2):
+    """Haversine distance between points in radians; broadcasts like any numpy ufunc."""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def travel_seconds(km, speed_kmh):
+    return km * FLEET_ROAD_FACTOR / speed_kmh * 3600 + FLEET_STOP_MINUTES * 60
+
+
+# ---------------- ETA JOB ---------------- #
+def recompute_etas(session, deliveries, vehicles, now):
+    """Assign and re-estimate every active delivery with a position; the caller commits.
+
+    Deliveries assigned to a vehicle that is inactive or has no position keep
+    their current estimate.
+    """
+    d, v = deliveries.c, vehicles.c
+    fleet = session.execute(
+        select(v.id, v.driver_name, v.lat, v.lng, v.speed_kmh)
+        .where(v.active.is_(True), v.lat.is_not(None), v.lng.is_not(None))
+        .order_by(v.id)
+    ).all()
+    active = session.execute(
+        select(d.id, d.vehicle_id, d.lat, d.lng)
+        .where(d.status.in_(ACTIVE), d.lat.is_not(None), d.lng.is_not(None))
+    ).all()
+    summary = {"deliveries": 0, "assigned": 0, "vehicles": len(fleet)}
+    if not fleet or not active:
+        return summary
+
+    index = {row.id: i for i, row in enumerate(fleet)}
+    v_lat = np.radians(np.fromiter((row.lat for row in fleet), float, len(fleet)))
+    v_lng = np.radians(np.fromiter((row.lng for row in fleet), float, len(fleet)))
+    speeds = np.fromiter((row.speed_kmh or FLEET_SPEED_KMH for row in fleet), float, len(fleet))
+
+    # -1: unassigned, -2: assigned to a vehicle we cannot place
+    current = np.fromiter(
+        (-1 if row.vehicle_id is None else index.get(row.vehicle_id, -2) for row in active), int, len(active)
+    )
+    keep = current != -2
+    ids = np.fromiter((row.id for row in active), int, len(active))[keep]
+    current = current[keep]
+    d_lat = np.radians(np.fromiter((row.lat for row in active), float, len(active)))[keep]
+    d_lng = np.radians(np.fromiter((row.lng for row in active), float, len(active)))[keep]
+
+    params = []
+    for start in range(0, len(ids), ETA_BLOCK):
+        block = slice(start, start + ETA_BLOCK)
+        matrix = distance_km(d_lat[block, None], d_lng[block, None], v_lat[None, :], v_lng[None, :])
+        chosen = np.where(current[block] == -1, matrix.argmin(axis=1), current[block])
+        seconds = travel_seconds(matrix[np.arange(len(chosen)), chosen], speeds[chosen])
+        for delivery_id, vehicle, eta in zip(ids[block].tolist(), chosen.tolist(), seconds.tolist()):
+            params.append({
+                "b_id": delivery_id,
+                "b_vehicle": fleet[vehicle].id,
+                "b_driver": fleet[vehicle].driver_name,
+                "b_eta": now + timedelta(seconds=eta),
+            })
+        summary["assigned"] += int((current[block] == -1).sum())
+
+    if not params:  # every active delivery is on a vehicle we cannot place
+        return summary
+    session.execute(
+        deliveries.update()
+        .where(d.id == bindparam("b_id"))
+        .values(vehicle_id=bindparam("b_vehicle"), driver_name=bindparam("b_driver"),
+                estimated_delivery=bindparam("b_eta")),
+        params,
+    )
+    summary["deliveries"] = len(params)
+    return summary
@@ -0,0 +1,222 @@
+"""Request instrumentation: latency histograms, SQL counts, phase timings.
+
+`install` hooks Flask's request signals and the engine's cursor events. Each
+request accumulates its statement count and the time spent in the database
+and in the phases wrapped with `phase()` (JSON encoding, barcode rendering);
+when it finishes the totals go into per-endpoint histograms, rendered in the
+Prometheus text format by `render`. Metrics are per process, so under
+gunicorn each worker reports its own series (the output names its pid).
+
+Statements slower than `SLOW_QUERY_MS` are logged to the `fabclean.slow_query`
+logger. With `PROFILE_SAMPLE_RATE` above 0, that fraction of requests runs
+under cProfile and the stats of those slower than `PROFILE_SLOW_MS` are
+dumped to `PROFILE_DIR` for `python -m pstats` or snakeviz.
+"""
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import request, request_finished, request_started
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "500"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+slow_query_log = logging.getLogger("fabclean.slow_query")
+
+
+# ---------------- METRIC TYPES ---------------- #
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}" if names else ""
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                yield f"{self.name}{_labels(self.labelnames, labels)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    yield f"{self.name}_bucket{_labels(names, labels + (f'{bound:g}',))} {count}"
+                yield f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {series[-1]}"
+                yield f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]:.6f}"
+                yield f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}"
+
+
+REQUESTS = Counter("http_requests_total", "Requests handled.", ("endpoint", "method", "status"))
+LATENCY = Histogram("http_request_duration_seconds", "Time to build the response.", ("endpoint", "method"))
+STATEMENTS = Histogram(
+    "db_statements_per_request", "SQL statements executed per request.", ("endpoint",), STATEMENT_BUCKETS
+)
+PHASES = Histogram(
+    "request_phase_seconds", "Time per request spent in db, serialization and barcode work.", ("endpoint", "phase")
+)
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS.", ("endpoint",))
+PROFILED = Counter("profiled_requests_total", "Sampled slow requests dumped to PROFILE_DIR.", ("endpoint",))
+
+REGISTRY = [REQUESTS, LATENCY, STATEMENTS, PHASES, SLOW_QUERIES, PROFILED]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = [f"# fabclean worker pid {os.getpid()}"]
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- PER-REQUEST STATE ---------------- #
+class RequestStats:
+    __slots__ = ("started", "statements", "phases", "profiler")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.phases = {"db": 0.0}
+        self.profiler = None
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to the current request's `name` phase."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.phases[name] = stats.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+
+def _request_started(_app, **_extra):
+    stats = RequestStats()
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            stats.profiler = profiler
+        except ValueError:
+            pass  # another thread's profiler is active (Python 3.12+ allows only one)
+    _current.set(stats)
+
+
+def _request_finished(_app, response, **_extra):
+    stats = _current.get()
+    if stats is None:
+        return
+    _current.set(None)
+    elapsed = time.perf_counter() - stats.started
+    endpoint = _endpoint()
+
+    REQUESTS.inc((endpoint, request.method, str(response.status_code)))
+    LATENCY.observe((endpoint, request.method), elapsed)
+    STATEMENTS.observe((endpoint,), stats.statements)
+    for name, seconds in stats.phases.items():
+        PHASES.observe((endpoint, name), seconds)
+
+    if stats.profiler is not None:
+        stats.profiler.disable()
+        if elapsed * 1000 >= PROFILE_SLOW_MS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = f"{endpoint}-{int(time.time() * 1000)}-{os.getpid()}-{elapsed * 1000:.0f}ms.prof"
+            stats.profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+            PROFILED.inc((endpoint,))
+
+
+# ---------------- SQL EVENTS ---------------- #
+def _before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, _cursor, statement, _parameters, _context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.phases["db"] += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        endpoint = _endpoint() if stats is not None else "background"
+        SLOW_QUERIES.inc((endpoint,))
+        slow_query_log.warning(
+            "%.1f ms%s [%s] %s", elapsed * 1000, " (executemany)" if executemany else "", endpoint, statement
+        )
+
+
+def _handle_error(context):
+    # failed statements never reach after_cursor_execute
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def install(app, engine):
+    request_started.connect(_request_started, app, weak=False)
+    request_finished.connect(_request_finished, app, weak=False)
+    watch(engine)
+
+
+def watch(engine):
+    """Count and time the SQL an engine runs for the current request (e.g. asgi_app.py's async engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,297 @@
+"""Versioned schema migrations.
+
+`db.create_all()` only creates missing tables. Anything that has to touch an
+existing database (backfills, new columns, indexes) is registered here and
+applied once, in order, tracked in the `schema_version` table.
+"""
+from sqlalchemy import inspect, text
+
+import order_history
+import order_status
+import stats
+import tenancy
+
+MIGRATIONS = []
+
+
+def migration(version):
+    def register(fn):
+        MIGRATIONS.append((version, fn))
+        return fn
+    return register
+
+
+# ---------------- HELPERS ---------------- #
+def has_column(conn, table, column):
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def has_unique_constraint(conn, table, name):
+    return any(c["name"] == name for c in inspect(conn).get_unique_constraints(table))
+
+
+def add_column_if_missing(conn, table, column, ddl):
+    # fresh databases already get the column from create_all
+    if not has_column(conn, table, column):
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+
+def rebuild_sqlite_table(conn, table, create, indexes=()):
+    """Copy `table` into a new one, for constraint changes SQLite cannot ALTER.
+
+    `create` is the CREATE TABLE statement for `<table>_new`; it must have every
+    column of the old table. Indexes are dropped with the old table, so pass
+    their CREATE INDEX statements.
+    """
+    columns = ", ".join(f'"{c["name"]}"' for c in inspect(conn).get_columns(table))
+    conn.execute(text(create))
+    conn.execute(text(f'INSERT INTO "{table}_new" ({columns}) SELECT {columns} FROM "{table}"'))
+    conn.execute(text(f'DROP TABLE "{table}"'))
+    conn.execute(text(f'ALTER TABLE "{table}_new" RENAME TO "{table}"'))
+    for ddl in indexes:
+        conn.execute(text(ddl))
+
+
+# ---------------- RUNNER ---------------- #
+def current_version(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    row = conn.execute(text("SELECT MAX(version) FROM schema_version")).first()
+    return row[0] or 0
+
+
+def upgrade(engine):
+    """Apply pending migrations in one transaction; returns the versions applied."""
+    applied = []
+    with engine.begin() as conn:
+        version = current_version(conn)
+        for target, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if target <= version:
+                continue
+            fn(conn)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": target})
+            applied.append(target)
+    return applied
+
+
+# ---------------- MIGRATIONS ---------------- #
+@migration(1)
+def order_items_from_joined_columns(conn):
+    """Move comma-joined order.service_id/service_name into order_items rows."""
+    if not has_column(conn, "order", "service_id"):
+        return
+    prices = dict(conn.execute(text("SELECT id, price FROM service")).all())
+    rows = conn.execute(text('SELECT id, service_id, service_name FROM "order" WHERE service_id IS NOT NULL'))
+    items = []
+    for order_id, joined_ids, joined_names in rows:
+        ids = [s.strip() for s in joined_ids.split(",") if s.strip()]
+        names = joined_names.split(",") if joined_names else []
+        seen = set()
+        for position, service_id in enumerate(ids):
+            if service_id in seen:
+                continue
+            seen.add(service_id)
+            items.append({
+                "order_id": order_id,
+                "service_id": service_id,
+                "service_name": names[position] if position < len(names) else "",
+                "price": prices.get(service_id, 0),
+                "position": position,
+            })
+    if items:
+        conn.execute(
+            text(
+                "INSERT INTO order_items (order_id, service_id, service_name, price, position) "
+                "VALUES (:order_id, :service_id, :service_name, :price, :position)"
+            ),
+            items,
+        )
+    # the legacy columns stay (SQLite cannot drop a column used by a foreign key)
+    # but nothing reads them any more
+
+
+@migration(2)
+def hot_lookup_indexes(conn):
+    """Indexes for email lookups, worker scan history and created_at ordering."""
+    for ddl in (
+        'CREATE INDEX IF NOT EXISTS ix_order_email_created ON "order" (customer_email, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_order_created ON "order" (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_order_total ON "order" (total, id)',
+        "CREATE INDEX IF NOT EXISTS ix_track_email_id ON track (order_email, id)",
+        "CREATE INDEX IF NOT EXISTS ix_track_worker_scanned ON track (worker_id, scanned_at)",
+        "CREATE INDEX IF NOT EXISTS ix_customer_created ON customer (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_customer_name ON customer (name, id)",
+    ):
+        conn.execute(text(ddl))
+
+
+@migration(3)
+def track_scan_ids(conn):
+    """Client-generated scan IDs so worker devices can re-upload batches idempotently."""
+    add_column_if_missing(conn, "track", "scan_id", "VARCHAR(64)")
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_track_scan_id ON track (scan_id)"))
+
+
+@migration(4)
+def current_order_status(conn):
+    """Tie scans to orders and build the current_order_status projection."""
+    add_column_if_missing(conn, "track", "order_id", "VARCHAR(20)")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_track_order_scanned ON track (order_id, scanned_at, id)"))
+    # older scans only carry the email: attribute them to the customer's latest order at scan time
+    conn.execute(text(
+        'UPDATE track SET order_id = (SELECT o.id FROM "order" o '
+        "WHERE o.customer_email = track.order_email AND o.created_at <= track.scanned_at "
+        "ORDER BY o.created_at DESC LIMIT 1) "
+        "WHERE order_id IS NULL"
+    ))
+    order_status.rebuild(conn)
+
+
+@migration(5)
+def dashboard_rollups(conn):
+    """Backfill the revenue, service and customer rollup tables."""
+    stats.recompute(conn)
+
+
+@migration(6)
+def order_shipments(conn):
+    """Orders grouped into shipments for delivery."""
+    add_column_if_missing(conn, "order", "shipment_id", "VARCHAR(20)")
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_order_shipment ON "order" (shipment_id)'))
+
+
+@migration(7)
+def order_addresses(conn):
+    """Geocoded order addresses for route planning."""
+    add_column_if_missing(conn, "order", "address", "VARCHAR(255)")
+    add_column_if_missing(conn, "order", "lat", "FLOAT")
+    add_column_if_missing(conn, "order", "lng", "FLOAT")
+
+
+@migration(8)
+def franchise_keys(conn):
+    """Franchise key on the store tables, with indexes leading on it, and per-franchise rollups."""
+    default = tenancy.DEFAULT_FRANCHISE.replace("'", "''")
+    for table in ("order", "customer", "service", "track", "current_order_status"):
+        add_column_if_missing(conn, table, "franchise_id", f"VARCHAR(20) NOT NULL DEFAULT '{default}'")
+    for ddl in (
+        'CREATE INDEX IF NOT EXISTS ix_order_franchise_created ON "order" (franchise_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_order_franchise_email ON "order" (franchise_id, customer_email, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_order_franchise_total ON "order" (franchise_id, total, id)',
+        "CREATE INDEX IF NOT EXISTS ix_customer_franchise_created ON customer (franchise_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_customer_franchise_name ON customer (franchise_id, name, id)",
+        "CREATE INDEX IF NOT EXISTS ix_service_franchise_name ON service (franchise_id, name, id)",
+        "CREATE INDEX IF NOT EXISTS ix_track_franchise_worker ON track (franchise_id, worker_id, scanned_at)",
+        "CREATE INDEX IF NOT EXISTS ix_cos_franchise_location_status "
+        "ON current_order_status (franchise_id, location, status)",
+        "CREATE INDEX IF NOT EXISTS ix_cos_franchise_status_scanned "
+        "ON current_order_status (franchise_id, status, scanned_at)",
+    ):
+        conn.execute(text(ddl))
+
+    # the rollup keys gain the franchise; they are derived data, so rebuild them
+    if has_column(conn, "revenue_rollup", "franchise_id"):
+        return
+    for table in ("revenue_rollup", "service_rollup", "customer_rollup"):
+        conn.execute(text(f"DROP TABLE {table}"))
+    conn.execute(text(
+        "CREATE TABLE revenue_rollup (franchise_id VARCHAR(20) NOT NULL, period VARCHAR(5) NOT NULL, "
+        "bucket DATE NOT NULL, order_count INTEGER NOT NULL, revenue FLOAT NOT NULL, "
+        "PRIMARY KEY (franchise_id, period, bucket))"
+    ))
+    conn.execute(text(
+        "CREATE TABLE service_rollup (franchise_id VARCHAR(20) NOT NULL, service_id VARCHAR(20) NOT NULL, "
+        "order_count INTEGER NOT NULL, revenue FLOAT NOT NULL, PRIMARY KEY (franchise_id, service_id))"
+    ))
+    conn.execute(text(
+        "CREATE TABLE customer_rollup (franchise_id VARCHAR(20) NOT NULL, customer_email VARCHAR(120) NOT NULL, "
+        "order_count INTEGER NOT NULL, revenue FLOAT NOT NULL, PRIMARY KEY (franchise_id, customer_email))"
+    ))
+    conn.execute(text("CREATE INDEX ix_customer_rollup_revenue ON customer_rollup (revenue)"))
+    conn.execute(text(
+        "CREATE INDEX ix_customer_rollup_franchise_revenue ON customer_rollup (franchise_id, revenue)"
+    ))
+    stats.recompute(conn)
+
+
+@migration(9)
+def order_customers(conn):
+    """Link orders to their customer by id, for token ownership checks."""
+    add_column_if_missing(conn, "order", "customer_id", "INTEGER REFERENCES customer (id) ON DELETE SET NULL")
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_order_customer_created ON "order" (customer_id, created_at, id)'
+    ))
+    conn.execute(text(
+        'UPDATE "order" SET customer_id = (SELECT c.id FROM customer c WHERE c.email = "order".customer_email) '
+        "WHERE customer_id IS NULL"
+    ))
+
+
+@migration(10)
+def customer_order_history(conn):
+    """Build the per-customer order history read model."""
+    order_history.rebuild(conn)
+
+
+CUSTOMER_INDEXES = (
+    "CREATE INDEX ix_customer_created ON customer (created_at, id)",
+    "CREATE INDEX ix_customer_name ON customer (name, id)",
+    "CREATE INDEX ix_customer_franchise_created ON customer (franchise_id, created_at, id)",
+    "CREATE INDEX ix_customer_franchise_name ON customer (franchise_id, name, id)",
+)
+
+
+@migration(11)
+def customer_ids_never_reused(conn):
+    """Release orders of deleted customers and stop SQLite from handing their ids out again."""
+    conn.execute(text(
+        'UPDATE "order" SET customer_id = NULL '
+        "WHERE customer_id IS NOT NULL AND customer_id NOT IN (SELECT id FROM customer)"
+    ))
+    # PostgreSQL sequences never go back; SQLite reuses the highest rowid unless the key is AUTOINCREMENT
+    if conn.dialect.name != "sqlite":
+        return
+    create = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'customer'")).scalar()
+    if "AUTOINCREMENT" in create.upper():  # created by create_all from the current model
+        return
+    default = tenancy.DEFAULT_FRANCHISE.replace("'", "''")
+    rebuild_sqlite_table(conn, "customer", (
+        "CREATE TABLE customer_new (id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "name VARCHAR(100) NOT NULL, email VARCHAR(120) NOT NULL, phone VARCHAR(20), "
+        "password_hash VARCHAR(256) NOT NULL, created_at DATETIME, "
+        f"franchise_id VARCHAR(20) NOT NULL DEFAULT '{default}', UNIQUE (email))"
+    ), CUSTOMER_INDEXES)
+
+
+@migration(12)
+def customer_email_per_franchise(conn):
+    """Customer emails are unique per franchise, not across the whole database."""
+    if conn.dialect.name != "sqlite":
+        if has_unique_constraint(conn, "customer", "uq_customer_franchise_email"):
+            return  # created by create_all from the current model
+        conn.execute(text("ALTER TABLE customer DROP CONSTRAINT IF EXISTS customer_email_key"))
+        conn.execute(text(
+            "ALTER TABLE customer ADD CONSTRAINT uq_customer_franchise_email UNIQUE (franchise_id, email)"
+        ))
+        return
+    create = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'customer'")).scalar()
+    if "uq_customer_franchise_email" in create:  # created by create_all from the current model
+        return
+    default = tenancy.DEFAULT_FRANCHISE.replace("'", "''")
+    rebuild_sqlite_table(conn, "customer", (
+        "CREATE TABLE customer_new (id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "name VARCHAR(100) NOT NULL, email VARCHAR(120) NOT NULL, phone VARCHAR(20), "
+        "password_hash VARCHAR(256) NOT NULL, created_at DATETIME, "
+        f"franchise_id VARCHAR(20) NOT NULL DEFAULT '{default}', "
+        "CONSTRAINT uq_customer_franchise_email UNIQUE (franchise_id, email))"
+    ), CUSTOMER_INDEXES)
+
+
+@migration(13)
+def event_franchises(conn):
+    """Tag live events with their order's franchise, so subscribers only see their own."""
+    add_column_if_missing(conn, "event", "franchise_id", "VARCHAR(20)")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_event_franchise ON event (franchise_id, id)"))
+    conn.execute(text(
+        'UPDATE event SET franchise_id = (SELECT o.franchise_id FROM "order" o WHERE o.id = event.order_id) '
+        "WHERE franchise_id IS NULL"
+    ))
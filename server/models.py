@@ -1,21 +1,477 @@
-from app import db
+"""SQLAlchemy models; every table is registered on the `db` in extensions.py."""
+import json
+import uuid
 from datetime import datetime
 
-class Delivery(db.Model):
+from extensions import db
+import admin_sessions
+import fleet
+import passwords
+import response_cache
+import tenancy
+
+class FranchiseScoped:
+    """Rows owned by one franchise; ORM queries are scoped to the request's franchise."""
+    franchise_id = db.Column(db.String(20), nullable=False, default=tenancy.current_franchise)
+
+class Franchise(db.Model):
+    """A store. `database` is set for franchises sharded onto their own database file."""
+    id = db.Column(db.String(20), primary_key=True)  # slug, e.g. "main" or "pune-east"
+    name = db.Column(db.String(120), nullable=False)
+    database = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "sharded": self.database is not None,
+            "createdAt": self.created_at.isoformat(),
+        }
+
+class AdminAccount(db.Model):
+    """An admin login. Owners have a `franchise_id` and only see that store; super admins have none."""
+    __tablename__ = "admin_account"
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(256), nullable=False)
+    franchise_id = db.Column(db.String(20), db.ForeignKey("franchise.id"))
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def set_password(self, raw):
+        self.password_hash = passwords.hash_password(raw)
+
+    def check_password(self, raw):
+        if not passwords.verify(self.password_hash, raw):
+            return False
+        if passwords.needs_rehash(self.password_hash):
+            self.set_password(raw)
+        return True
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "username": self.username,
+            "franchise": self.franchise_id,
+            "active": self.active,
+            "createdAt": self.created_at.isoformat(),
+        }
+
+class AdminSession(db.Model):
+    """A logged-in admin (see admin_sessions.py); `id` is the SHA-256 of the cookie token."""
+    __tablename__ = "admin_session"
+    id = db.Column(db.String(64), primary_key=True)
+    admin_id = db.Column(db.Integer, db.ForeignKey("admin_account.id", ondelete="CASCADE"), nullable=False)
+    username = db.Column(db.String(80), nullable=False)
+    franchise_id = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_admin_session_admin", "admin_id"),
+        db.Index("ix_admin_session_expires", "expires_at"),
+    )
+
+admin_sessions.configure(admin_sessions.TableBackend(lambda: db.engine, AdminSession.__table__))
+
+class Worker(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(120), unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "email": self.email,
+            "createdAt": self.created_at.isoformat(),
+        }
+
+class Track(FranchiseScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    vehicle_id = db.Column(db.String(50), nullable=False)
+    worker_id = db.Column(db.Integer, nullable=False)      # ID of worker who scanned
+    order_email = db.Column(db.String(120), nullable=False) # Email from order
+    order_status = db.Column(db.String(50), nullable=False) # e.g., "Picked Up", "Delivered"
+    location = db.Column(db.String(100))                  # optional location info
+    scanned_at = db.Column(db.DateTime, default=datetime.utcnow)
+    scan_id = db.Column(db.String(64))                       # client-generated, for idempotent uploads
+    order_id = db.Column(db.String(20))                      # scanned order (latest order for the email if not sent)
+
+    __table_args__ = (
+        db.Index("ix_track_email_id", "order_email", "id"),
+        db.Index("ix_track_worker_scanned", "worker_id", "scanned_at"),
+        db.Index("ix_track_scan_id", "scan_id", unique=True),
+        db.Index("ix_track_order_scanned", "order_id", "scanned_at", "id"),
+        db.Index("ix_track_franchise_worker", "franchise_id", "worker_id", "scanned_at"),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "workerId": self.worker_id,
+            "orderEmail": self.order_email,
+            "orderStatus": self.order_status,
+            "location": self.location,
+            "scannedAt": self.scanned_at.isoformat(),
+            "scanId": self.scan_id,
+            "orderId": self.order_id,
+        }
+
+
+class Service(FranchiseScoped, db.Model):
+    id = db.Column(db.String(20), primary_key=True, default=lambda: str(uuid.uuid4())[:8])
+    name = db.Column(db.String(120), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    duration = db.Column(db.String(50))
+    status = db.Column(db.String(50), default="Active")
+    usage_count = db.Column(db.Integer, default=0)
+
+    __table_args__ = (db.Index("ix_service_franchise_name", "franchise_id", "name", "id"),)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "price": self.price,
+            "duration": self.duration,
+            "status": self.status,
+            "usage_count": self.usage_count,
+        }
+
+class Customer(FranchiseScoped, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(120), nullable=False)  # unique within a franchise
+    phone = db.Column(db.String(20))
+    password_hash = db.Column(db.String(256), nullable=False, default=passwords.NO_PASSWORD)  # empty until signup
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_customer_created", "created_at", "id"),
+        db.Index("ix_customer_name", "name", "id"),
+        db.Index("ix_customer_franchise_created", "franchise_id", "created_at", "id"),
+        db.Index("ix_customer_franchise_name", "franchise_id", "name", "id"),
+        db.UniqueConstraint("franchise_id", "email", name="uq_customer_franchise_email"),
+        # ids are token subjects and order owners, so a deleted customer's id is never handed out again
+        {"sqlite_autoincrement": True},
+    )
+
+    @property
+    def has_password(self):
+        return self.password_hash != passwords.NO_PASSWORD
+
+    def set_password(self, raw):
+        self.password_hash = passwords.hash_password(raw)
+
+    def check_password(self, raw):
+        if not passwords.verify(self.password_hash, raw):
+            return False
+        if passwords.needs_rehash(self.password_hash):
+            self.set_password(raw)
+        return True
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "email": self.email,
+            "phone": self.phone,
+            "invited": not self.has_password,
+            "createdAt": self.created_at.isoformat(),
+        }
+
+class OrderItem(db.Model):
+    """One service on an order; name and price are snapshotted at order time."""
+    __tablename__ = "order_items"
+    order_id = db.Column(db.String(20), db.ForeignKey("order.id", ondelete="CASCADE"), primary_key=True)
+    service_id = db.Column(db.String(20), db.ForeignKey("service.id"), primary_key=True)
+    service_name = db.Column(db.String(120), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0)
+
+    # the primary key already covers lookups by order; this one serves "orders containing service X"
+    __table_args__ = (db.Index("ix_order_items_service_order", "service_id", "order_id"),)
+
+class CurrentOrderStatus(FranchiseScoped, db.Model):
+    """Latest scan per order, maintained alongside every Track insert (see order_status.py)."""
+    __tablename__ = "current_order_status"
+    order_id = db.Column(db.String(20), db.ForeignKey("order.id", ondelete="CASCADE"), primary_key=True)
+    order_email = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    location = db.Column(db.String(100))
+    worker_id = db.Column(db.Integer, nullable=False)
+    scanned_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_cos_location_status", "location", "status"),
+        db.Index("ix_cos_status_scanned", "status", "scanned_at"),
+        db.Index("ix_cos_franchise_location_status", "franchise_id", "location", "status"),
+        db.Index("ix_cos_franchise_status_scanned", "franchise_id", "status", "scanned_at"),
+    )
+
+    def to_dict(self):
+        return {
+            "orderId": self.order_id,
+            "orderEmail": self.order_email,
+            "status": self.status,
+            "location": self.location,
+            "workerId": self.worker_id,
+            "scannedAt": self.scanned_at.isoformat(),
+        }
+
+class CacheVersion(db.Model):
+    """Version stamp per cached endpoint (see response_cache.py)."""
+    __tablename__ = "cache_version"
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+class Event(db.Model):
+    """Outbox of scans and order changes for live clients (see events.py)."""
+    __tablename__ = "event"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    franchise_id = db.Column(db.String(20))  # the order's franchise; who may see the event
+    order_id = db.Column(db.String(20))
+    order_email = db.Column(db.String(120))
+    worker_id = db.Column(db.Integer)
+    location = db.Column(db.String(100))
+    data = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_event_order", "order_id", "id"),
+        db.Index("ix_event_email", "order_email", "id"),
+        db.Index("ix_event_created", "created_at"),
+        db.Index("ix_event_franchise", "franchise_id", "id"),
+    )
+
+class RevenueRollup(FranchiseScoped, db.Model):
+    """Orders and revenue per franchise and day/week/month bucket (see stats.py)."""
+    __tablename__ = "revenue_rollup"
+    franchise_id = db.Column(db.String(20), primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)   # day, week or month
+    bucket = db.Column(db.Date, primary_key=True)        # first day of the bucket
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+    def to_dict(self):
+        return {"bucket": self.bucket.isoformat(), "orders": self.order_count, "revenue": self.revenue}
+
+class ServiceRollup(FranchiseScoped, db.Model):
+    __tablename__ = "service_rollup"
+    franchise_id = db.Column(db.String(20), primary_key=True)
+    service_id = db.Column(db.String(20), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+class CustomerRollup(FranchiseScoped, db.Model):
+    __tablename__ = "customer_rollup"
+    franchise_id = db.Column(db.String(20), primary_key=True)
+    customer_email = db.Column(db.String(120), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_customer_rollup_revenue", "revenue"),
+        db.Index("ix_customer_rollup_franchise_revenue", "franchise_id", "revenue"),
+    )
+
+    def to_dict(self):
+        return {"customerEmail": self.customer_email, "orders": self.order_count, "revenue": self.revenue}
+
+class OrderSummary(FranchiseScoped, db.Model):
+    """Compact order row in a customer's history, with its latest status (see order_history.py)."""
+    __tablename__ = "order_summary"
+    order_id = db.Column(db.String(20), primary_key=True)
+    customer_email = db.Column(db.String(120), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)  # the customer's history version when the row last changed
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    services = db.Column(db.Text)  # JSON list of service names
+    total = db.Column(db.Float)
+    pickup_date = db.Column(db.String(50))
+    address = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime)
+    status = db.Column(db.String(50))
+    location = db.Column(db.String(100))
+    status_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_order_summary_customer_created", "franchise_id", "customer_email", "created_at", "order_id"),
+        db.Index("ix_order_summary_customer_seq", "franchise_id", "customer_email", "seq"),
+    )
+
+    def to_dict(self):
+        if self.deleted:
+            return {"id": self.order_id, "deleted": True}
+        return {
+            "id": self.order_id,
+            "service": json.loads(self.services or "[]"),
+            "total": self.total,
+            "pickupDate": self.pickup_date,
+            "address": self.address,
+            "status": self.status,
+            "location": self.location,
+            "statusAt": self.status_at.isoformat() if self.status_at else None,
+            "createdAt": self.created_at.isoformat() if self.created_at else None,
+        }
+
+class OrderHistoryVersion(FranchiseScoped, db.Model):
+    __tablename__ = "order_history_version"
+    franchise_id = db.Column(db.String(20), primary_key=True)
+    customer_email = db.Column(db.String(120), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+class Vehicle(db.Model):
+    id = db.Column(db.String(20), primary_key=True)  # fleet number, e.g. TRK-101
     driver_name = db.Column(db.String(100), nullable=False)
-    status = db.Column(db.String(20), nullable=False, default="pending")
+    lat = db.Column(db.Float)
+    lng = db.Column(db.Float)
+    speed_kmh = db.Column(db.Float)  # falls back to FLEET_SPEED_KMH
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "driverName": self.driver_name,
+            "lat": self.lat,
+            "lng": self.lng,
+            "speedKmh": self.speed_kmh,
+            "active": self.active,
+            "updatedAt": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+class Shipment(db.Model):
+    """Orders dispatched together under one Unified Tracking ID."""
+    id = db.Column(db.String(20), primary_key=True, default=fleet.new_uti)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Delivery(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    shipment_id = db.Column(db.String(20), db.ForeignKey("shipment.id"), nullable=False)
+    vehicle_id = db.Column(db.String(20), db.ForeignKey("vehicle.id"))
+    driver_name = db.Column(db.String(100))
+    status = db.Column(db.String(20), nullable=False, default=fleet.PENDING)
+    address = db.Column(db.String(255))
+    lat = db.Column(db.Float)
+    lng = db.Column(db.Float)
     estimated_delivery = db.Column(db.DateTime, nullable=True)
     actual_delivery = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_delivery_vehicle_status", "vehicle_id", "status"),
+        db.Index("ix_delivery_status_created", "status", "created_at", "id"),
+        db.Index("ix_delivery_created", "created_at", "id"),
+        db.Index("ix_delivery_shipment", "shipment_id"),
+    )
 
     def to_dict(self):
         return {
             "id": self.id,
+            "shipmentId": self.shipment_id,
             "vehicleId": self.vehicle_id,
             "driverName": self.driver_name,
             "status": self.status,
+            "address": self.address,
+            "lat": self.lat,
+            "lng": self.lng,
             "estimatedDelivery": self.estimated_delivery.isoformat() if self.estimated_delivery else None,
             "actualDelivery": self.actual_delivery.isoformat() if self.actual_delivery else None,
+            "createdAt": self.created_at.isoformat(),
         }
 
+class Order(FranchiseScoped, db.Model):
+    __tablename = "orders"
+    id = db.Column(db.String(20), primary_key=True, default=lambda: str(uuid.uuid4())[:8])
+    customer_name = db.Column(db.String(100), nullable=False)
+    customer_email = db.Column(db.String(120), nullable=False)  # NEW
+    customer_phone = db.Column(db.String(20), nullable=False)
+    pickup_date = db.Column(db.String(50))
+    special_instructions = db.Column(db.Text)
+    total = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    shipment_id = db.Column(db.String(20), db.ForeignKey("shipment.id"))
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.id", ondelete="SET NULL"))
+    address = db.Column(db.String(255))  # pickup/delivery address, geocoded by the client
+    lat = db.Column(db.Float)
+    lng = db.Column(db.Float)
+
+    __table_args__ = (
+        db.Index("ix_order_email_created", "customer_email", "created_at", "id"),
+        db.Index("ix_order_created", "created_at", "id"),
+        db.Index("ix_order_total", "total", "id"),
+        db.Index("ix_order_shipment", "shipment_id"),
+        db.Index("ix_order_franchise_created", "franchise_id", "created_at", "id"),
+        db.Index("ix_order_franchise_email", "franchise_id", "customer_email", "created_at", "id"),
+        db.Index("ix_order_franchise_total", "franchise_id", "total", "id"),
+        db.Index("ix_order_customer_created", "customer_id", "created_at", "id"),
+    )
+
+    customer = db.relationship(Customer)
+
+    items = db.relationship(
+        OrderItem,
+        order_by=OrderItem.position,
+        cascade="all, delete-orphan",
+        lazy="selectin",
+    )
+    current_status = db.relationship(
+        CurrentOrderStatus,
+        uselist=False,
+        cascade="all, delete-orphan",
+        lazy="selectin",
+    )
+
+    def set_services(self, services):
+        # reuse rows for services that stay on the order so the flush never
+        # deletes and re-inserts the same (order_id, service_id) key
+        existing = {item.service_id: item for item in self.items}
+        items = []
+        for position, service in enumerate(services):
+            item = existing.get(service.id) or OrderItem(service_id=service.id)
+            item.service_name = service.name
+            item.price = service.price
+            item.position = position
+            items.append(item)
+        self.items = items
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "customerName": self.customer_name,
+            "customerEmail": self.customer_email,   # NEW
+            "customerPhone": self.customer_phone,
+            "serviceId": [item.service_id for item in self.items],
+            "service": [item.service_name for item in self.items],
+            "status": self.current_status.status if self.current_status else None,
+            "location": self.current_status.location if self.current_status else None,
+            "pickupDate": self.pickup_date,
+            "specialInstructions": self.special_instructions,
+            "address": self.address,
+            "lat": self.lat,
+            "lng": self.lng,
+            "total": self.total,
+            "createdAt": self.created_at.isoformat(),
+        }
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(100), unique=True, nullable=False)
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "email": self.email}
+
+def install_session_hooks(session):
+    """Franchise scoping and cache invalidation for `session` (a scoped session or a Session class)."""
+    tenancy.scope_queries(session, FranchiseScoped)
+    # every order bumps usage_count; invalidating on that would re-render /api/services per order and
+    # serialise order writes on its cache_version row, so the listed counts refresh with other service edits
+    response_cache.watch(session, Service, "services", ignore=("usage_count",))
+    response_cache.watch(session, Delivery, "deliveries")
+
+install_session_hooks(db.session)
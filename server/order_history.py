@@ -0,0 +1,235 @@
+"""Per-customer order history: the read model behind `GET /api/orders`.
+
+`order_summary` holds one compact row per order (services, total, pickup,
+latest tracking status) keyed by order and customer email, and
+`order_history_version` one version number per customer. Order writes call
+`record` and scan writes call `record_scans` in their own transaction; both
+bump the customer's version and stamp the rows they change with it (`seq`).
+Deleted orders stay behind as tombstones so delta reads can report them.
+
+A read starts with one primary-key lookup of the customer's version. The
+ETag is derived from it, so a client that already has the list gets a 304
+without a single summary being read, and `?since=<version>` returns just the
+rows stamped after that version from the (franchise, email, seq) index.
+`rebuild` regenerates the read model from the order tables.
+"""
+import json
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, bindparam, text
+
+import tenancy
+
+HISTORY_VERSION_HEADER = "X-History-Version"
+# stay well under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+SUMMARY_COLUMNS = (
+    "services", "total", "pickup_date", "address", "created_at", "status", "location", "status_at",
+)
+
+
+def summary(order):
+    """Read-model row for an ORM order; taken before and after each write, like `stats.snapshot`."""
+    current = order.current_status
+    return {
+        "order_id": order.id,
+        "customer_email": order.customer_email,
+        "franchise_id": order.franchise_id or tenancy.current_franchise(),
+        "services": json.dumps([item.service_name for item in order.items]),
+        "total": order.total,
+        "pickup_date": order.pickup_date,
+        "address": order.address,
+        "created_at": order.created_at,
+        "status": current.status if current else None,
+        "location": current.location if current else None,
+        "status_at": current.scanned_at if current else None,
+    }
+
+
+# ---------------- VERSIONS ---------------- #
+SELECT_VERSION = text(
+    "SELECT version, updated_at FROM order_history_version WHERE franchise_id = :franchise AND customer_email = :email"
+).columns(updated_at=DateTime).execution_options(**tenancy.SHARDED)
+SELECT_VERSIONS = text(
+    "SELECT customer_email, version FROM order_history_version "
+    "WHERE franchise_id = :franchise AND customer_email IN :emails"
+).bindparams(bindparam("emails", expanding=True)).execution_options(**tenancy.SHARDED)
+BUMP_VERSION = text(
+    "INSERT INTO order_history_version (franchise_id, customer_email, version, updated_at) "
+    "VALUES (:franchise, :email, 1, :now) "
+    "ON CONFLICT (franchise_id, customer_email) DO UPDATE SET "
+    "version = order_history_version.version + 1, updated_at = excluded.updated_at"
+).execution_options(**tenancy.SHARDED)
+
+
+def current_version(session, franchise, email):
+    """(version, last change) of one customer's history; (0, None) before their first order."""
+    row = session.execute(SELECT_VERSION, {"franchise": franchise, "email": email}).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+def _bump(session, keys):
+    """Bump the versions of (franchise, email) keys; returns {key: new version}."""
+    keys = sorted(keys)  # a fixed order, so concurrent writers lock rows in the same sequence
+    now = datetime.utcnow().replace(microsecond=0)
+    session.execute(BUMP_VERSION, [{"franchise": franchise, "email": email, "now": now} for franchise, email in keys])
+    emails = defaultdict(list)
+    for franchise, email in keys:
+        emails[franchise].append(email)
+    versions = {}
+    for franchise, names in emails.items():
+        for start in range(0, len(names), LOOKUP_CHUNK):
+            chunk = names[start:start + LOOKUP_CHUNK]
+            rows = session.execute(SELECT_VERSIONS, {"franchise": franchise, "emails": chunk})
+            versions.update(((franchise, email), version) for email, version in rows)
+    return versions
+
+
+# ---------------- WRITES ---------------- #
+UPSERT_SUMMARY = text(
+    "INSERT INTO order_summary (order_id, customer_email, franchise_id, seq, deleted, "
+    + ", ".join(SUMMARY_COLUMNS) + ") "
+    "VALUES (:order_id, :customer_email, :franchise_id, :seq, :deleted, "
+    + ", ".join(":" + name for name in SUMMARY_COLUMNS) + ") "
+    "ON CONFLICT (order_id, customer_email) DO UPDATE SET "
+    "franchise_id = excluded.franchise_id, seq = excluded.seq, deleted = excluded.deleted, "
+    + ", ".join(f"{name} = excluded.{name}" for name in SUMMARY_COLUMNS)
+).bindparams(
+    bindparam("deleted", type_=Boolean),
+    bindparam("created_at", type_=DateTime),
+    bindparam("status_at", type_=DateTime),
+).execution_options(**tenancy.SHARDED)
+TOMBSTONE = text(
+    "UPDATE order_summary SET deleted = :deleted, seq = :seq "
+    "WHERE order_id = :order_id AND customer_email = :customer_email"
+).bindparams(bindparam("deleted", type_=Boolean)).execution_options(**tenancy.SHARDED)
+SELECT_SCANNED = text(
+    "SELECT order_id, customer_email, franchise_id, status_at FROM order_summary "
+    "WHERE order_id IN :ids AND deleted = :deleted"
+).bindparams(
+    bindparam("ids", expanding=True), bindparam("deleted", type_=Boolean)
+).columns(status_at=DateTime).execution_options(**tenancy.SHARDED)
+UPDATE_STATUS = text(
+    "UPDATE order_summary SET status = :status, location = :location, status_at = :status_at, seq = :seq "
+    "WHERE order_id = :order_id AND customer_email = :customer_email"
+).bindparams(bindparam("status_at", type_=DateTime)).execution_options(**tenancy.SHARDED)
+
+
+def _key(row):
+    return row["franchise_id"], row["customer_email"]
+
+
+def record(session, added=(), removed=()):
+    """Apply order writes: `added` and `removed` are `summary` rows (an update is both)."""
+    live = {(row["order_id"], row["customer_email"]) for row in added}
+    gone = [row for row in removed if (row["order_id"], row["customer_email"]) not in live]
+    # an update that changes nothing shown here leaves the customer's version alone
+    changed = [row for row in added if row not in removed]
+    if not changed and not gone:
+        return
+    versions = _bump(session, {_key(row) for row in changed + gone})
+    if changed:
+        session.execute(UPSERT_SUMMARY, [dict(row, seq=versions[_key(row)], deleted=False) for row in changed])
+    if gone:
+        session.execute(TOMBSTONE, [
+            {"order_id": row["order_id"], "customer_email": row["customer_email"],
+             "seq": versions[_key(row)], "deleted": True}
+            for row in gone
+        ])
+
+
+def record_scans(session, rows):
+    """Move scanned orders to their latest status; `rows` are scan rows as `order_status.apply` takes them."""
+    newest = {}
+    for row in rows:
+        order_id = row.get("order_id")
+        if order_id and (order_id not in newest or row["scanned_at"] >= newest[order_id]["scanned_at"]):
+            newest[order_id] = row
+    ids = list(newest)
+    changed = []
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        found = session.execute(SELECT_SCANNED, {"ids": ids[start:start + LOOKUP_CHUNK], "deleted": False})
+        for order_id, email, franchise, status_at in found:
+            scan = newest[order_id]
+            # older scans uploaded late never win, as in the current-status projection
+            if status_at is None or scan["scanned_at"] >= status_at:
+                changed.append({
+                    "order_id": order_id,
+                    "customer_email": email,
+                    "franchise_id": franchise,
+                    "status": scan["order_status"],
+                    "location": scan.get("location"),
+                    "status_at": scan["scanned_at"],
+                })
+    if not changed:
+        return 0
+    versions = _bump(session, {_key(row) for row in changed})
+    session.execute(UPDATE_STATUS, [dict(row, seq=versions[_key(row)]) for row in changed])
+    return len(changed)
+
+
+# ---------------- REBUILD ---------------- #
+def rebuild(conn, batch=5000):
+    """Rewrite the read model from the order tables; returns the number of orders.
+
+    Every customer's version moves on and rows whose order is gone become
+    tombstones, so clients reading deltas pick up the rebuilt rows.
+    """
+    keys = set(conn.execute(text(
+        'SELECT franchise_id, customer_email FROM "order" '
+        "UNION SELECT franchise_id, customer_email FROM order_summary"
+    )).all())
+    if not keys:
+        return 0
+    now = datetime.utcnow().replace(microsecond=0)
+    conn.execute(BUMP_VERSION, [{"franchise": franchise, "email": email, "now": now} for franchise, email in keys])
+    versions = {
+        (franchise, email): version
+        for franchise, email, version in conn.execute(text(
+            "SELECT franchise_id, customer_email, version FROM order_history_version"
+        ))
+    }
+    conn.execute(text(
+        "UPDATE order_summary SET deleted = :deleted, seq = (SELECT v.version FROM order_history_version v "
+        "WHERE v.franchise_id = order_summary.franchise_id AND v.customer_email = order_summary.customer_email)"
+    ).bindparams(bindparam("deleted", type_=Boolean)), {"deleted": True})
+
+    count = 0
+    orders = conn.execution_options(yield_per=batch).execute(text(
+        'SELECT o.id, o.customer_email, o.franchise_id, o.total, o.pickup_date, o.address, o.created_at, '
+        "s.status, s.location, s.scanned_at "
+        'FROM "order" o LEFT JOIN current_order_status s ON s.order_id = o.id'
+    ).columns(created_at=DateTime, scanned_at=DateTime))
+    for chunk in orders.partitions():
+        services = defaultdict(list)
+        ids = [row.id for row in chunk]
+        for start in range(0, len(ids), LOOKUP_CHUNK):
+            for order_id, name in conn.execute(
+                text(
+                    "SELECT order_id, service_name FROM order_items WHERE order_id IN :ids ORDER BY order_id, position"
+                ).bindparams(bindparam("ids", expanding=True)),
+                {"ids": ids[start:start + LOOKUP_CHUNK]},
+            ):
+                services[order_id].append(name)
+        conn.execute(UPSERT_SUMMARY, [
+            {
+                "order_id": row.id,
+                "customer_email": row.customer_email,
+                "franchise_id": row.franchise_id,
+                "seq": versions[(row.franchise_id, row.customer_email)],
+                "deleted": False,
+                "services": json.dumps(services[row.id]),
+                "total": row.total,
+                "pickup_date": row.pickup_date,
+                "address": row.address,
+                "created_at": row.created_at,
+                "status": row.status,
+                "location": row.location,
+                "status_at": row.scanned_at,
+            }
+            for row in chunk
+        ])
+        count += len(chunk)
+    return count
@@ -0,0 +1,124 @@
+"""Current-status projection of the Track log.
+
+`current_order_status` holds one row per order with its latest scan (status,
+location, worker, time). It is upserted in the same transaction as every scan
+insert, so "where is order X" and "what is at location Y" are single indexed
+reads instead of scans over the whole Track history. `rebuild` regenerates it
+from the log.
+"""
+from sqlalchemy import select, text
+
+from db_engine import dialect_insert
+from tenancy import current_franchise, order_franchise_sql
+
+# stay well under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+PROJECTED = ("order_email", "status", "location", "worker_id", "scanned_at")
+
+
+def resolve_orders(session, orders, rows):
+    """Fill `order_id` and `franchise_id` on scan rows in place; returns one error (or None) per row.
+
+    Scans that name an order must reference an existing one. Older clients only
+    send the customer email, which resolves to that customer's latest order.
+    A scan belongs to its order's franchise, or the request's if it has none.
+    """
+    errors = [None] * len(rows)
+
+    named = list({row["order_id"] for row in rows if row.get("order_id")})
+    known = {}
+    for start in range(0, len(named), LOOKUP_CHUNK):
+        chunk = named[start:start + LOOKUP_CHUNK]
+        known.update(session.execute(select(orders.c.id, orders.c.franchise_id).where(orders.c.id.in_(chunk))).all())
+
+    emails = list({row["order_email"] for row in rows if not row.get("order_id")})
+    latest = {}
+    for start in range(0, len(emails), LOOKUP_CHUNK):
+        chunk = emails[start:start + LOOKUP_CHUNK]
+        found = session.execute(
+            select(orders.c.customer_email, orders.c.id, orders.c.created_at, orders.c.franchise_id)
+            .where(orders.c.customer_email.in_(chunk))
+        )
+        for email, order_id, created_at, franchise in found:
+            if email not in latest or (created_at, order_id) > latest[email][:2]:
+                latest[email] = (created_at, order_id, franchise)
+
+    fallback = current_franchise()
+    for i, row in enumerate(rows):
+        row["franchise_id"] = fallback
+        if row.get("order_id"):
+            if row["order_id"] not in known:
+                errors[i] = "Unknown orderId"
+            else:
+                row["franchise_id"] = known[row["order_id"]]
+        elif row["order_email"] in latest:
+            _, row["order_id"], row["franchise_id"] = latest[row["order_email"]]
+        else:
+            row["order_id"] = None
+    return errors
+
+
+def apply(session, projection, rows):
+    """Upsert the newest scan per order into the projection; older scans never win."""
+    newest = {}
+    for row in rows:
+        order_id = row.get("order_id")
+        if not order_id:
+            continue
+        if order_id not in newest or row["scanned_at"] >= newest[order_id]["scanned_at"]:
+            newest[order_id] = row
+    if not newest:
+        return 0
+
+    values = [
+        {
+            "order_id": order_id,
+            "order_email": row["order_email"],
+            "status": row["order_status"],
+            "location": row.get("location"),
+            "worker_id": row["worker_id"],
+            "scanned_at": row["scanned_at"],
+            "franchise_id": row.get("franchise_id") or current_franchise(),
+        }
+        for order_id, row in newest.items()
+    ]
+
+    stmt = dialect_insert(session, projection)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["order_id"],
+            set_={name: stmt.excluded[name] for name in PROJECTED},
+            where=stmt.excluded.scanned_at >= projection.c.scanned_at,
+        )
+        session.execute(stmt, values)
+        return len(values)
+
+    for value in values:
+        current = session.execute(
+            select(projection.c.scanned_at).where(projection.c.order_id == value["order_id"])
+        ).first()
+        if current is None:
+            session.execute(projection.insert(), value)
+        elif value["scanned_at"] >= current[0]:
+            session.execute(
+                projection.update().where(projection.c.order_id == value["order_id"]), value
+            )
+    return len(values)
+
+
+def rebuild(conn):
+    """Replace the projection with the latest scan per order from the full Track log."""
+    conn.execute(text("DELETE FROM current_order_status"))
+    result = conn.execute(text(
+        "INSERT INTO current_order_status "
+        "(order_id, order_email, status, location, worker_id, scanned_at, franchise_id) "
+        "SELECT t.order_id, t.order_email, t.order_status, t.location, t.worker_id, t.scanned_at, "
+        f"{order_franchise_sql(conn, 'o')} "
+        'FROM track t JOIN "order" o ON o.id = t.order_id '
+        "WHERE t.id = ("
+        "  SELECT t2.id FROM track t2 WHERE t2.order_id = t.order_id "
+        "  ORDER BY t2.scanned_at DESC, t2.id DESC LIMIT 1"
+        ")"
+    ))
+    return result.rowcount
@@ -0,0 +1,88 @@
+"""Password hashing on a bounded executor.
+
+The KDF parameters come from `PASSWORD_HASH_METHOD` (any Werkzeug method
+string, e.g. `scrypt:32768:8:1` or `pbkdf2:sha256:600000`), so each
+deployment can tune cost to its hardware. Hashes made with older parameters
+are upgraded on the next successful login (`needs_rehash`).
+
+hashlib's scrypt and pbkdf2 release the GIL, so running them on a small
+thread pool keeps them from serialising the worker. The pool is bounded:
+when `PASSWORD_WORKERS + PASSWORD_QUEUE` hashes are queued or running new
+calls fail fast with `Busy` instead of piling up behind each other. A call
+that waits longer than `PASSWORD_TIMEOUT` also gets `Busy`, but its hash keeps
+its slot until it finishes, so the bound holds under load.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", "2"))
+PASSWORD_QUEUE = int(os.environ.get("PASSWORD_QUEUE", "16"))
+PASSWORD_TIMEOUT = float(os.environ.get("PASSWORD_TIMEOUT", "10"))
+
+# customers created by an order (or by an admin) have no password until they sign up
+NO_PASSWORD = ""
+
+
+class Busy(Exception):
+    """Raised when the hashing pool is saturated."""
+
+
+class _HashPool:
+    def __init__(self, workers, queue):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # executors do not survive fork, so gunicorn workers each build their own
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="kdf")
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise Busy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # the slot is held until the hash finishes, even if this caller stops waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=PASSWORD_TIMEOUT)
+        except TimeoutError:
+            raise Busy()
+
+
+_pool = _HashPool(PASSWORD_WORKERS, PASSWORD_QUEUE)
+_current_prefix = None
+
+
+def hash_password(raw):
+    return _pool.run(generate_password_hash, raw, PASSWORD_HASH_METHOD)
+
+
+def verify(stored, raw):
+    if not stored:
+        return False
+    return _pool.run(check_password_hash, stored, raw)
+
+
+def needs_rehash(stored):
+    """True when a stored hash was made with different KDF parameters than configured."""
+    global _current_prefix
+    if not stored:
+        return False
+    if _current_prefix is None:
+        # Werkzeug expands short method names ("scrypt") into full parameters
+        _current_prefix = generate_password_hash("", PASSWORD_HASH_METHOD).split("$", 1)[0]
+    return stored.split("$", 1)[0] != _current_prefix
@@ -0,0 +1,88 @@
+"""EXPLAIN QUERY PLAN audit for the statements the app actually issues.
+
+`Capture` records every SELECT, UPDATE and DELETE an engine sends to the
+driver (a `before_cursor_execute` listener) while the bench workloads run,
+keeping one example with its parameters per distinct statement. The audit
+then asks SQLite for each one's plan and flags any plain table scan (a
+`SCAN <table>` step that does not use an index) on a table holding more than
+`max_rows` rows.
+"""
+import re
+import threading
+from collections import namedtuple
+
+from sqlalchemy import event, inspect, text
+
+SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\S+)(.*)$")
+AUDITED_RE = re.compile(r"^\s*(?:SELECT|WITH|UPDATE|DELETE)\b", re.IGNORECASE)
+# expanding IN lists render one placeholder per value; they are one statement to the audit
+IN_LIST_RE = re.compile(r"\(\?(?:, \?)+\)")
+
+Captured = namedtuple("Captured", "name statement parameters")
+AuditResult = namedtuple("AuditResult", "name statement plan full_scans")
+
+
+class Capture:
+    """Distinct statements `engine` runs while the block is open, named after `label` at the time."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.label = None
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+    def _record(self, _conn, _cursor, statement, parameters, _context, executemany):
+        if not AUDITED_RE.match(statement):
+            return
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        shape = IN_LIST_RE.sub("(?)", statement)
+        with self._lock:
+            if shape not in self._seen:
+                self._seen[shape] = Captured(f"{self.label} #{len(self._seen) + 1}", statement, parameters)
+
+    def statements(self):
+        """Captured statements in the order they were first seen."""
+        with self._lock:
+            return list(self._seen.values())
+
+
+def explain(conn, statement, parameters):
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return [row[3] for row in rows]
+
+
+def scanned_tables(plan, tables):
+    for detail in plan:
+        match = SCAN_RE.match(detail)
+        # "SCAN t USING INDEX ..." walks an index in order, which keyset pages rely on
+        if match and match.group(1) in tables and "USING" not in match.group(2):
+            yield match.group(1)
+
+
+def audit(engine, statements, max_rows):
+    """Explain every `Captured` statement; returns a list of AuditResult."""
+    if engine.dialect.name != "sqlite":
+        raise RuntimeError("The query plan audit only understands SQLite plans")
+
+    results = []
+    counts = {}
+    with engine.connect() as conn:
+        tables = set(inspect(conn).get_table_names())
+        for captured in statements:
+            plan = explain(conn, captured.statement, captured.parameters)
+            offending = []
+            for table in scanned_tables(plan, tables):
+                if table not in counts:
+                    counts[table] = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+                if counts[table] > max_rows:
+                    offending.append(f"{table} ({counts[table]} rows)")
+            results.append(AuditResult(captured.name, captured.statement, plan, offending))
+    return results
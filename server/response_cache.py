@@ -0,0 +1,163 @@
+"""Cached JSON responses for read-mostly endpoints, with conditional GET.
+
+Each cached endpoint has a version stamp in the `cache_version` table. Writes
+bump it in their own transaction (`invalidate`, or automatically for models
+registered with `watch`), and every cached read does one primary-key lookup of
+the stamp before serving the stored body. A write committed by any gunicorn
+worker therefore changes the key every worker looks up, so nobody serves a
+stale body and there is no TTL to tune.
+
+Bodies are cached per franchise scope (see tenancy.py).
+
+Bodies live in a pluggable backend: an in-process LRU by default, or Redis
+when `RESPONSE_CACHE_URL` is set, so workers share one rendered copy.
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import DateTime, event, inspect, text
+
+import tenancy
+
+try:
+    import redis
+except ImportError:  # only needed when RESPONSE_CACHE_URL points at Redis
+    redis = None
+
+RESPONSE_CACHE_URL = os.environ.get("RESPONSE_CACHE_URL")
+RESPONSE_CACHE_ENTRIES = int(os.environ.get("RESPONSE_CACHE_ENTRIES", "256"))
+
+# paginated views keep their cursor headers with the cached body
+KEPT_HEADERS = ("X-Next-Cursor", "Link")
+
+Entry = namedtuple("Entry", "body mimetype etag headers", defaults=((),))
+
+
+# ---------------- BACKENDS ---------------- #
+class MemoryBackend:
+    """Per-process LRU of rendered responses."""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisBackend:
+    """Responses shared by every worker; superseded versions expire on their own."""
+
+    def __init__(self, url, ttl=3600):
+        if redis is None:
+            raise RuntimeError("RESPONSE_CACHE_URL is set but the redis package is not installed")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self.client.get("response-cache:" + key)
+        return Entry(*pickle.loads(raw)) if raw is not None else None
+
+    def set(self, key, entry):
+        self.client.set("response-cache:" + key, pickle.dumps(tuple(entry)), ex=self.ttl)
+
+
+backend = RedisBackend(RESPONSE_CACHE_URL) if RESPONSE_CACHE_URL else MemoryBackend()
+
+
+def configure(new_backend):
+    """Swap the backend, e.g. for a memcached client exposing get/set."""
+    global backend
+    backend = new_backend
+
+
+# ---------------- VERSION STAMPS ---------------- #
+SELECT_VERSION = text(
+    "SELECT version, updated_at FROM cache_version WHERE name = :name"
+).columns(updated_at=DateTime)
+BUMP_VERSION = text(
+    "INSERT INTO cache_version (name, version, updated_at) VALUES (:name, 1, :now) "
+    "ON CONFLICT (name) DO UPDATE SET version = cache_version.version + 1, updated_at = excluded.updated_at"
+)
+
+
+def current_version(session, name):
+    row = session.execute(SELECT_VERSION, {"name": name}).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+def invalidate(session, *names):
+    """Bump the stamps in the caller's transaction; the cache changes when it commits."""
+    now = datetime.utcnow().replace(microsecond=0)
+    session.execute(BUMP_VERSION, [{"name": name, "now": now} for name in names])
+
+
+def watch(session, model, name, ignore=()):
+    """Invalidate `name` whenever a flush inserts, changes or deletes a `model` row.
+
+    Updates that only touch the attributes in `ignore` leave the stamp alone.
+    """
+    def changed(obj):
+        return any(attr.history.has_changes() for attr in inspect(obj).attrs if attr.key not in ignore)
+
+    @event.listens_for(session, "before_flush")
+    def bump(sess, _context, _instances):
+        if any(isinstance(obj, model) for obj in sess.new) or any(
+            isinstance(obj, model) for obj in sess.deleted
+        ) or any(isinstance(obj, model) and changed(obj) for obj in sess.dirty):
+            invalidate(sess, name)
+    return bump
+
+
+# ---------------- VIEWS ---------------- #
+def respond(session, name, render):
+    """The cached response for this request to the `name` view, calling `render()` on a miss."""
+    version, updated_at = current_version(session, name)
+    key = f"{name}:{version}:{tenancy.scope() or ''}:{request.query_string.decode()}"
+    entry = backend.get(key)
+    if entry is None:
+        response = current_app.make_response(render())
+        if response.status_code != 200:
+            return response
+        body = response.get_data()
+        headers = tuple((k, response.headers[k]) for k in KEPT_HEADERS if k in response.headers)
+        entry = Entry(body, response.mimetype, hashlib.sha1(body).hexdigest(), headers)
+        backend.set(key, entry)
+
+    response = current_app.response_class(entry.body, mimetype=entry.mimetype, headers=list(entry.headers))
+    response.set_etag(entry.etag)
+    response.vary.add(tenancy.FRANCHISE_HEADER)
+    if updated_at is not None:
+        response.last_modified = updated_at
+    # clients may keep the body but must revalidate; a match costs one stamp lookup
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def cached(name):
+    """Serve a GET view from the cache, revalidated by ETag / Last-Modified."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            session = current_app.extensions["sqlalchemy"].session
+            return respond(session, name, lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
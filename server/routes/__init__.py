@@ -0,0 +1,23 @@
+"""HTTP blueprints.
+
+`create_app` registers them by name, so a blueprint module (and whatever it
+imports) is only loaded when an app actually registers it.
+"""
+import importlib
+
+# "module:attribute", plus the URL prefix to mount it under
+BLUEPRINTS = (
+    ("routes.worker:worker_bp", None),
+    ("routes.auth:auth_bp", None),
+    ("routes.orders:orders_bp", None),
+    ("routes.live:live_bp", None),
+    ("routes.deliveries:deliveries_bp", None),
+    ("routes.admin:admin_bp", None),
+    ("routes.users:users_bp", "/api/users"),
+)
+
+
+def register(app, blueprints=BLUEPRINTS):
+    for spec, url_prefix in blueprints:
+        module, attr = spec.split(":")
+        app.register_blueprint(getattr(importlib.import_module(module), attr), url_prefix=url_prefix)
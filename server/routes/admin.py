@@ -0,0 +1,513 @@
+"""Admin login, the admin API and the admin React app."""
+import io
+from datetime import datetime
+
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    stream_with_context,
+    url_for,
+)
+
+from extensions import db, db_retry
+from models import (
+    AdminAccount,
+    CurrentOrderStatus,
+    Customer,
+    CustomerRollup,
+    Franchise,
+    Order,
+    OrderItem,
+    RevenueRollup,
+    Service,
+    ServiceRollup,
+)
+from pagination import paginate, parse_datetime
+from routes.common import (
+    admin_login_required,
+    publish,
+    set_order_address,
+    super_admin_required,
+)
+from schemas import CUSTOMER_SCHEMA, ORDER_SCHEMA, SERVICE_SCHEMA
+import admin_sessions
+import bulk
+import events
+import identity
+import metrics
+import order_history
+import response_cache
+import serialization
+import static_assets
+import stats
+import tenancy
+
+admin_bp = Blueprint("admin", __name__)
+
+@admin_bp.route("/admin/login", methods=["GET", "POST"])
+@db_retry
+def admin_login():
+    if request.method == "GET":
+        return render_template("lokesh.html")
+    data = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    admin = AdminAccount.query.filter_by(username=data.get("username") or "").first()
+    if admin is None or not admin.active or not admin.check_password(data.get("password") or ""):
+        if request.is_json:
+            return jsonify({"error": "Invalid credentials"}), 401
+        return render_template("lokesh.html", error="Invalid credentials")
+    db.session.commit()  # check_password may have upgraded the hash
+    if request.is_json:
+        # a franchise owner's session only ever sees their own store
+        response = jsonify({"message": "Admin login successful", "franchise": admin.franchise_id})
+    else:
+        response = redirect(url_for("admin.serve_admin"))
+    return admin_sessions.log_in(response, admin)
+
+@admin_bp.route("/admin/logout", methods=["POST"])
+@admin_login_required
+def admin_logout():
+    return admin_sessions.log_out(jsonify({"message": "Admin logged out"}))
+
+# ---------------- ADMIN ACCOUNTS ---------------- #
+@admin_bp.route("/admin/api/admins", methods=["GET"])
+@super_admin_required
+def get_admins():
+    return jsonify([a.to_dict() for a in AdminAccount.query.order_by(AdminAccount.id)]), 200
+
+@admin_bp.route("/admin/api/admins", methods=["POST"])
+@super_admin_required
+@db_retry
+def create_admin():
+    """Add a login; with `franchise` it is that store's owner, without it another super admin"""
+    data = request.json or {}
+    username, password, franchise = data.get("username"), data.get("password"), data.get("franchise")
+    if not username or not password:
+        return jsonify({"error": "Missing fields"}), 400
+    if franchise and not db.session.get(Franchise, franchise):
+        return jsonify({"error": "Unknown franchise"}), 400
+    if AdminAccount.query.filter_by(username=username).first():
+        return jsonify({"error": "Username taken"}), 400
+    admin = AdminAccount(username=username, franchise_id=franchise or None)
+    admin.set_password(password)
+    db.session.add(admin)
+    db.session.commit()
+    return jsonify(admin.to_dict()), 201
+
+@admin_bp.route("/admin/api/admins/<int:admin_id>", methods=["PUT"])
+@super_admin_required
+@db_retry
+def update_admin(admin_id):
+    """Change a password or (de)activate a login; either one logs the admin out everywhere"""
+    admin = db.session.get(AdminAccount, admin_id)
+    if not admin:
+        return jsonify({"error": "Admin not found"}), 404
+    data = request.json or {}
+    if data.get("password"):
+        admin.set_password(data["password"])
+    if "active" in data:
+        admin.active = bool(data["active"])
+    db.session.commit()
+    revoked = admin_sessions.store.revoke(admin_id=admin.id)
+    return jsonify({**admin.to_dict(), "sessionsRevoked": revoked}), 200
+
+@admin_bp.route("/admin/api/sessions/revoke", methods=["POST"])
+@super_admin_required
+def revoke_admin_sessions():
+    """Log out one admin (`adminId`) or, with `all`, every admin including the caller"""
+    data = request.json or {}
+    if data.get("all"):
+        return jsonify({"revoked": admin_sessions.store.revoke()}), 200
+    if not isinstance(data.get("adminId"), int):
+        return jsonify({"error": "adminId or all is required"}), 400
+    return jsonify({"revoked": admin_sessions.store.revoke(admin_id=data["adminId"])}), 200
+
+# ---------------- FRANCHISES ---------------- #
+@admin_bp.route("/admin/api/franchises", methods=["GET"])
+@admin_login_required
+def get_franchises():
+    query = Franchise.query.order_by(Franchise.id)
+    if tenancy.scope() is not None:
+        query = query.filter(Franchise.id == tenancy.scope())
+    return jsonify([f.to_dict() for f in query]), 200
+
+@admin_bp.route("/admin/api/franchises", methods=["POST"])
+@super_admin_required
+@db_retry
+def create_franchise():
+    """Register a store; sharding one onto its own database is done with `flask add-franchise`"""
+    data = request.json or {}
+    franchise_id, name = data.get("id"), data.get("name")
+    if not franchise_id or not name:
+        return jsonify({"error": "Missing fields"}), 400
+    if len(franchise_id) > 20 or not franchise_id.replace("-", "").isalnum():
+        return jsonify({"error": "id must be up to 20 letters, digits or dashes"}), 400
+    if db.session.get(Franchise, franchise_id):
+        return jsonify({"error": "Franchise exists"}), 400
+    franchise = Franchise(id=franchise_id, name=name)
+    db.session.add(franchise)
+    db.session.commit()
+    tenancy.forget()
+    return jsonify(franchise.to_dict()), 201
+
+# ---------------- ADMIN CRUD ---------------- #
+@admin_bp.route("/admin/api/services", methods=["GET"])
+@admin_login_required
+def admin_get_services():
+    query = Service.query
+    if request.args.get("status"):
+        query = query.filter(Service.status == request.args["status"])
+    if request.args.get("q"):
+        query = query.filter(Service.name.startswith(request.args["q"]))
+    try:
+        return serialization.paginate(
+            query,
+            SERVICE_SCHEMA,
+            {"name": Service.name, "price": Service.price, "usage": Service.usage_count},
+            "name",
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@admin_bp.route("/admin/api/services", methods=["POST"])
+@admin_login_required
+@db_retry
+def create_service():
+    data = request.json or {}
+    if not data.get("name") or data.get("price") is None:
+        return jsonify({"error": "Missing fields"}), 400
+    service = Service(name=data["name"], price=float(data["price"]), duration=data.get("duration"))
+    db.session.add(service)
+    db.session.commit()
+    return jsonify(service.to_dict()), 201
+
+@admin_bp.route("/admin/api/services/<service_id>", methods=["PUT"])
+@admin_login_required
+@db_retry
+def update_service(service_id):
+    service = Service.query.get_or_404(service_id)
+    data = request.json or {}
+    service.name = data.get("name", service.name)
+    if "price" in data:
+        service.price = float(data["price"])
+    service.duration = data.get("duration", service.duration)
+    service.status = data.get("status", service.status)
+    db.session.commit()
+    return jsonify(service.to_dict()), 200
+
+@admin_bp.route("/admin/api/services/<service_id>", methods=["DELETE"])
+@admin_login_required
+@db_retry
+def delete_service(service_id):
+    service = Service.query.get_or_404(service_id)
+    db.session.delete(service)
+    db.session.commit()
+    return jsonify({"message": "Deleted"}), 200
+
+@admin_bp.route("/admin/api/customers", methods=["GET"])
+@admin_login_required
+def get_customers():
+    args = request.args
+    query = Customer.query
+    try:
+        if args.get("from"):
+            query = query.filter(Customer.created_at >= parse_datetime(args["from"], "from"))
+        if args.get("to"):
+            query = query.filter(Customer.created_at < parse_datetime(args["to"], "to"))
+        if args.get("email"):
+            query = query.filter(Customer.email == args["email"])
+        if args.get("q"):
+            query = query.filter(Customer.name.startswith(args["q"]))
+        return serialization.paginate(
+            query,
+            CUSTOMER_SCHEMA,
+            {"created": Customer.created_at, "name": Customer.name},
+            "created",
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@admin_bp.route("/admin/api/customers", methods=["POST"])
+@admin_login_required
+@db_retry
+def create_customer():
+    data = request.json or {}
+    required = ["name", "email", "phone"]
+    if not all(k in data for k in required):
+        return jsonify({"error": "Missing fields"}), 400
+    if Customer.query.filter_by(email=data["email"]).first():
+        return jsonify({"error": "Email exists"}), 400
+    customer = Customer(name=data["name"], email=data["email"], phone=data["phone"])
+    db.session.add(customer)
+    db.session.commit()
+    return jsonify(customer.to_dict()), 201
+
+@admin_bp.route("/admin/api/customers/<int:customer_id>", methods=["PUT"])
+@admin_login_required
+@db_retry
+def update_customer(customer_id):
+    customer = Customer.query.get_or_404(customer_id)
+    data = request.json or {}
+    customer.name = data.get("name", customer.name)
+    customer.email = data.get("email", customer.email)
+    customer.phone = data.get("phone", customer.phone)
+    db.session.commit()
+    identity.forget(customer)
+    return jsonify(customer.to_dict()), 200
+
+@admin_bp.route("/admin/api/customers/<int:customer_id>", methods=["DELETE"])
+@admin_login_required
+@db_retry
+def delete_customer(customer_id):
+    customer = Customer.query.get_or_404(customer_id)
+    # orders outlive the customer but must not stay owned by their id (see update_order)
+    Order.query.filter_by(customer_id=customer.id).update({"customer_id": None}, synchronize_session=False)
+    db.session.delete(customer)
+    db.session.commit()
+    identity.forget(customer)
+    return jsonify({"message": "Customer deleted"}), 200
+
+
+@admin_bp.route("/admin/api/orders", methods=["GET"])
+@admin_login_required
+def get_orders():
+    args = request.args
+    query = Order.query
+    try:
+        if args.get("from"):
+            query = query.filter(Order.created_at >= parse_datetime(args["from"], "from"))
+        if args.get("to"):
+            query = query.filter(Order.created_at < parse_datetime(args["to"], "to"))
+        if args.get("email"):
+            query = query.filter(Order.customer_email == args["email"])
+        if args.get("service"):
+            query = query.join(OrderItem).filter(OrderItem.service_id == args["service"])
+        if args.get("status") or args.get("location"):
+            query = query.join(CurrentOrderStatus)
+            if args.get("status"):
+                query = query.filter(CurrentOrderStatus.status == args["status"])
+            if args.get("location"):
+                query = query.filter(CurrentOrderStatus.location == args["location"])
+        return serialization.paginate(
+            query,
+            ORDER_SCHEMA,
+            {"created": Order.created_at, "total": Order.total},
+            "created",
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@admin_bp.route("/admin/api/order-status", methods=["GET"])
+@admin_login_required
+def get_order_statuses():
+    """Orders currently at a location and/or in a status, from the projection"""
+    query = CurrentOrderStatus.query
+    if request.args.get("location"):
+        query = query.filter(CurrentOrderStatus.location == request.args["location"])
+    if request.args.get("status"):
+        query = query.filter(CurrentOrderStatus.status == request.args["status"])
+    try:
+        return paginate(
+            query,
+            {"scanned": CurrentOrderStatus.scanned_at},
+            "scanned",
+            CurrentOrderStatus.order_id,
+            CurrentOrderStatus.to_dict,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@admin_bp.route("/admin/api/orders/<string:order_id>", methods=["PUT"])
+@admin_login_required
+@db_retry
+def update_order_admin(order_id):
+    order = Order.query.get_or_404(order_id)
+    before, shown = stats.snapshot(order), order_history.summary(order)
+    data = request.json or {}
+
+    if "customerName" in data:
+        order.customer_name = data["customerName"]
+    if "customerEmail" in data:
+        order.customer_email = data["customerEmail"]
+    try:
+        set_order_address(order, data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if "serviceId" in data:
+        service_ids = data["serviceId"]
+        if isinstance(service_ids, str):
+            service_ids = [s.strip() for s in service_ids.split(",")]
+        services = Service.query.filter(Service.id.in_(service_ids)).all()
+        if not services or len(services) != len(service_ids):
+            return jsonify({"error": "One or more services are invalid"}), 400
+
+        order.set_services(services)
+        order.total = sum(s.price for s in services)
+
+        for service in services:
+            service.usage_count += 1
+
+    stats.record(db.session, added=[stats.snapshot(order)], removed=[before])
+    order_history.record(db.session, added=[order_history.summary(order)], removed=[shown])
+    publish(events.order_row(events.ORDER_UPDATED, order.to_dict(), datetime.utcnow(), order.franchise_id))
+    db.session.commit()
+    return jsonify(order.to_dict()), 200
+
+
+@admin_bp.route("/admin/api/orders/<string:order_id>", methods=["DELETE"])
+@admin_login_required
+@db_retry
+def delete_order_admin(order_id):
+    order = Order.query.get_or_404(order_id)
+    stats.record(db.session, removed=[stats.snapshot(order)])
+    order_history.record(db.session, removed=[order_history.summary(order)])
+    publish(events.order_row(
+        events.ORDER_DELETED, {"id": order.id, "customerEmail": order.customer_email}, datetime.utcnow(),
+        order.franchise_id,
+    ))
+    db.session.delete(order)
+    db.session.commit()
+    return jsonify({"message": "Order deleted"}), 200
+
+def rollup_summary(period, start, end, top):
+    """Dashboard numbers from this database's rollup tables, summed over the franchises in scope."""
+    func = db.func
+    buckets = db.session.query(
+        RevenueRollup.bucket, func.sum(RevenueRollup.order_count), func.sum(RevenueRollup.revenue)
+    ).filter(RevenueRollup.period == period)
+    if start is not None:
+        buckets = buckets.filter(RevenueRollup.bucket >= start)
+    if end is not None:
+        buckets = buckets.filter(RevenueRollup.bucket < end)
+    series = [
+        {"bucket": day.isoformat(), "orders": count, "revenue": amount}
+        for day, count, amount in buckets.group_by(RevenueRollup.bucket).order_by(RevenueRollup.bucket)
+    ]
+    services = (
+        db.session.query(
+            ServiceRollup.service_id, func.max(Service.name),
+            func.sum(ServiceRollup.order_count), func.sum(ServiceRollup.revenue),
+        )
+        .outerjoin(Service, Service.id == ServiceRollup.service_id)
+        .group_by(ServiceRollup.service_id)
+        .order_by(func.sum(ServiceRollup.order_count).desc())
+        .all()
+    )
+    if tenancy.scope() is not None:
+        # one row per customer: the (franchise_id, revenue) index serves the top N
+        customers = db.session.query(
+            CustomerRollup.customer_email, CustomerRollup.order_count, CustomerRollup.revenue
+        ).filter(CustomerRollup.order_count > 0).order_by(CustomerRollup.revenue.desc())
+    else:
+        customers = (
+            db.session.query(
+                CustomerRollup.customer_email, func.sum(CustomerRollup.order_count), func.sum(CustomerRollup.revenue)
+            )
+            .group_by(CustomerRollup.customer_email)
+            .having(func.sum(CustomerRollup.order_count) > 0)
+            .order_by(func.sum(CustomerRollup.revenue).desc())
+        )
+    return {
+        # the same buckets as the series, so `from`/`to` narrow the totals too
+        "totals": {"orders": sum(row["orders"] for row in series), "revenue": sum(row["revenue"] for row in series)},
+        "revenue": series,
+        "services": [
+            {"serviceId": service_id, "name": name, "orders": count, "revenue": revenue}
+            for service_id, name, count, revenue in services
+        ],
+        "topCustomers": [
+            {"customerEmail": email, "orders": count, "revenue": revenue}
+            for email, count, revenue in customers.limit(top)
+        ],
+    }
+
+@admin_bp.route("/admin/api/stats", methods=["GET"])
+@admin_login_required
+def get_stats():
+    """Dashboard KPIs from the rollup tables: revenue buckets, services, top customers"""
+    args = request.args
+    period = args.get("period", "day")
+    if period not in stats.PERIODS:
+        return jsonify({"error": f"period must be one of: {', '.join(stats.PERIODS)}"}), 400
+    try:
+        top = min(int(args.get("top", 10)), 100)
+        start = end = None
+        if args.get("from"):
+            start = stats.bucket(parse_datetime(args["from"], "from").date(), period)
+        if args.get("to"):
+            end = parse_datetime(args["to"], "to").date()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    parts = [rollup_summary(period, start, end, top)]
+    if tenancy.scope() is None:
+        # the super-admin view also covers franchises sharded onto their own databases
+        for franchise in tenancy.sharded(db.engine):
+            with tenancy.acting_as(franchise):
+                parts.append(rollup_summary(period, start, end, top))
+    summary = stats.merge(parts, top) if len(parts) > 1 else parts[0]
+    return jsonify({"period": period, **summary}), 200
+
+# ---------------- BULK IMPORT / EXPORT ---------------- #
+def bulk_importer(chunk_size=bulk.BULK_CHUNK_SIZE):
+    return bulk.Importer(
+        db.session, Order.__table__, OrderItem.__table__, Customer.__table__, Service.__table__,
+        chunk_size=chunk_size,
+        franchise=tenancy.current_franchise(),
+        # usage counts are bumped with Core updates the ORM watch does not see
+        on_chunk=lambda: response_cache.invalidate(db.session, "services"),
+    )
+
+def bulk_export(kind, fmt):
+    franchise = tenancy.scope()
+    if kind == "orders":
+        return bulk.encode(
+            bulk.iter_orders(db.session, Order.__table__, OrderItem.__table__, franchise), fmt, bulk.ORDER_FIELDS
+        )
+    return bulk.encode(bulk.iter_customers(db.session, Customer.__table__, franchise), fmt, bulk.CUSTOMER_FIELDS)
+
+@admin_bp.route("/admin/api/import/<any(orders, customers):kind>", methods=["POST"])
+@admin_login_required
+def bulk_import(kind):
+    """Import a CSV or NDJSON body; each chunk of rows commits on its own"""
+    fmt = request.args.get("format") or ("csv" if request.mimetype == "text/csv" else "ndjson")
+    if fmt not in bulk.FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    stream = io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline="")
+    importer = bulk_importer()
+    records = bulk.read_records(stream, fmt)
+    summary = importer.import_orders(records) if kind == "orders" else importer.import_customers(records)
+    return jsonify(summary), 200
+
+@admin_bp.route("/admin/api/export/<any(orders, customers):kind>", methods=["GET"])
+@admin_login_required
+def bulk_export_download(kind):
+    fmt = request.args.get("format", "csv")
+    if fmt not in bulk.FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    response = Response(stream_with_context(bulk_export(kind, fmt)), mimetype=bulk.MIMETYPES[fmt])
+    response.headers["Content-Disposition"] = f"attachment; filename={kind}.{fmt}"
+    return response
+
+@admin_bp.route("/admin/api/metrics", methods=["GET"])
+@admin_login_required
+def get_metrics():
+    """Prometheus text exposition of this worker's request metrics"""
+    return current_app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# ---------------- ADMIN REACT ROUTING ---------------- #
+@admin_bp.route("/admin", defaults={"path": ""})
+@admin_bp.route("/admin/<path:path>")
+def serve_admin(path):
+    if static_assets.is_hashed_asset(request.path):
+        # public build output whose name changes with its content: no session check
+        return static_assets.manifest.send(path)
+    if admin_sessions.current() is None:
+        return redirect(url_for("admin.admin_login"))
+    if path in static_assets.manifest:
+        return static_assets.manifest.send(path, private=True)
+    return static_assets.manifest.send("index.html", private=True)
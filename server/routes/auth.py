@@ -0,0 +1,50 @@
+"""Customer signup and login."""
+from flask import Blueprint, jsonify, request
+
+from extensions import db, db_retry
+from models import Customer
+import identity
+
+auth_bp = Blueprint("auth", __name__)
+
+@auth_bp.route("/auth/signup", methods=["POST"])
+@db_retry
+def customer_signup():
+    data = request.json or {}
+    required = ["name", "email", "phone", "password"]
+    if not all(k in data for k in required):
+        return jsonify({"error": "Missing fields"}), 400
+    customer = Customer.query.filter_by(email=data["email"]).first()
+    if customer and customer.has_password:
+        return jsonify({"error": "Email exists"}), 400
+
+    # customers created through an order are claimed by signing up
+    if not customer:
+        customer = Customer(email=data["email"])
+        db.session.add(customer)
+    customer.name = data["name"]
+    customer.phone = data["phone"]
+    customer.set_password(data["password"])
+    db.session.commit()
+    identity.forget(customer)
+
+    return jsonify({"token": identity.token_for(customer), "customer": customer.to_dict()}), 201
+
+@auth_bp.route("/auth/login", methods=["POST"])
+def customer_login():
+    if not request.is_json:
+        return jsonify({"error": "Expected JSON"}), 400
+
+    data = request.get_json()
+    email = data.get("email")
+    password = data.get("password")
+    if not email or not password:
+        return jsonify({"error": "Missing fields"}), 400
+
+    customer = Customer.query.filter_by(email=email).first()
+    if not customer or not customer.check_password(password):
+        return jsonify({"error": "Invalid credentials"}), 401
+    if db.session.is_modified(customer):
+        db.session.commit()  # password was rehashed with the current parameters
+
+    return jsonify({"token": identity.token_for(customer), "customer": customer.to_dict()}), 200
@@ -0,0 +1,60 @@
+"""Helpers shared by the blueprints."""
+import os
+from functools import wraps
+
+from flask import jsonify
+
+from barcode_cache import BarcodeCache
+from barcodes import BarcodeQueue
+from extensions import db
+from models import Event
+import admin_sessions
+import events
+import fleet
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+QR_FOLDER = os.path.join(BASE_DIR, "qr")  # sharded barcode cache
+QR_MAX_AGE = 365 * 24 * 3600  # an order's barcode never changes
+
+
+def admin_login_required(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if admin_sessions.current() is None:
+            return jsonify({"error": "Unauthorized"}), 401
+        return f(*args, **kwargs)
+    return wrapper
+
+
+def super_admin_required(f):
+    """Admin endpoints that span franchises; franchise owners get a 403."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        admin = admin_sessions.current()
+        if admin is None:
+            return jsonify({"error": "Unauthorized"}), 401
+        if admin.franchise_id is not None:
+            return jsonify({"error": "Only a super admin can do this"}), 403
+        return f(*args, **kwargs)
+    return wrapper
+
+
+def set_order_address(order, data):
+    """Copy address/lat/lng from a request body; raises ValueError for bad coordinates."""
+    if "lat" in data or "lng" in data:
+        order.lat, order.lng = fleet.parse_position(data)
+    if "address" in data:
+        order.address = data["address"]
+
+
+barcode_queue = BarcodeQueue(BarcodeCache(QR_FOLDER))
+
+
+def generate_qr(order):
+    # Encode only the order ID in the barcode; rendering happens in the pool
+    return barcode_queue.submit(order.id)
+
+
+def publish(*rows):
+    """Record live events (see events.py) in the current transaction."""
+    events.record(db.session, Event.__table__, list(rows))
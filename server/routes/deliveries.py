@@ -1,38 +1,248 @@
-# server/routes/deliveries.py
-from flask import Blueprint, jsonify
-from datetime import datetime, timedelta
-
-deliveries_bp = Blueprint('deliveries', __name__, url_prefix='/api/deliveries')
-
-# Dummy delivery data
-deliveries = [
-    {
-        "id": 1,
-        "vehicleId": "TRK-101",
-        "driverName": "John Doe",
-        "status": "pending",
-        "estimatedDelivery": (datetime.now() + timedelta(hours=2)).isoformat(),
-        "actualDelivery": None
-    },
-    {
-        "id": 2,
-        "vehicleId": "TRK-102",
-        "driverName": "Jane Smith",
-        "status": "in_transit",
-        "estimatedDelivery": (datetime.now() + timedelta(hours=1)).isoformat(),
-        "actualDelivery": None
-    },
-    {
-        "id": 3,
-        "vehicleId": "TRK-103",
-        "driverName": "Mike Johnson",
-        "status": "delivered",
-        "estimatedDelivery": None,
-        "actualDelivery": (datetime.now() - timedelta(minutes=30)).isoformat()
-    }
-]
-
-@deliveries_bp.route('', methods=['GET'])
+"""Fleet, shipments, deliveries and route planning (see fleet.py and routing.py)."""
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request
+
+from extensions import db, db_retry
+from models import Delivery, Order, Shipment, Vehicle
+from routes.common import admin_login_required
+from schemas import DELIVERY_SCHEMA
+import fleet
+import response_cache
+import routing
+import serialization
+
+deliveries_bp = Blueprint("deliveries", __name__)
+
+
+@deliveries_bp.app_errorhandler(routing.Busy)
+def route_pool_busy(_e):
+    response = jsonify({"error": "Route planner busy, try again"})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
+def recompute_etas():
+    summary = fleet.recompute_etas(db.session, Delivery.__table__, Vehicle.__table__, datetime.utcnow())
+    # the batch UPDATE goes around the ORM watch
+    response_cache.invalidate(db.session, "deliveries")
+    db.session.commit()
+    return summary
+
+def list_deliveries(session):
+    args = request.args
+    query = session.query(Delivery)
+    if args.get("status"):
+        query = query.filter(Delivery.status == args["status"])
+    if args.get("vehicle"):
+        query = query.filter(Delivery.vehicle_id == args["vehicle"])
+    if args.get("shipment"):
+        query = query.filter(Delivery.shipment_id == args["shipment"])
+    try:
+        return serialization.paginate(query, DELIVERY_SCHEMA, {"created": Delivery.created_at}, "created")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+# also served as a coroutine by asgi_app.py
+@deliveries_bp.route("/api/deliveries", methods=["GET"])
+@response_cache.cached("deliveries")
 def get_deliveries():
-    return jsonify(deliveries)
+    return list_deliveries(db.session)
+
+@deliveries_bp.route("/api/deliveries/<int:delivery_id>", methods=["GET"])
+def get_delivery(delivery_id):
+    return jsonify(Delivery.query.get_or_404(delivery_id).to_dict()), 200
+
+@deliveries_bp.route("/api/shipments/<shipment_id>", methods=["GET"])
+def track_shipment(shipment_id):
+    """Track a shipment by UTI: its orders' current status and its deliveries"""
+    shipment = Shipment.query.get_or_404(shipment_id)
+    orders = Order.query.filter(Order.shipment_id == shipment.id).order_by(Order.id).all()
+    deliveries = Delivery.query.filter(Delivery.shipment_id == shipment.id).order_by(Delivery.id).all()
+    return jsonify({
+        "id": shipment.id,
+        "createdAt": shipment.created_at.isoformat(),
+        "orders": [
+            {"id": o.id, "status": o.current_status.status if o.current_status else None,
+             "location": o.current_status.location if o.current_status else None}
+            for o in orders
+        ],
+        "deliveries": [d.to_dict() for d in deliveries],
+    }), 200
+
+@deliveries_bp.route("/admin/api/shipments", methods=["POST"])
+@admin_login_required
+@db_retry
+def create_shipment():
+    """Group orders into a shipment with one delivery to `address`"""
+    data = request.json or {}
+    order_ids = data.get("orderIds") or []
+    if not isinstance(order_ids, list) or not data.get("address"):
+        return jsonify({"error": "orderIds and address are required"}), 400
+    try:
+        lat, lng = fleet.parse_position(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    vehicle = None
+    if data.get("vehicleId"):
+        vehicle = db.session.get(Vehicle, data["vehicleId"])
+        if not vehicle:
+            return jsonify({"error": "Unknown vehicle"}), 400
+
+    orders = Order.query.filter(Order.id.in_(order_ids)).all() if order_ids else []
+    missing = sorted(set(order_ids) - {o.id for o in orders})
+    if not orders or missing:
+        return jsonify({"error": "Unknown orders", "orderIds": missing}), 400
+    shipped = sorted(o.id for o in orders if o.shipment_id)
+    if shipped:
+        return jsonify({"error": "Orders already shipped", "orderIds": shipped}), 409
+
+    shipment = Shipment()
+    db.session.add(shipment)
+    db.session.flush()
+    for order in orders:
+        order.shipment_id = shipment.id
+    delivery = Delivery(
+        shipment_id=shipment.id,
+        vehicle_id=vehicle.id if vehicle else None,
+        driver_name=vehicle.driver_name if vehicle else None,
+        address=data["address"],
+        lat=lat,
+        lng=lng,
+    )
+    db.session.add(delivery)
+    db.session.commit()
+    return jsonify({"id": shipment.id, "orderIds": sorted(order_ids), "delivery": delivery.to_dict()}), 201
+
+@deliveries_bp.route("/admin/api/deliveries/<int:delivery_id>", methods=["PUT"])
+@admin_login_required
+@db_retry
+def update_delivery(delivery_id):
+    delivery = Delivery.query.get_or_404(delivery_id)
+    data = request.json or {}
+    if "vehicleId" in data:
+        vehicle = db.session.get(Vehicle, data["vehicleId"]) if data["vehicleId"] else None
+        if data["vehicleId"] and not vehicle:
+            return jsonify({"error": "Unknown vehicle"}), 400
+        delivery.vehicle_id = vehicle.id if vehicle else None
+        delivery.driver_name = vehicle.driver_name if vehicle else None
+    if "lat" in data or "lng" in data:
+        try:
+            delivery.lat, delivery.lng = fleet.parse_position(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    delivery.address = data.get("address", delivery.address)
+    if "status" in data:
+        if data["status"] not in fleet.STATUSES:
+            return jsonify({"error": f"status must be one of: {', '.join(fleet.STATUSES)}"}), 400
+        delivery.status = data["status"]
+        if delivery.status == fleet.DELIVERED:
+            delivery.actual_delivery = datetime.utcnow()
+            delivery.estimated_delivery = None
+    db.session.commit()
+    return jsonify(delivery.to_dict()), 200
+
+@deliveries_bp.route("/admin/api/deliveries/recompute-etas", methods=["POST"])
+@admin_login_required
+@db_retry
+def recompute_etas_now():
+    return jsonify(recompute_etas()), 200
+
+@deliveries_bp.route("/admin/api/vehicles", methods=["GET"])
+@admin_login_required
+def get_fleet():
+    """Fleet status: every vehicle with its count of active deliveries"""
+    counts = dict(db.session.execute(
+        db.select(Delivery.vehicle_id, db.func.count())
+        .where(Delivery.status.in_(fleet.ACTIVE), Delivery.vehicle_id.is_not(None))
+        .group_by(Delivery.vehicle_id)
+    ).all())
+    vehicles = Vehicle.query.order_by(Vehicle.id).all()
+    return jsonify([
+        {**v.to_dict(), "activeDeliveries": counts.get(v.id, 0), "idle": v.active and not counts.get(v.id)}
+        for v in vehicles
+    ]), 200
+
+@deliveries_bp.route("/admin/api/vehicles", methods=["POST"])
+@admin_login_required
+@db_retry
+def create_vehicle():
+    data = request.json or {}
+    if not data.get("id") or not data.get("driverName"):
+        return jsonify({"error": "Missing fields"}), 400
+    if db.session.get(Vehicle, data["id"]):
+        return jsonify({"error": "Vehicle exists"}), 400
+    try:
+        lat, lng = fleet.parse_position(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    vehicle = Vehicle(id=data["id"], driver_name=data["driverName"], lat=lat, lng=lng,
+                      speed_kmh=data.get("speedKmh"), active=data.get("active", True))
+    db.session.add(vehicle)
+    db.session.commit()
+    return jsonify(vehicle.to_dict()), 201
+
+@deliveries_bp.route("/admin/api/vehicles/<vehicle_id>", methods=["PUT"])
+@admin_login_required
+@db_retry
+def update_vehicle(vehicle_id):
+    """Update a vehicle, typically its position reported by the driver's device"""
+    vehicle = Vehicle.query.get_or_404(vehicle_id)
+    data = request.json or {}
+    if "lat" in data or "lng" in data:
+        try:
+            vehicle.lat, vehicle.lng = fleet.parse_position(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    vehicle.driver_name = data.get("driverName", vehicle.driver_name)
+    vehicle.speed_kmh = data.get("speedKmh", vehicle.speed_kmh)
+    vehicle.active = data.get("active", vehicle.active)
+    db.session.commit()
+    return jsonify(vehicle.to_dict()), 200
+
+def pending_stops(pickup_date=None):
+    """Unshipped orders with a geocoded address: ([ids], [(lat, lng)]), plus how many lack coordinates."""
+    query = db.select(Order.id, Order.lat, Order.lng).where(Order.shipment_id.is_(None))
+    if pickup_date:
+        query = query.where(Order.pickup_date.startswith(pickup_date))
+    ids, points, ungeocoded = [], [], 0
+    for order_id, lat, lng in db.session.execute(query.order_by(Order.id)):
+        if lat is None or lng is None:
+            ungeocoded += 1
+        else:
+            ids.append(order_id)
+            points.append((lat, lng))
+    return ids, points, ungeocoded
+
+def plan_routes(depot, pickup_date=None, max_stops=routing.ROUTE_MAX_STOPS, budget=routing.ROUTE_BUDGET):
+    """Plan routes for the pending orders; raises ValueError when there is nothing sensible to plan."""
+    if depot is None:
+        raise ValueError("depot is required (or set ROUTE_DEPOT)")
+    vehicle_ids = db.session.scalars(
+        db.select(Vehicle.id).where(Vehicle.active.is_(True)).order_by(Vehicle.id)
+    ).all()
+    if not vehicle_ids:
+        raise ValueError("No active vehicles")
+    ids, points, ungeocoded = pending_stops(pickup_date)
+    if len(ids) > routing.ROUTE_MAX_ORDERS:
+        raise ValueError(f"{len(ids)} pending orders; plan at most {routing.ROUTE_MAX_ORDERS} at a time (filter by date)")
+    db.session.close()  # do not hold a connection while the pool works
+    result = routing.plan(depot, ids, points, vehicle_ids, max_stops=max_stops, budget=budget)
+    result["ungeocoded"] = ungeocoded
+    return result
 
+@deliveries_bp.route("/admin/api/routes/plan", methods=["POST"])
+@admin_login_required
+def plan_routes_now():
+    """Optimised multi-stop routes over the fleet for the unshipped orders"""
+    data = request.json or {}
+    try:
+        if data.get("depot") and not isinstance(data["depot"], dict):
+            raise ValueError("depot must be an object with lat and lng")
+        depot = fleet.parse_position(data["depot"]) if data.get("depot") else routing.default_depot()
+        max_stops = int(data.get("maxStops", routing.ROUTE_MAX_STOPS))
+        budget = min(float(data.get("budget", routing.ROUTE_BUDGET)), routing.ROUTE_MAX_BUDGET)
+        if max_stops < 1 or budget <= 0:
+            raise ValueError("maxStops and budget must be positive")
+        return jsonify(plan_routes(depot, data.get("date"), max_stops, budget)), 200
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
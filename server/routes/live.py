@@ -0,0 +1,119 @@
+"""Live scan and order events over SSE, with a long-poll fallback (see events.py).
+
+Both endpoints need a caller: an admin session sees the events of its
+franchise (a super admin those of the franchise picked with X-Franchise-Id,
+or all of them), a customer token the events of the customer's own orders.
+"""
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import get_current_user, verify_jwt_in_request
+
+from extensions import db
+from models import Event
+import admin_sessions
+import events
+import tenancy
+
+live_bp = Blueprint("live", __name__)
+
+
+@live_bp.record_once
+def start_hub(state):
+    """One fan-out hub per app; its poller thread reads the event table in its own app context."""
+    app = state.app
+
+    def load_after(after_id, limit):
+        with app.app_context():
+            return events.load(db.session, Event.__table__, after_id, limit=limit)
+
+    def latest_id():
+        with app.app_context():
+            return db.session.scalar(db.select(db.func.max(Event.id))) or 0
+
+    app.extensions["event_hub"] = events.Hub(load_after, latest_id)
+
+
+def event_hub():
+    return current_app.extensions["event_hub"]
+
+@live_bp.app_errorhandler(events.Full)
+def event_subscribers_full(_e):
+    response = jsonify({"error": "Too many live connections, try again"})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
+def viewer_filters(filters):
+    """`filters` narrowed to the events the caller may see; None for an anonymous caller."""
+    if admin_sessions.current() is not None:
+        franchise = tenancy.scope()
+        return filters if franchise is None else {**filters, "franchise_id": franchise}
+    verify_jwt_in_request(optional=True)
+    customer = get_current_user()
+    if customer is None:
+        return None
+    # a customer's own orders, whatever they asked for
+    return {**filters, "franchise_id": customer.franchise_id, "order_email": customer.email}
+
+def stream_args():
+    """(filters, since) of an SSE request; raises ValueError on bad input"""
+    filters = events.parse_filters(request.args)
+    return filters, events.parse_cursor(request.headers.get("Last-Event-ID") or request.args.get("since"))
+
+def poll_args():
+    """(filters, since, timeout) of a long-poll request; raises ValueError on bad input"""
+    filters = events.parse_filters(request.args)
+    since = events.parse_cursor(request.args.get("since"))
+    timeout = min(float(request.args.get("timeout", events.EVENT_LONG_POLL_SECONDS)), events.EVENT_LONG_POLL_SECONDS)
+    return filters, since, max(timeout, 0)
+
+def subscribe_events(session, filters, since, threaded=True):
+    """Subscribe first, then read the backlog, so nothing committed in between is missed."""
+    subscription = event_hub().subscribe(filters, since if since is not None else float("inf"), threaded)
+    if since is None:
+        subscription.after_id = session.scalar(db.select(db.func.max(Event.id))) or 0
+        return subscription, []
+    return subscription, events.load(session, Event.__table__, since, filters, limit=events.EVENT_QUEUE)
+
+def stream_response(body):
+    response = current_app.response_class(body, mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # keep nginx from buffering the stream
+    return response
+
+def poll_response(subscription, found):
+    return jsonify({
+        "events": [event.message for event in found],
+        "next": found[-1].id if found else subscription.after_id,
+    }), 200
+
+# both handlers are also served as coroutines by asgi_app.py, which waits without holding a thread
+@live_bp.route("/api/events/stream", methods=["GET"])
+def stream_events():
+    """Server-sent events for scans and order changes; filter by order, email, worker, location, type"""
+    try:
+        filters, since = stream_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filters = viewer_filters(filters)
+    if filters is None:
+        return jsonify({"error": "Unauthorized"}), 401
+    subscription, backlog = subscribe_events(db.session, filters, since)
+    return stream_response(events.sse_stream(event_hub(), subscription, backlog))
+
+@live_bp.route("/api/events", methods=["GET"])
+def poll_events():
+    """Long-poll fallback: events after `since`, waiting up to `timeout` seconds for the first one"""
+    try:
+        filters, since, timeout = poll_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filters = viewer_filters(filters)
+    if filters is None:
+        return jsonify({"error": "Unauthorized"}), 401
+    subscription, found = subscribe_events(db.session, filters, since)
+    try:
+        if not found:
+            db.session.close()  # do not hold a connection while waiting
+            found = subscription.wait(timeout)
+    finally:
+        event_hub().unsubscribe(subscription)
+    return poll_response(subscription, found)
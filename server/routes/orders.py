@@ -0,0 +1,201 @@
+"""Customer-facing orders and the public services list."""
+import hashlib
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import current_user, jwt_required
+
+from extensions import db, db_retry
+from models import CurrentOrderStatus, Customer, Order, OrderSummary, Service
+from pagination import paginate
+from routes.common import generate_qr, publish, set_order_address
+import events
+import order_history
+import response_cache
+import stats
+import tenancy
+
+orders_bp = Blueprint("orders", __name__)
+
+@orders_bp.route("/api/orders", methods=["POST"])
+@db_retry
+def create_order_auto_customer():
+    data = request.json or {}
+    required_fields = ["customerName", "customerPhone", "customerEmail", "serviceIds", "total"]
+    if not all(field in data and data[field] for field in required_fields):
+        return jsonify({"error": "Missing fields"}), 400
+
+    if not isinstance(data["serviceIds"], list) or not data["serviceIds"]:
+        return jsonify({"error": "serviceIds must be a non-empty list"}), 400
+
+    # 1️⃣ Check if customer exists, create if not
+    customer = Customer.query.filter_by(email=data["customerEmail"]).first()
+    if not customer:
+        customer = Customer(
+            name=data["customerName"],
+            email=data["customerEmail"],
+            phone=data["customerPhone"]
+        )
+        db.session.add(customer)  # invited: no password until they sign up
+
+    # 2️⃣ Create the order
+    services = Service.query.filter(Service.id.in_(data["serviceIds"])).all()
+    if not services or len(services) != len(data["serviceIds"]):
+        return jsonify({"error": "One or more services are invalid"}), 400
+
+    total_calculated = sum(s.price for s in services)
+
+    for service in services:
+        service.usage_count += 1
+
+    order = Order(
+        customer_name=data["customerName"],
+        customer_email=data["customerEmail"],
+        customer_phone=data["customerPhone"],
+        pickup_date=data.get("pickupDate", ""),
+        special_instructions=data.get("specialInstructions", ""),
+        total=total_calculated,
+        customer=customer,
+    )
+    try:
+        set_order_address(order, data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    order.set_services(services)
+    db.session.add(order)
+    db.session.flush()  # assigns created_at for the rollup bucket
+    stats.record(db.session, added=[stats.snapshot(order)])
+    order_history.record(db.session, added=[order_history.summary(order)])
+    publish(events.order_row(events.ORDER_CREATED, order.to_dict(), order.created_at, order.franchise_id))
+    db.session.commit()
+    barcode_status = generate_qr(order)
+
+    # 3️⃣ Return both order + customer
+    order_data = order.to_dict()
+    order_data["barcodeStatus"] = barcode_status
+    order_data["barcodeUrl"] = f"/qr/{order.id}.png"
+    return jsonify({
+        "order": order_data,
+        "customer": customer.to_dict()
+    }), 201
+
+def customer_orders(session, email):
+    """A customer's order history from the read model (see order_history.py); raises ValueError for bad parameters.
+
+    The ETag comes from the customer's history version alone, so a revalidation
+    is one primary-key read. `since` returns only the orders changed after an
+    earlier `X-History-Version`, deletions as `{"id", "deleted": true}`.
+    """
+    franchise = tenancy.current_franchise()
+    version, updated_at = order_history.current_version(session, franchise, email)
+    raw_since = request.args.get("since")
+    try:
+        since = int(raw_since) if raw_since is not None else None
+    except ValueError:
+        raise ValueError("since must be an integer")
+
+    key = f"{franchise}:{email}:{version}:{request.query_string.decode()}"
+    etag = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        query = session.query(OrderSummary).filter(
+            OrderSummary.franchise_id == franchise, OrderSummary.customer_email == email
+        )
+        if since is not None:
+            query = query.filter(OrderSummary.seq > since)
+        else:
+            query = query.filter(OrderSummary.deleted.is_(False))
+        response = paginate(
+            query, {"created": OrderSummary.created_at}, "created", OrderSummary.order_id, OrderSummary.to_dict
+        )
+    response.set_etag(etag)
+    response.headers[order_history.HISTORY_VERSION_HEADER] = str(version)
+    response.vary.add(tenancy.FRANCHISE_HEADER)
+    if updated_at is not None:
+        response.last_modified = updated_at
+    response.cache_control.no_cache = True
+    return response
+
+# also served as a coroutine by asgi_app.py
+@orders_bp.route("/api/orders", methods=["GET"])
+def get_orders_by_email():
+    email = request.args.get("email")
+    if not email:
+        return jsonify({"error": "Email query param is required"}), 400
+    try:
+        return customer_orders(db.session, email)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@orders_bp.route("/api/orders/<order_id>/status", methods=["GET"])
+def get_order_status(order_id):
+    current = db.session.get(CurrentOrderStatus, order_id)
+    if current:
+        return jsonify(current.to_dict()), 200
+    if not db.session.get(Order, order_id):
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({"orderId": order_id, "status": None}), 200
+
+@orders_bp.route("/api/orders/<order_id>", methods=["PUT"])
+@jwt_required()
+@db_retry
+def update_order(order_id):
+    # the customer comes from the token (see identity.py); ownership is one primary-key read
+    order = Order.query.filter_by(id=order_id, customer_id=current_user.id).first()
+    if order is None:
+        if db.session.get(Order, order_id):
+            return jsonify({"error": "Unauthorized"}), 403
+        return jsonify({"error": "Not found"}), 404
+    before, shown = stats.snapshot(order), order_history.summary(order)
+    data = request.json or {}
+    if "pickupDate" in data:
+        order.pickup_date = data["pickupDate"]
+    if "specialInstructions" in data:
+        order.special_instructions = data["specialInstructions"]
+    try:
+        set_order_address(order, data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if "total" in data:
+        order.total = float(data["total"])
+    if "serviceId" in data:
+        service = Service.query.get(data["serviceId"])
+        if not service:
+            return jsonify({"error": "Invalid service"}), 400
+        order.set_services([service])
+        service.usage_count += 1
+    stats.record(db.session, added=[stats.snapshot(order)], removed=[before])
+    order_history.record(db.session, added=[order_history.summary(order)], removed=[shown])
+    publish(events.order_row(events.ORDER_UPDATED, order.to_dict(), datetime.utcnow(), order.franchise_id))
+    db.session.commit()
+    return jsonify(order.to_dict())
+
+@orders_bp.route("/api/orders/<order_id>", methods=["DELETE"])
+@db_retry
+def delete_order(order_id):
+    email = request.args.get("email")
+    if not email:
+        return jsonify({"error": "Email query param is required"}), 400
+
+    order = Order.query.get_or_404(order_id)
+    if order.customer_email != email:
+        return jsonify({"error": "Unauthorized (email mismatch)"}), 401
+
+    stats.record(db.session, removed=[stats.snapshot(order)])
+    order_history.record(db.session, removed=[order_history.summary(order)])
+    publish(events.order_row(
+        events.ORDER_DELETED, {"id": order.id, "customerEmail": order.customer_email}, datetime.utcnow(),
+        order.franchise_id,
+    ))
+    db.session.delete(order)
+    db.session.commit()
+    return jsonify({"message": "Deleted"}), 200
+
+
+#-------------- PUBLIC ROUTES ---------------- #
+@orders_bp.route("/api/services", methods=["GET"])
+@response_cache.cached("services")
+def get_services():
+    services = Service.query.all()
+    return jsonify([s.to_dict() for s in services]), 200
@@ -1,25 +1,27 @@
 from flask import Blueprint, request, jsonify
-from extensions import db  # import db from extensions
-from flask_sqlalchemy import SQLAlchemy
 
-users_bp = Blueprint('users', __name__)
+from extensions import db, db_retry
+from models import User
+from routes.common import admin_login_required
 
-# Example User model
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(100), unique=True, nullable=False)
+users_bp = Blueprint('users', __name__)
 
-@users_bp.route('/', methods=['GET'])
+@users_bp.route('', methods=['GET'])
+@admin_login_required
 def get_users():
-    users = User.query.all()
-    return jsonify([{"id": u.id, "name": u.name, "email": u.email} for u in users])
+    users = User.query.order_by(User.id).all()
+    return jsonify([u.to_dict() for u in users])
 
-@users_bp.route('/', methods=['POST'])
+@users_bp.route('', methods=['POST'])
+@admin_login_required
+@db_retry
 def create_user():
-    data = request.json
+    data = request.json or {}
+    if not data.get('name') or not data.get('email'):
+        return jsonify({"error": "Missing fields"}), 400
+    if User.query.filter_by(email=data['email']).first():
+        return jsonify({"error": "Email exists"}), 400
     user = User(name=data['name'], email=data['email'])
     db.session.add(user)
     db.session.commit()
-    return jsonify({"id": user.id, "name": user.name, "email": user.email}), 201
-
+    return jsonify(user.to_dict()), 201
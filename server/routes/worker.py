@@ -0,0 +1,131 @@
+"""Worker handheld endpoints: barcode images and scan uploads."""
+import os
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, request
+
+from barcode_cache import MIMETYPES
+from extensions import db, db_retry
+from models import CurrentOrderStatus, Event, Order, Track
+from routes.common import QR_MAX_AGE, barcode_queue
+import events
+import order_history
+import order_status
+import scans
+
+worker_bp = Blueprint("worker", __name__)
+
+
+def qr_target(filename):
+    """(order id, format) a barcode URL asks for, or None for an unknown format"""
+    order_id, ext = os.path.splitext(filename)
+    fmt = ext.lstrip(".")
+    if fmt not in MIMETYPES:
+        return None
+    # .png URLs hand out SVG only to clients that explicitly prefer it
+    accept = request.accept_mimetypes
+    if fmt == "png" and accept.quality(MIMETYPES["svg"]) > accept.quality(MIMETYPES["png"]):
+        fmt = "svg"
+    return order_id, fmt
+
+
+def qr_response(etag, data, fmt):
+    response = current_app.response_class(data, mimetype=MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = QR_MAX_AGE
+    response.cache_control.immutable = True
+    response.vary.add("Accept")
+    return response.make_conditional(request)
+
+
+def record_scan(session, data):
+    """Store one scan and commit; returns (body, status)"""
+    worker_id = data.get("workerId")
+    order_email = data.get("orderEmail")
+    status = data.get("orderStatus")
+    location = data.get("location")
+
+    if not all([worker_id, order_email, status]):
+        return {"error": "Missing required fields"}, 400
+
+    scan_id = data.get("scanId")
+    if scan_id:
+        existing = session.query(Track).filter_by(scan_id=scan_id).first()
+        if existing:
+            return {"message": "Scan already recorded", "track": existing.to_dict()}, 200
+
+    row = {
+        "order_id": data.get("orderId"),
+        "worker_id": worker_id,
+        "order_email": order_email,
+        "order_status": status,
+        "location": location,
+        "scanned_at": datetime.utcnow(),
+    }
+    error = order_status.resolve_orders(session, Order.__table__, [row])[0]
+    if error:
+        return {"error": error}, 400
+
+    track = Track(scan_id=scan_id, **row)
+    session.add(track)
+    order_status.apply(session, CurrentOrderStatus.__table__, [row])
+    order_history.record_scans(session, [row])
+    events.record(session, Event.__table__, [events.scan_row({**row, "scan_id": scan_id}, row["scanned_at"])])
+    session.commit()
+    return {"message": "Scan recorded", "track": track.to_dict()}, 201
+
+
+def record_scans(session, raw_scans):
+    """Store a batch of scans in one transaction and commit; returns the response body"""
+    results, rows = scans.ingest(
+        session,
+        Track.__table__,
+        raw_scans,
+        resolve=lambda rows: order_status.resolve_orders(session, Order.__table__, rows),
+    )
+    order_status.apply(session, CurrentOrderStatus.__table__, rows)
+    order_history.record_scans(session, rows)
+    now = datetime.utcnow()
+    events.record(session, Event.__table__, [events.scan_row(row, now) for row in rows])
+    session.commit()
+
+    counts = {scans.ACCEPTED: 0, scans.DUPLICATE: 0, scans.REJECTED: 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return {
+        "accepted": counts[scans.ACCEPTED],
+        "duplicates": counts[scans.DUPLICATE],
+        "rejected": counts[scans.REJECTED],
+        "results": results,
+    }
+
+
+# the handlers below are also served as coroutines by asgi_app.py, which calls the helpers above
+@worker_bp.route("/qr/<filename>")
+def serve_qr_code(filename):
+    """Serve QR code images from the barcode cache, rendering on demand on a miss"""
+    target = qr_target(filename)
+    if target is None:
+        return jsonify({"error": "Not found"}), 404
+    order_id, fmt = target
+    if not barcode_queue.cache.has(order_id, fmt) and not db.session.get(Order, order_id):
+        return jsonify({"error": "Not found"}), 404
+    etag, data = barcode_queue.fetch(order_id, fmt)
+    return qr_response(etag, data, fmt)
+
+@worker_bp.route("/worker/scan", methods=["POST"])
+@db_retry
+def worker_scan():
+    body, status = record_scan(db.session, request.json)
+    return jsonify(body), status
+
+@worker_bp.route("/worker/scans", methods=["POST"])
+@db_retry
+def worker_scan_batch():
+    """Bulk scan upload: JSON array or NDJSON, idempotent per scanId, one transaction"""
+    try:
+        raw_scans = scans.read_payload(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(record_scans(db.session, raw_scans)), 200
@@ -0,0 +1,264 @@
+"""Multi-stop route planning for pickups and deliveries.
+
+Stops are grouped into depot round trips with the Clarke-Wright savings
+heuristic, then each route is improved with 2-opt and or-opt moves until the
+time budget runs out; routes not reached by then keep their savings order.
+Savings are only considered between a stop and its `ROUTE_NEIGHBOURS`
+nearest stops, found from a numpy distance matrix computed a block of rows
+at a time, so memory stays O(n * k) and a few thousand stops plan in seconds.
+
+Planning is CPU-bound, so it runs on a small process pool (`ROUTE_WORKERS`
+processes per gunicorn worker) started from a forkserver, and API threads
+only wait on the result. Like the password pool it is bounded: when
+`ROUTE_WORKERS + ROUTE_QUEUE` plans are in flight new ones fail with `Busy`.
+"""
+import heapq
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fleet import FLEET_ROAD_FACTOR, FLEET_SPEED_KMH, FLEET_STOP_MINUTES, distance_km
+
+ROUTE_WORKERS = int(os.environ.get("ROUTE_WORKERS", "2"))
+ROUTE_QUEUE = int(os.environ.get("ROUTE_QUEUE", "4"))
+ROUTE_BUDGET = float(os.environ.get("ROUTE_BUDGET", "5"))
+ROUTE_MAX_BUDGET = float(os.environ.get("ROUTE_MAX_BUDGET", "30"))
+ROUTE_MAX_STOPS = int(os.environ.get("ROUTE_MAX_STOPS", "40"))
+ROUTE_MAX_ORDERS = int(os.environ.get("ROUTE_MAX_ORDERS", "5000"))
+ROUTE_NEIGHBOURS = int(os.environ.get("ROUTE_NEIGHBOURS", "30"))
+ROUTE_DEPOT = os.environ.get("ROUTE_DEPOT")  # "lat,lng" of the store vans leave from
+BLOCK = 1024
+# time allowed on top of the budget for pool start-up and pickling the result
+TIMEOUT_SLACK = 10.0
+
+
+class Busy(Exception):
+    """Raised when the planning pool is saturated."""
+
+
+def default_depot():
+    if not ROUTE_DEPOT:
+        return None
+    lat, lng = (float(part) for part in ROUTE_DEPOT.split(","))
+    return lat, lng
+
+
+# ---------------- SAVINGS ---------------- #
+def candidate_savings(lat, lng, from_depot, neighbours):
+    """(i, j, saving) for each stop and its nearest neighbours, best saving first."""
+    n = len(lat)
+    k = min(neighbours, n - 1)
+    pairs = []
+    for start in range(0, n, BLOCK):
+        rows = np.arange(start, min(n, start + BLOCK))
+        block = distance_km(lat[rows, None], lng[rows, None], lat[None, :], lng[None, :])
+        block[np.arange(len(rows)), rows] = np.inf
+        nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+        pairs.append((np.repeat(rows, k), nearest.ravel(), np.take_along_axis(block, nearest, axis=1).ravel()))
+    i, j, d = (np.concatenate(parts) for parts in zip(*pairs))
+    # each pair once, whichever side found it
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    _, first = np.unique(i * n + j, return_index=True)
+    i, j, d = i[first], j[first], d[first]
+    saving = from_depot[i] + from_depot[j] - d
+    order = np.argsort(-saving, kind="stable")
+    order = order[saving[order] > 0]
+    return i[order], j[order], saving[order]
+
+
+def savings_routes(n, i, j, max_stops):
+    """Merge single-stop routes end to end along the savings list."""
+    route_of = list(range(n))
+    routes = {r: [r] for r in range(n)}
+    for a, b in zip(i.tolist(), j.tolist()):
+        ra, rb = route_of[a], route_of[b]
+        if ra == rb:
+            continue
+        first, second = routes[ra], routes[rb]
+        if len(first) + len(second) > max_stops:
+            continue
+        # a and b can only be joined if each is an end of its route
+        if first[-1] != a:
+            if first[0] != a:
+                continue
+            first.reverse()
+        if second[0] != b:
+            if second[-1] != b:
+                continue
+            second.reverse()
+        first.extend(second)
+        for stop in second:
+            route_of[stop] = ra
+        del routes[rb]
+    return list(routes.values())
+
+
+# ---------------- IMPROVEMENT ---------------- #
+def tour_length(tour, dist):
+    closed = np.append(tour, tour[0])
+    return float(dist[closed[:-1], closed[1:]].sum())
+
+
+def two_opt(tour, dist, deadline):
+    """Reverse segments while that shortens the tour; tour[0] is the depot."""
+    t = np.append(np.asarray(tour), tour[0])
+    n = len(tour)
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            js = np.arange(i + 1, n)
+            delta = (dist[t[i - 1], t[js]] + dist[t[i], t[js + 1]]
+                     - dist[t[i - 1], t[i]] - dist[t[js], t[js + 1]])
+            best = int(delta.argmin())
+            if delta[best] < -1e-9:
+                j = js[best]
+                t[i:j + 1] = t[i:j + 1][::-1].copy()
+                improved = True
+    return t[:-1].tolist()
+
+
+def or_opt(tour, dist, deadline):
+    """Move runs of one to three stops to their cheapest position; one move per call."""
+    n = len(tour)
+    for size in (1, 2, 3):
+        for i in range(1, n - size + 1):
+            if time.monotonic() >= deadline:
+                return tour, False
+            first, last = tour[i], tour[i + size - 1]
+            prev, after = tour[i - 1], tour[(i + size) % n]
+            removed = dist[prev, first] + dist[last, after] - dist[prev, after]
+            rest = np.array(tour[:i] + tour[i + size:])
+            nxt = np.roll(rest, -1)
+            added = dist[rest, first] + dist[last, nxt] - dist[rest, nxt]
+            at = int(added.argmin())
+            if removed - added[at] > 1e-9:
+                rest = rest.tolist()
+                return rest[:at + 1] + tour[i:i + size] + rest[at + 1:], True
+    return tour, False
+
+
+def improve(route, lat, lng, depot, deadline):
+    """Route (stop indices) reordered by 2-opt and or-opt, and its length in km."""
+    node_lat = np.concatenate(([depot[0]], lat[route]))
+    node_lng = np.concatenate(([depot[1]], lng[route]))
+    dist = distance_km(node_lat[:, None], node_lng[:, None], node_lat[None, :], node_lng[None, :])
+    tour = list(range(len(route) + 1))
+    if len(route) > 2:
+        moved = True
+        while moved and time.monotonic() < deadline:
+            tour = two_opt(tour, dist, deadline)
+            tour, moved = or_opt(tour, dist, deadline)
+    return [route[k - 1] for k in tour[1:]], tour_length(np.asarray(tour), dist)
+
+
+def solve(depot, points, max_stops=ROUTE_MAX_STOPS, budget=ROUTE_BUDGET, neighbours=ROUTE_NEIGHBOURS):
+    """Plan depot round trips over `points` ([(lat, lng)] in degrees) within `budget` seconds.
+
+    Returns {"routes": [[point index, ...]], "distances": [km], "complete": bool}.
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    depot = np.radians(np.asarray(depot, dtype=float))
+    points = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+    lat, lng = points[:, 0], points[:, 1]
+    n = len(points)
+    if n == 0:
+        return {"routes": [], "distances": [], "complete": True, "elapsedMs": 0}
+
+    if n > 1:
+        i, j, _ = candidate_savings(lat, lng, distance_km(depot[0], depot[1], lat, lng), neighbours)
+        routes = savings_routes(n, i, j, max_stops)
+    else:
+        routes = [[0]]
+
+    # longest routes first: they have the most to gain if the budget runs out
+    routes.sort(key=len, reverse=True)
+    planned, distances = [], []
+    for route in routes:
+        route, km = improve(route, lat, lng, depot, deadline)
+        planned.append(route)
+        distances.append(km)
+    return {
+        "routes": planned,
+        "distances": distances,
+        "complete": time.monotonic() < deadline,
+        "elapsedMs": round((time.monotonic() - started) * 1000),
+    }
+
+
+# ---------------- DISPATCH ---------------- #
+def route_minutes(km, stops):
+    return km * FLEET_ROAD_FACTOR / FLEET_SPEED_KMH * 60 + stops * FLEET_STOP_MINUTES
+
+
+def assign(minutes, vehicle_ids):
+    """Spread routes over vehicles, longest first onto the least loaded: [(vehicle, trip)] per route."""
+    load = [(0.0, index, 0) for index in range(len(vehicle_ids))]
+    heapq.heapify(load)
+    assigned = [None] * len(minutes)
+    for route in sorted(range(len(minutes)), key=lambda r: -minutes[r]):
+        total, index, trips = heapq.heappop(load)
+        assigned[route] = (vehicle_ids[index], trips + 1)
+        heapq.heappush(load, (total + minutes[route], index, trips + 1))
+    return assigned
+
+
+class _PlanPool:
+    def __init__(self, workers, queue):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # a forkserver child starts clean instead of copying this worker's threads and sockets
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["routing"])
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, fn, *args, timeout):
+        if not self._slots.acquire(blocking=False):
+            raise Busy()
+        try:
+            return self._get_executor().submit(fn, *args).result(timeout=timeout)
+        finally:
+            self._slots.release()
+
+
+_pool = _PlanPool(ROUTE_WORKERS, ROUTE_QUEUE)
+
+
+def plan(depot, stop_ids, points, vehicle_ids, max_stops=ROUTE_MAX_STOPS, budget=ROUTE_BUDGET):
+    """Solve on the process pool and hand the routes out to `vehicle_ids`."""
+    result = _pool.run(solve, depot, points, max_stops, budget, timeout=budget + TIMEOUT_SLACK)
+    minutes = [route_minutes(km, len(route)) for route, km in zip(result["routes"], result["distances"])]
+    routes = [
+        {
+            "vehicleId": vehicle,
+            "trip": trip,
+            "orderIds": [stop_ids[stop] for stop in route],
+            "distanceKm": round(km, 2),
+            "durationMinutes": round(duration, 1),
+        }
+        for route, km, duration, (vehicle, trip) in zip(
+            result["routes"], result["distances"], minutes, assign(minutes, vehicle_ids)
+        )
+    ]
+    routes.sort(key=lambda r: (r["vehicleId"], r["trip"]))
+    return {
+        "routes": routes,
+        "stops": len(stop_ids),
+        "distanceKm": round(sum(result["distances"]), 2),
+        "complete": result["complete"],
+        "elapsedMs": result["elapsedMs"],
+    }
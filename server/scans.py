@@ -0,0 +1,150 @@
+"""Batch ingestion of worker scans.
+
+Handhelds upload their backlog as a JSON array (or `{"scans": [...]}`) or as
+an NDJSON stream. Every scan carries a client-generated `scanId`; re-uploading
+a scan that is already stored reports it as a duplicate instead of inserting
+it twice, so offline devices can safely resend everything they have.
+"""
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import select
+
+from db_engine import dialect_insert
+
+SCAN_BATCH_MAX = int(os.environ.get("SCAN_BATCH_MAX", "5000"))
+# stay well under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+ACCEPTED = "accepted"
+DUPLICATE = "duplicate"
+REJECTED = "rejected"
+
+
+# ---------------- PARSING ---------------- #
+def read_payload(req):
+    """Return the list of raw scan dicts from a JSON or NDJSON request body."""
+    if req.mimetype in ("application/x-ndjson", "application/jsonl"):
+        scans = []
+        for lineno, line in enumerate(req.stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                scans.append(json.loads(line))
+            except ValueError:
+                raise ValueError(f"Line {lineno} is not valid JSON")
+            if len(scans) > SCAN_BATCH_MAX:
+                break
+    else:
+        data = req.get_json(silent=True)
+        scans = data.get("scans") if isinstance(data, dict) else data
+        if not isinstance(scans, list):
+            raise ValueError("Expected a JSON array of scans")
+    if len(scans) > SCAN_BATCH_MAX:
+        raise ValueError(f"At most {SCAN_BATCH_MAX} scans per batch")
+    return scans
+
+
+def validate(raw):
+    """Return `(row, None)` for a valid scan or `(None, error)`."""
+    if not isinstance(raw, dict):
+        return None, "Scan must be an object"
+    scan_id = raw.get("scanId")
+    if not isinstance(scan_id, str) or not scan_id or len(scan_id) > 64:
+        return None, "scanId must be a non-empty string of at most 64 characters"
+    try:
+        worker_id = int(raw.get("workerId"))
+    except (TypeError, ValueError):
+        return None, "workerId must be an integer"
+    email = raw.get("orderEmail")
+    status = raw.get("orderStatus")
+    location = raw.get("location")
+    if not isinstance(email, str) or not email or len(email) > 120:
+        return None, "orderEmail is required"
+    if not isinstance(status, str) or not status or len(status) > 50:
+        return None, "orderStatus is required"
+    if location is not None and (not isinstance(location, str) or len(location) > 100):
+        return None, "location must be a string of at most 100 characters"
+    order_id = raw.get("orderId")
+    if order_id is not None and (not isinstance(order_id, str) or len(order_id) > 20):
+        return None, "orderId must be a string of at most 20 characters"
+
+    scanned_at = datetime.utcnow()
+    if raw.get("scannedAt"):
+        try:
+            scanned_at = datetime.fromisoformat(raw["scannedAt"])
+        except (TypeError, ValueError):
+            return None, "scannedAt must be an ISO datetime"
+        # devices send offset-aware times; the table stores naive UTC
+        if scanned_at.utcoffset() is not None:
+            scanned_at = (scanned_at - scanned_at.utcoffset()).replace(tzinfo=None)
+
+    return {
+        "scan_id": scan_id,
+        "order_id": order_id,
+        "worker_id": worker_id,
+        "order_email": email,
+        "order_status": status,
+        "location": location,
+        "scanned_at": scanned_at,
+    }, None
+
+
+# ---------------- INGESTION ---------------- #
+def _insert_ignoring_duplicates(session, table):
+    stmt = dialect_insert(session, table)
+    if stmt is None:
+        return table.insert()
+    return stmt.on_conflict_do_nothing(index_elements=["scan_id"])
+
+
+def ingest(session, table, raw_scans, resolve=None):
+    """Validate and bulk-insert a batch of scans in the caller's transaction.
+
+    `resolve(rows)` may fill in row fields before the insert and returns one
+    error (or None) per row; rows with an error are rejected.
+
+    Returns `(results, rows)`: one result dict per submitted scan, in order,
+    and the rows that were actually inserted.
+    """
+    results = []
+    rows = {}
+    for raw in raw_scans:
+        row, error = validate(raw)
+        scan_id = raw.get("scanId") if isinstance(raw, dict) else None
+        if error:
+            results.append({"scanId": scan_id, "status": REJECTED, "error": error})
+        elif row["scan_id"] in rows:
+            results.append({"scanId": scan_id, "status": DUPLICATE})
+        else:
+            rows[row["scan_id"]] = row
+            results.append({"scanId": scan_id, "status": ACCEPTED})
+
+    ids = list(rows)
+    existing = set()
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        chunk = ids[start:start + LOOKUP_CHUNK]
+        existing.update(session.scalars(select(table.c.scan_id).where(table.c.scan_id.in_(chunk))))
+
+    new_rows = [row for scan_id, row in rows.items() if scan_id not in existing]
+    errors = {}
+    if resolve is not None and new_rows:
+        for row, error in zip(new_rows, resolve(new_rows)):
+            if error:
+                errors[row["scan_id"]] = error
+        new_rows = [row for row in new_rows if row["scan_id"] not in errors]
+
+    for result in results:
+        if result["status"] != ACCEPTED:
+            continue
+        if result["scanId"] in existing:
+            result["status"] = DUPLICATE
+        elif result["scanId"] in errors:
+            result["status"] = REJECTED
+            result["error"] = errors[result["scanId"]]
+    if new_rows:
+        # a concurrent upload of the same scan loses the race quietly
+        session.execute(_insert_ignoring_duplicates(session, table), new_rows)
+    return results, new_rows
@@ -0,0 +1,75 @@
+"""Column-level list schemas for the admin and delivery list endpoints (see serialization.py)."""
+from extensions import db
+from models import Customer, CurrentOrderStatus, Delivery, Order, OrderItem, Service
+import passwords
+import serialization
+
+# column-level twins of the models' to_dict() methods
+def _order_services(session, ids):
+    found = {}
+    rows = session.execute(
+        db.select(OrderItem.order_id, OrderItem.service_id, OrderItem.service_name)
+        .where(OrderItem.order_id.in_(ids))
+        .order_by(OrderItem.order_id, OrderItem.position)
+    )
+    for order_id, service_id, service_name in rows:
+        service_ids, names = found.setdefault(order_id, ([], []))
+        service_ids.append(service_id)
+        names.append(service_name)
+    return found
+
+def _order_statuses(session, ids):
+    rows = session.execute(
+        db.select(CurrentOrderStatus.order_id, CurrentOrderStatus.status, CurrentOrderStatus.location)
+        .where(CurrentOrderStatus.order_id.in_(ids))
+    )
+    return {order_id: (status, location) for order_id, status, location in rows}
+
+ORDER_SCHEMA = serialization.Schema(Order.id, [
+    serialization.field("id", Order.id),
+    serialization.field("customerName", Order.customer_name),
+    serialization.field("customerEmail", Order.customer_email),
+    serialization.field("customerPhone", Order.customer_phone),
+    serialization.field("pickupDate", Order.pickup_date),
+    serialization.field("specialInstructions", Order.special_instructions),
+    serialization.field("address", Order.address),
+    serialization.field("lat", Order.lat),
+    serialization.field("lng", Order.lng),
+    serialization.field("total", Order.total),
+    serialization.field("createdAt", Order.created_at, serialization.isoformat),
+], batches=[
+    serialization.Batch(("serviceId", "service"), _order_services, ((), ())),
+    serialization.Batch(("status", "location"), _order_statuses, (None, None)),
+])
+
+CUSTOMER_SCHEMA = serialization.Schema(Customer.id, [
+    serialization.field("id", Customer.id),
+    serialization.field("name", Customer.name),
+    serialization.field("email", Customer.email),
+    serialization.field("phone", Customer.phone),
+    serialization.field("invited", (Customer.password_hash == passwords.NO_PASSWORD).label("invited"), bool),
+    serialization.field("createdAt", Customer.created_at, serialization.isoformat),
+])
+
+SERVICE_SCHEMA = serialization.Schema(Service.id, [
+    serialization.field("id", Service.id),
+    serialization.field("name", Service.name),
+    serialization.field("price", Service.price),
+    serialization.field("duration", Service.duration),
+    serialization.field("status", Service.status),
+    serialization.field("usage_count", Service.usage_count),
+])
+
+DELIVERY_SCHEMA = serialization.Schema(Delivery.id, [
+    serialization.field("id", Delivery.id),
+    serialization.field("shipmentId", Delivery.shipment_id),
+    serialization.field("vehicleId", Delivery.vehicle_id),
+    serialization.field("driverName", Delivery.driver_name),
+    serialization.field("status", Delivery.status),
+    serialization.field("address", Delivery.address),
+    serialization.field("lat", Delivery.lat),
+    serialization.field("lng", Delivery.lng),
+    serialization.field("estimatedDelivery", Delivery.estimated_delivery, serialization.isoformat),
+    serialization.field("actualDelivery", Delivery.actual_delivery, serialization.isoformat),
+    serialization.field("createdAt", Delivery.created_at, serialization.isoformat),
+])
@@ -1,22 +1,52 @@
-from app import db, Service, Customer, Order, Worker, Track, app
+"""Default and demo rows, added by `flask --app server.app init-db [--demo]`.
+
+Each step only runs on an empty table, so re-running is harmless. The caller
+commits.
+"""
+import os
 from datetime import datetime
-import uuid
 
-with app.app_context():
-    # Create tables if not exists
-    db.create_all()
+from models import AdminAccount, Customer, CurrentOrderStatus, Franchise, Order, Service, Track, Vehicle, Worker
+import order_history
+import order_status
+import stats
+import tenancy
+
+# the first super admin; more accounts come from `flask add-admin` or /admin/api/admins
+ADMIN_USER = os.environ.get("ADMIN_USER", "fabclean")
+ADMIN_PASS = os.environ.get("ADMIN_PASS", "fabzclean")
+
+
+def seed_defaults(session):
+    # ----------------- FRANCHISES ----------------- #
+    if not session.get(Franchise, tenancy.DEFAULT_FRANCHISE):
+        session.add(Franchise(id=tenancy.DEFAULT_FRANCHISE, name="Main store"))
+
+    # ----------------- ADMINS ----------------- #
+    if not AdminAccount.query.first():
+        admin = AdminAccount(username=ADMIN_USER)
+        admin.set_password(ADMIN_PASS)
+        session.add(admin)
 
     # ----------------- SERVICES ----------------- #
     if not Service.query.first():
-        services = [
+        session.add_all([
             Service(id="s1", name="Laundry", price=200, duration="24h"),
             Service(id="s2", name="Dry Cleaning", price=300, duration="48h"),
             Service(id="s3", name="Ironing", price=100, duration="12h"),
-            Service(id="s4", name="Premium Laundry", price=500, duration="24h"),
-        ]
-        db.session.add_all(services)
-        print("Seeded services!")
+        ])
+
+    # ----------------- VEHICLES ----------------- #
+    if not Vehicle.query.first():
+        session.add_all([
+            Vehicle(id="TRK-101", driver_name="John Doe"),
+            Vehicle(id="TRK-102", driver_name="Jane Smith"),
+            Vehicle(id="TRK-103", driver_name="Mike Johnson"),
+        ])
+    session.flush()
 
+
+def seed_demo(session):
     # ----------------- CUSTOMERS ---------------- #
     if not Customer.query.first():
         customers = [
@@ -27,52 +57,48 @@ with app.app_context():
         # Set default passwords
         for c in customers:
             c.set_password("password123")
-        db.session.add_all(customers)
-        print("Seeded customers!")
+        session.add_all(customers)
 
     # ----------------- WORKERS ---------------- #
     if not Worker.query.first():
-        workers = [
+        session.add_all([
             Worker(name="Bruce Banner", email="bruce@workers.com"),
             Worker(name="Clint Barton", email="clint@workers.com"),
-        ]
-        db.session.add_all(workers)
-        print("Seeded workers!")
+        ])
+    session.flush()
 
     # ----------------- ORDERS ---------------- #
     if not Order.query.first():
         first_customer = Customer.query.first()
         first_service = Service.query.first()
-        orders = [
-            Order(
-                customer_name=first_customer.name,
-                customer_email=first_customer.email,
-                customer_phone=first_customer.phone,
-                service_id=first_service.id,
-                service_name=first_service.name,
-                pickup_date="2025-09-25",
-                special_instructions="Handle with care",
-                total=first_service.price,
-            ),
-        ]
-        db.session.add_all(orders)
-        print("Seeded orders!")
+        order = Order(
+            customer_name=first_customer.name,
+            customer_email=first_customer.email,
+            customer_phone=first_customer.phone,
+            pickup_date="2025-09-25",
+            special_instructions="Handle with care",
+            total=first_service.price,
+            customer=first_customer,
+        )
+        order.set_services([first_service])
+        session.add(order)
+        session.flush()
+        stats.record(session, added=[stats.snapshot(order)])
+        order_history.record(session, added=[order_history.summary(order)])
 
     # ----------------- TRACKS ---------------- #
     if not Track.query.first():
         first_worker = Worker.query.first()
         first_order = Order.query.first()
-        tracks = [
-            Track(
-                worker_id=first_worker.id,
-                order_email=first_order.customer_email,
-                order_status="Picked Up",
-                location="Mumbai Warehouse",
-            )
-        ]
-        db.session.add_all(tracks)
-        print("Seeded tracks!")
-
-    db.session.commit()
-    print("All tables seeded successfully!")
-
+        row = {
+            "worker_id": first_worker.id,
+            "order_id": first_order.id,
+            "order_email": first_order.customer_email,
+            "order_status": "Picked Up",
+            "location": "Mumbai Warehouse",
+            "scanned_at": datetime.utcnow(),
+        }
+        session.add(Track(**row))
+        order_status.apply(session, CurrentOrderStatus.__table__, [row])
+        order_history.record_scans(session, [row])
+    session.flush()
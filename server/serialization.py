@@ -0,0 +1,182 @@
+"""Column-tuple serialization for the list endpoints.
+
+`Model.to_dict()` needs a fully hydrated ORM object (identity map, relationship
+loads) per row. A `Schema` instead names the columns each JSON field comes
+from, so a list query selects just those columns as plain tuples, and
+compiles one encoder function per field projection (`?fields=id,total`).
+Related values such as an order's services are fetched once per page by
+batch loaders keyed on the row id.
+
+`FastJSONProvider` encodes responses with orjson when it is installed and
+falls back to the standard library otherwise.
+"""
+import json
+import time
+from collections import namedtuple
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+import pagination
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+# `column` is any selectable column expression; `convert` runs on its value
+Field = namedtuple("Field", "key column convert")
+# `load(session, ids)` returns {id: tuple of values in `keys` order}
+Batch = namedtuple("Batch", "keys load default")
+
+
+def field(key, column, convert=None):
+    return Field(key, column, convert)
+
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+# ---------------- SCHEMAS ---------------- #
+class Schema:
+    def __init__(self, id_column, fields, batches=()):
+        self.id_column = id_column
+        self.fields = fields
+        self.batches = batches
+        self.keys = [f.key for f in fields] + [key for b in batches for key in b.keys]
+        self._views = {}
+
+    def project(self, raw):
+        """Field keys named by a `fields=` value, in schema order; all of them when empty."""
+        if not raw:
+            return tuple(self.keys)
+        wanted = {key.strip() for key in raw.split(",") if key.strip()}
+        unknown = wanted.difference(self.keys)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(self.keys)}")
+        return tuple(key for key in self.keys if key in wanted)
+
+    def view(self, keys, extra_columns=()):
+        cache_key = (keys, tuple(c.key for c in extra_columns))
+        view = self._views.get(cache_key)
+        if view is None:
+            view = self._views[cache_key] = View(self, keys, extra_columns)
+        return view
+
+
+class View:
+    """A compiled projection of a schema: the columns to select and the row encoder."""
+
+    def __init__(self, schema, keys, extra_columns):
+        fields = [f for f in schema.fields if f.key in keys]
+        self.batches = [b for b in schema.batches if any(key in keys for key in b.keys)]
+
+        # the id (batch lookups, cursor) and sort columns are selected even when not emitted
+        columns = [schema.id_column] + [f.column for f in fields]
+        for column in extra_columns:
+            if not any(column is c for c in columns):
+                columns.append(column)
+        self.columns = columns
+
+        namespace = {}
+        entries = []
+        for i, f in enumerate(fields, 1):
+            if f.convert is None:
+                entries.append(f"{f.key!r}: row[{i}]")
+            else:
+                namespace[f"convert_{i}"] = f.convert
+                entries.append(f"{f.key!r}: convert_{i}(row[{i}])")
+        for b, batch in enumerate(self.batches):
+            namespace[f"default_{b}"] = batch.default
+            entries.extend(
+                f"{key!r}: extra_{b}.get(row[0], default_{b})[{k}]"
+                for k, key in enumerate(batch.keys) if key in keys
+            )
+        args = ", ".join(["row"] + [f"extra_{b}" for b in range(len(self.batches))])
+        source = f"def encode({args}):\n    return {{{', '.join(entries)}}}\n"
+        exec(compile(source, f"<encoder {schema.id_column.table.name}>", "exec"), namespace)
+        self.encode = namespace["encode"]
+
+    def serialize(self, session, rows):
+        """Encode a batch of rows, running each batch loader once for the whole batch."""
+        if not self.batches:
+            return [self.encode(row) for row in rows]
+        ids = [row[0] for row in rows]
+        extras = [batch.load(session, ids) if ids else {} for batch in self.batches]
+        return [self.encode(row, *extras) for row in rows]
+
+
+def paginate(query, schema, sort_columns, default_sort):
+    """`pagination.paginate` over column tuples, honouring `?fields=`."""
+    keys = schema.project(request.args.get("fields"))
+    view = schema.view(keys, tuple(sort_columns.values()))
+    session = query.session
+    return pagination.paginate(
+        query.with_entities(*view.columns),
+        sort_columns,
+        default_sort,
+        schema.id_column,
+        serialize_rows=lambda rows: view.serialize(session, rows),
+    )
+
+
+# ---------------- JSON PROVIDER ---------------- #
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider backed by orjson.
+
+    Output matches the default provider (dates still go through its `default`
+    hook) except that keys keep the order the encoders emit them in.
+    """
+
+    sort_keys = False
+
+    def _options(self, indent=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            with metrics.phase("serialization"):
+                return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        with metrics.phase("serialization"):
+            body = orjson.dumps(obj, default=self.default, option=self._options(indent)) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+# ---------------- BENCHMARK ---------------- #
+def benchmark(cases, repeat=20):
+    """Time each `(name, fn)` case; returns `(name, best_ms, median_ms)` rows."""
+    results = []
+    for name, fn in cases:
+        fn()  # warm caches and compiled encoders
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        results.append((name, timings[0], timings[len(timings) // 2]))
+    return results
+
+
+def stdlib_dumps(obj):
+    """The encoder Flask uses by default, for comparisons."""
+    return json.dumps(obj, default=DefaultJSONProvider.default, sort_keys=True, separators=(",", ":"))
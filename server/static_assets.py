@@ -0,0 +1,154 @@
+"""The admin React build (server/reactshit), served from memory.
+
+`load` reads every file of the build once, when the app is created, so
+serving one is a dict lookup: no stat and no open per request. Vite puts a
+content hash in the names under assets/ (`index-BErcJxDH.js`); those are
+cached for a year as `immutable`. Everything else (index.html, the logo) gets
+`STATIC_MAX_AGE` and an ETag, so a deploy shows up within a minute and a
+revalidation is a 304.
+
+`flask compress-assets` writes `.br` (with the optional `brotli` package) and
+`.gz` copies next to the text files of the build. A request gets the
+smallest copy its `Accept-Encoding` allows, and `Range` requests are served
+from that copy.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from flask import abort, current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional; compress-assets then only writes .gz copies
+    brotli = None
+
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", "60"))
+ASSET_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = (".js", ".css", ".html", ".svg", ".json", ".map", ".txt")
+COMPRESS_MIN_BYTES = 1024
+
+# (Content-Encoding, file suffix), best first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# vite names build files <name>-<content hash>.<ext>, so a given URL never changes
+HASHED_ASSET = re.compile(r"^(?:/admin)?/assets/[\w.-]+-[\w-]{8}\.(?:js|css|woff2?|png|jpe?g|svg|webp)$")
+
+Asset = namedtuple("Asset", "body mimetype etag last_modified hashed variants")  # variants: {encoding: bytes}
+
+
+def is_hashed_asset(path):
+    return HASHED_ASSET.match(path) is not None
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class Manifest:
+    """Every file of a build folder with its compressed variants, keyed by path relative to the folder."""
+
+    def __init__(self, folder=None):
+        self.folder = folder
+        self.assets = {}
+        if folder is not None:
+            self.reload()
+
+    def reload(self):
+        suffixes = tuple(suffix for _, suffix in ENCODINGS)
+        assets = {}
+        for root, _dirs, files in os.walk(self.folder):
+            for name in files:
+                if name.endswith(suffixes):
+                    continue
+                path = os.path.join(root, name)
+                mtime = os.path.getmtime(path)
+                body = _read(path)
+                variants = {}
+                for encoding, suffix in ENCODINGS:
+                    # copies older than the file are left over from a previous build
+                    if os.path.exists(path + suffix) and os.path.getmtime(path + suffix) >= mtime:
+                        variants[encoding] = _read(path + suffix)
+                relative = os.path.relpath(path, self.folder).replace(os.sep, "/")
+                assets[relative] = Asset(
+                    body,
+                    mimetypes.guess_type(name)[0] or "application/octet-stream",
+                    hashlib.sha1(body).hexdigest(),
+                    datetime.fromtimestamp(int(mtime), timezone.utc),
+                    is_hashed_asset("/" + relative),
+                    variants,
+                )
+        self.assets = assets
+
+    def __contains__(self, path):
+        return path in self.assets
+
+    def send(self, path, private=False):
+        """Response for one file of the build; 404 if it is not part of it."""
+        asset = self.assets.get(path)
+        if asset is None:
+            abort(404)
+        encoding = next(
+            (e for e, _ in ENCODINGS if e in asset.variants and request.accept_encodings.quality(e) > 0), None
+        )
+        body = asset.variants[encoding] if encoding else asset.body
+
+        response = current_app.response_class(body, mimetype=asset.mimetype)
+        if encoding:
+            response.content_encoding = encoding
+        if asset.variants:
+            response.vary.add("Accept-Encoding")
+        response.set_etag(f"{asset.etag}-{encoding}" if encoding else asset.etag)
+        response.last_modified = asset.last_modified
+        response.accept_ranges = "bytes"
+        if private:
+            response.cache_control.private = True
+        else:
+            response.cache_control.public = True
+        if asset.hashed:
+            response.cache_control.max_age = ASSET_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.max_age = STATIC_MAX_AGE
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(body))
+
+
+manifest = Manifest()
+
+
+def load(folder):
+    """Read a build folder into the manifest; called once by create_app."""
+    global manifest
+    manifest = Manifest(folder)
+    return manifest
+
+
+def serve(filename):
+    """The app's `static` endpoint."""
+    return manifest.send(filename)
+
+
+def compress(folder, min_bytes=COMPRESS_MIN_BYTES):
+    """Write .gz (and .br) copies of a build's text files; returns [(path, encoding, size)] of the copies."""
+    written = []
+    for root, _dirs, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            if not name.endswith(COMPRESSIBLE) or os.path.getsize(path) < min_bytes:
+                continue
+            body = _read(path)
+            copies = [("gzip", ".gz", gzip.compress(body, 9, mtime=0))]
+            if brotli is not None:
+                copies.insert(0, ("br", ".br", brotli.compress(body, quality=11)))
+            for encoding, suffix, data in copies:
+                if len(data) >= len(body):
+                    continue
+                with open(path + suffix, "wb") as f:
+                    f.write(data)
+                written.append((path + suffix, encoding, len(data)))
+    return written
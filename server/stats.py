@@ -0,0 +1,180 @@
+"""Dashboard rollups: revenue per day/week/month, orders per service and per customer.
+
+Order writes call `record` in their own transaction with the orders they
+added and removed (an update is remove-old + add-new), so dashboard reads cost
+O(buckets) rather than O(orders). `recompute` rebuilds everything from the
+order tables. Upserts use `INSERT ... ON CONFLICT DO UPDATE`, which SQLite and
+PostgreSQL both understand. Every rollup is kept per franchise; dashboards
+that span franchises sum them (see `merge`).
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from sqlalchemy import Date, DateTime, Float, String, bindparam, text
+
+import tenancy
+
+PERIODS = ("day", "week", "month")
+
+# what an order contributes to the rollups; taken before and after each write
+OrderSnapshot = namedtuple("OrderSnapshot", "created_at email total items franchise")
+
+
+def snapshot(order):
+    return OrderSnapshot(
+        order.created_at,
+        order.customer_email,
+        order.total or 0,
+        tuple((item.service_id, item.price or 0) for item in order.items),
+        order.franchise_id or tenancy.current_franchise(),
+    )
+
+
+def bucket(day, period):
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _deltas(added, removed):
+    revenue = defaultdict(lambda: [0, 0.0])
+    services = defaultdict(lambda: [0, 0.0])
+    customers = defaultdict(lambda: [0, 0.0])
+    for sign, orders in ((1, added), (-1, removed)):
+        for order in orders:
+            day = order.created_at.date()
+            for period in PERIODS:
+                entry = revenue[(order.franchise, period, bucket(day, period))]
+                entry[0] += sign
+                entry[1] += sign * order.total
+            for service_id, price in order.items:
+                entry = services[(order.franchise, service_id)]
+                entry[0] += sign
+                entry[1] += sign * price
+            entry = customers[(order.franchise, order.email)]
+            entry[0] += sign
+            entry[1] += sign * order.total
+    return revenue, services, customers
+
+
+def _changed(deltas):
+    # an update that touches nothing counted here nets out to zero
+    return {key: value for key, value in deltas.items() if value[0] or abs(value[1]) > 1e-9}
+
+
+UPSERT_REVENUE = text(
+    "INSERT INTO revenue_rollup (franchise_id, period, bucket, order_count, revenue) "
+    "VALUES (:franchise, :period, :bucket, :count, :revenue) "
+    "ON CONFLICT (franchise_id, period, bucket) DO UPDATE SET "
+    "order_count = revenue_rollup.order_count + excluded.order_count, "
+    "revenue = revenue_rollup.revenue + excluded.revenue"
+).bindparams(bindparam("bucket", type_=Date)).execution_options(**tenancy.SHARDED)
+UPSERT_SERVICE = text(
+    "INSERT INTO service_rollup (franchise_id, service_id, order_count, revenue) "
+    "VALUES (:franchise, :key, :count, :revenue) "
+    "ON CONFLICT (franchise_id, service_id) DO UPDATE SET "
+    "order_count = service_rollup.order_count + excluded.order_count, "
+    "revenue = service_rollup.revenue + excluded.revenue"
+).execution_options(**tenancy.SHARDED)
+UPSERT_CUSTOMER = text(
+    "INSERT INTO customer_rollup (franchise_id, customer_email, order_count, revenue) "
+    "VALUES (:franchise, :key, :count, :revenue) "
+    "ON CONFLICT (franchise_id, customer_email) DO UPDATE SET "
+    "order_count = customer_rollup.order_count + excluded.order_count, "
+    "revenue = customer_rollup.revenue + excluded.revenue"
+).execution_options(**tenancy.SHARDED)
+
+
+def _revenue_params(revenue):
+    return [
+        {"franchise": franchise, "period": period, "bucket": day, "count": count, "revenue": amount}
+        for (franchise, period, day), (count, amount) in revenue.items()
+    ]
+
+
+def _keyed_params(deltas):
+    return [
+        {"franchise": franchise, "key": key, "count": count, "revenue": amount}
+        for (franchise, key), (count, amount) in deltas.items()
+    ]
+
+
+def record(session, added=(), removed=()):
+    """Apply the rollup deltas for added and removed order snapshots."""
+    revenue, services, customers = (_changed(d) for d in _deltas(added, removed))
+    if revenue:
+        session.execute(UPSERT_REVENUE, _revenue_params(revenue))
+    for stmt, deltas in ((UPSERT_SERVICE, services), (UPSERT_CUSTOMER, customers)):
+        if deltas:
+            session.execute(stmt, _keyed_params(deltas))
+
+
+def recompute(conn, batch=5000):
+    """Rebuild every rollup table from the order and order_items tables."""
+    for table in ("revenue_rollup", "service_rollup", "customer_rollup"):
+        conn.execute(text(f"DELETE FROM {table}"))
+
+    revenue = defaultdict(lambda: [0, 0.0])
+    customers = defaultdict(lambda: [0, 0.0])
+    rows = conn.execution_options(yield_per=batch).execute(
+        text(f'SELECT {tenancy.order_franchise_sql(conn)}, created_at, customer_email, total FROM "order"')
+        .columns(franchise_id=String, created_at=DateTime, customer_email=String, total=Float)
+    )
+    for franchise, created_at, email, total in rows:
+        if created_at is None:
+            continue
+        day = created_at.date()
+        for period in PERIODS:
+            entry = revenue[(franchise, period, bucket(day, period))]
+            entry[0] += 1
+            entry[1] += total or 0
+        entry = customers[(franchise, email)]
+        entry[0] += 1
+        entry[1] += total or 0
+
+    if revenue:
+        conn.execute(UPSERT_REVENUE, _revenue_params(revenue))
+    if customers:
+        conn.execute(UPSERT_CUSTOMER, _keyed_params(customers))
+    franchise = tenancy.order_franchise_sql(conn, "o")
+    conn.execute(text(
+        "INSERT INTO service_rollup (franchise_id, service_id, order_count, revenue) "
+        f"SELECT {franchise}, i.service_id, COUNT(*), COALESCE(SUM(i.price), 0) "
+        f'FROM order_items i JOIN "order" o ON o.id = i.order_id GROUP BY {franchise}, i.service_id'
+    ))
+    return len(customers)
+
+
+def merge(parts, top):
+    """Sum dashboard parts from several databases (see `routes.admin.rollup_summary`)."""
+    revenue, services, customers = defaultdict(lambda: [0, 0.0]), {}, defaultdict(lambda: [0, 0.0])
+    totals = [0, 0.0]
+    for part in parts:
+        totals[0] += part["totals"]["orders"]
+        totals[1] += part["totals"]["revenue"]
+        for row in part["revenue"]:
+            entry = revenue[row["bucket"]]
+            entry[0] += row["orders"]
+            entry[1] += row["revenue"]
+        for row in part["services"]:
+            entry = services.setdefault(row["serviceId"], dict(row, orders=0, revenue=0.0))
+            entry["orders"] += row["orders"]
+            entry["revenue"] += row["revenue"]
+        for row in part["topCustomers"]:
+            entry = customers[row["customerEmail"]]
+            entry[0] += row["orders"]
+            entry[1] += row["revenue"]
+    return {
+        "totals": {"orders": totals[0], "revenue": totals[1]},
+        "revenue": [
+            {"bucket": day, "orders": count, "revenue": amount}
+            for day, (count, amount) in sorted(revenue.items())
+        ],
+        "services": sorted(services.values(), key=lambda row: -row["orders"]),
+        "topCustomers": [
+            {"customerEmail": email, "orders": count, "revenue": amount}
+            for email, (count, amount) in sorted(customers.items(), key=lambda item: -item[1][1])[:top]
+        ],
+    }
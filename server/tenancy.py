@@ -0,0 +1,176 @@
+"""Franchise tenancy: the tenant key, request scoping and per-franchise databases.
+
+Orders, customers, services, scans, the current-status projection and the
+dashboard rollups carry a `franchise_id`. Each request picks a franchise in
+`begin_request`: a franchise owner's admin session is pinned to their own
+store, a super admin may name one with the `X-Franchise-Id` header, and so
+may customer and worker requests outside the admin API. When a
+request is scoped, every ORM query it runs gets `franchise_id = <scope>`
+added by `scope_queries` (a `do_orm_execute` hook), so handlers never filter
+by hand, and new rows are stamped with the request's franchise by the
+column default. Without the header a super-admin sees every franchise and
+everyone else sees the default one.
+
+A franchise whose `database` is set lives in its own database file. For its
+requests `Session.get_bind` sends the franchise tables (and table-less SQL
+marked with `SHARDED`) to that engine; the registry, workers, fleet and event
+tables always stay in the main database. Dashboards that span franchises run
+once per database with `acting_as` and merge the results.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import with_loader_criteria
+from sqlalchemy.sql.util import find_tables
+
+import db_engine
+
+DEFAULT_FRANCHISE = os.environ.get("DEFAULT_FRANCHISE", "main")
+FRANCHISE_HEADER = "X-Franchise-Id"
+FRANCHISE_CACHE_SECONDS = float(os.environ.get("FRANCHISE_CACHE_SECONDS", "30"))
+
+# tables every franchise shares; they are never routed to a franchise database
+GLOBAL_TABLES = frozenset({
+    "franchise", "admin_account", "admin_session", "worker", "user", "event", "vehicle", "shipment", "delivery",
+})
+
+# execution options for raw SQL on franchise tables, which get_bind cannot see into
+SHARDED = {"franchise_sharded": True}
+
+
+class UnknownFranchise(Exception):
+    """Raised when a request names a franchise that is not registered."""
+
+
+# ---------------- REQUEST SCOPE ---------------- #
+def current_franchise():
+    """The franchise new rows belong to; the column default for `franchise_id`."""
+    if has_app_context():
+        return g.get("franchise", DEFAULT_FRANCHISE)
+    return DEFAULT_FRANCHISE
+
+
+def scope():
+    """The franchise queries are restricted to, or None for every franchise."""
+    return g.get("franchise_scope") if has_app_context() else None
+
+
+def begin_request(engine, admin=None, admin_api=False):
+    """Set the request's franchise from the admin session (see admin_sessions.py) or the franchise header.
+
+    On the admin API (`admin_api`) the scope comes from the session: an owner
+    is pinned to their franchise and only a super admin may pick one with the
+    header. Customer and worker requests name their store with the header.
+    """
+    owner = admin.franchise_id if admin is not None else None
+    trusted = admin is not None or not admin_api
+    wanted = owner or (request.headers.get(FRANCHISE_HEADER) if trusted else None) or None
+    # another worker may have just added it, so a miss re-reads the registry
+    if wanted is not None and wanted not in registry(engine) and wanted not in registry(engine, refresh=True):
+        raise UnknownFranchise(wanted)
+    g.franchise = wanted or DEFAULT_FRANCHISE
+    g.franchise_scope = wanted if wanted or admin is not None else DEFAULT_FRANCHISE
+
+
+@contextmanager
+def acting_as(franchise):
+    """Run a block as if the request were scoped to `franchise` (None: unscoped, main database)."""
+    saved = g.get("franchise"), g.get("franchise_scope")
+    g.franchise, g.franchise_scope = franchise or DEFAULT_FRANCHISE, franchise
+    try:
+        yield
+    finally:
+        g.franchise, g.franchise_scope = saved
+
+
+def scope_queries(session, base):
+    """Restrict ORM selects, updates and deletes on `base` subclasses to the request's franchise."""
+    @event.listens_for(session, "do_orm_execute")
+    def restrict(state):
+        franchise = scope()
+        if franchise is None or state.is_column_load or state.is_relationship_load:
+            return
+        if state.execution_options.get("all_franchises"):
+            return
+        if state.is_select or state.is_update or state.is_delete:
+            state.statement = state.statement.options(with_loader_criteria(
+                base, lambda cls: cls.franchise_id == franchise, include_aliases=True
+            ))
+    return restrict
+
+
+def order_franchise_sql(conn, alias='"order"'):
+    """SQL for an order's franchise in raw rebuild queries.
+
+    Migrations 4 and 5 rebuild derived tables before migration 8 adds
+    `order.franchise_id`; until then every order belongs to the default franchise.
+    """
+    if any(c["name"] == "franchise_id" for c in inspect(conn).get_columns("order")):
+        return f"{alias}.franchise_id"
+    return "'" + DEFAULT_FRANCHISE.replace("'", "''") + "'"
+
+
+# ---------------- REGISTRY ---------------- #
+_lock = threading.Lock()
+_registry = {"loaded": 0.0, "databases": {}}
+_engines = {}
+
+
+def registry(engine, refresh=False):
+    """{franchise id: database URL or None}, re-read every FRANCHISE_CACHE_SECONDS."""
+    with _lock:
+        stale = time.monotonic() - _registry["loaded"] > FRANCHISE_CACHE_SECONDS
+        if refresh or stale:
+            with engine.connect() as conn:
+                _registry["databases"] = dict(conn.execute(text("SELECT id, database FROM franchise")).all())
+            _registry["loaded"] = time.monotonic()
+        return _registry["databases"]
+
+
+def forget():
+    """Drop the cached registry, e.g. after adding a franchise."""
+    with _lock:
+        _registry["loaded"] = 0.0
+
+
+def sharded(engine):
+    """Ids of the franchises that have their own database."""
+    return sorted(franchise for franchise, url in registry(engine).items() if url)
+
+
+def engine_for(url):
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = create_engine(url, **db_engine.engine_options(url))
+            db_engine.install(engine)
+            _engines[url] = engine
+        return engine
+
+
+def _franchise_data(mapper, clause):
+    if mapper is not None:
+        return inspect(mapper).local_table.name not in GLOBAL_TABLES
+    if clause is None:
+        return False
+    tables = find_tables(clause, include_crud=True)
+    if not tables:
+        return bool(clause.get_execution_options().get("franchise_sharded"))
+    return any(getattr(table, "name", None) not in GLOBAL_TABLES for table in tables)
+
+
+class TenantSession(Session):
+    """Sends franchise tables to the database of a sharded franchise's requests."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        franchise = current_franchise()
+        if bind is None and franchise != DEFAULT_FRANCHISE and _franchise_data(mapper, clause):
+            url = registry(super().get_bind()).get(franchise)
+            if url:
+                return engine_for(url)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)